@@ -0,0 +1,250 @@
+import heapq
+
+import numpy as np
+import pandas as pd
+
+TIPO_COMPRA_FRACIONARIO = 'Fracionário (1+ ações)'
+TIPO_COMPRA_PADRAO = 'Padrão (100+ ações)'
+
+MODO_ALOCACAO_ARREDONDAMENTO = 'Arredondamento'
+MODO_ALOCACAO_OTIMIZADO = 'Otimizado (sem sobra de caixa)'
+
+
+def lot_size_for(tipo_compra):
+    """Tamanho do lote de compra para a opção de 'tipo-compra-radio'."""
+    return 1 if tipo_compra == TIPO_COMPRA_FRACIONARIO else 100
+
+
+def allocate_batch(cotacao, selected_masks, total_invests, lot_sizes):
+    """
+    Alocação igualitária com arredondamento para o lote, calculada de uma vez para
+    vários cenários.
+
+    cotacao: array (n,) com as cotações das empresas.
+    selected_masks: array booleano (k, n), uma linha por cenário.
+    total_invests, lot_sizes: arrays (k,) (ou escalares) com o valor a investir e o lote.
+
+    Retorna (qtd_acoes, valor_alocado, peso_carteira), cada um com forma (k, n).
+    Reproduz exatamente o cálculo linha a linha de `calculate_allocation_for_df`:
+    round() do Python e np.round arredondam meio para o par da mesma forma. Isso inclui,
+    de propósito, o arredondamento para o lote mais próximo, que pode passar do valor a
+    investir (e.g., R$ 10 mil em duas ações de R$ 60 com lote de 100 alocam R$ 12 mil).
+    Para nunca passar do valor, use `allocate_optimal_lots` ou `rebalance_batch`.
+    (tests/test_allocation.py compara com a implementação linha a linha original.)
+    """
+    cotacao = np.asarray(cotacao, dtype=float)
+    masks = np.atleast_2d(np.asarray(selected_masks, dtype=bool))
+    k = masks.shape[0]
+    total_invests = np.broadcast_to(np.asarray(total_invests, dtype=float), (k,))
+    lot_sizes = np.broadcast_to(np.asarray(lot_sizes, dtype=float), (k,))
+
+    num_selecionadas = masks.sum(axis=1)
+    ativos = (total_invests > 0) & (num_selecionadas > 0)
+    investimento_por_empresa = np.divide(
+        total_invests, num_selecionadas, out=np.zeros(k), where=ativos
+    )
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        cotacao_valida = np.isfinite(cotacao) & (cotacao > 0)
+        compra = masks & cotacao_valida[np.newaxis, :] & ativos[:, np.newaxis]
+        ideal_shares = investimento_por_empresa[:, np.newaxis] / cotacao[np.newaxis, :]
+        lotes = lot_sizes[:, np.newaxis]
+        shares = np.round(ideal_shares / lotes) * lotes
+
+    qtd_acoes = np.where(compra, np.maximum(shares, 0.0), 0.0)
+    valor_alocado = np.where(compra, qtd_acoes * cotacao[np.newaxis, :], 0.0)
+
+    total_alocado = valor_alocado.sum(axis=1)
+    peso_carteira = np.zeros_like(valor_alocado)
+    com_alocacao = total_alocado > 0
+    peso_carteira[com_alocacao] = (valor_alocado[com_alocacao] / total_alocado[com_alocacao, np.newaxis]) * 100
+
+    return qtd_acoes, valor_alocado, peso_carteira
+
+
+def allocate_equal_weight(cotacao, selected, total_invest, lot_size):
+    """
+    Versão de um único cenário de `allocate_batch`.
+    Retorna (qtd_acoes, valor_alocado, peso_carteira), cada um com forma (n,).
+    """
+    qtd_acoes, valor_alocado, peso_carteira = allocate_batch(cotacao, selected, total_invest, lot_size)
+    return qtd_acoes[0], valor_alocado[0], peso_carteira[0]
+
+
+def rebalance_batch(cotacao, target_masks, holdings, cash, lot_sizes):
+    """
+    Rebalanceamento para pesos iguais a partir das posições atuais, calculado de uma vez
+    para várias carteiras.
+
+    cotacao: array (n,) com as cotações (NaN ou <= 0: sem cotação).
+    target_masks: array booleano (k, n) (ou (n,), a mesma seleção para todas) com as empresas alvo.
+    holdings: array (k, n) com as quantidades atuais de cada carteira.
+    cash, lot_sizes: arrays (k,) (ou escalares) com o aporte em dinheiro e o lote.
+
+    O patrimônio de cada carteira (posições com cotação + aporte) é dividido igualmente entre
+    as empresas alvo com cotação. Para cada empresa alvo, a ordem é o número de lotes que
+    deixa a posição mais perto do ideal (posições já próximas não geram ordem; uma posição
+    fora do lote não precisa ser ajustada). Empresas fora do alvo são vendidas integralmente.
+    Ao contrário de `allocate_batch`, as ordens nunca gastam mais do que o caixa disponível:
+    se o arredondamento para o lote mais próximo passar do patrimônio, a carteira usa o
+    arredondamento para baixo.
+
+    Retorna (qtd_alvo, ordem, caixa_final): quantidades finais e ordens (positivo = compra,
+    negativo = venda) com forma (k, n), e o caixa que sobra em cada carteira (k,).
+    """
+    cotacao = np.asarray(cotacao, dtype=float)
+    holdings = np.atleast_2d(np.asarray(holdings, dtype=float))
+    k = holdings.shape[0]
+    masks = np.broadcast_to(np.asarray(target_masks, dtype=bool), holdings.shape)
+    cash = np.broadcast_to(np.asarray(cash, dtype=float), (k,))
+    lot_sizes = np.broadcast_to(np.asarray(lot_sizes, dtype=float), (k,))
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        cotacao_valida = np.isfinite(cotacao) & (cotacao > 0)
+        preco = np.where(cotacao_valida, cotacao, 0.0)
+        patrimonio = holdings @ preco + cash
+
+        alvo = masks & cotacao_valida[np.newaxis, :]
+        num_alvo = alvo.sum(axis=1)
+        ativos = (patrimonio > 0) & (num_alvo > 0)
+        alvo &= ativos[:, np.newaxis]
+        por_empresa = np.divide(patrimonio, num_alvo, out=np.zeros(k), where=ativos)
+
+        ideal_shares = por_empresa[:, np.newaxis] / cotacao[np.newaxis, :]
+        lotes = lot_sizes[:, np.newaxis]
+        lotes_faltando = (ideal_shares - holdings) / lotes
+
+    def _ordens(lotes_inteiros):
+        ordem = np.where(alvo, np.maximum(lotes_inteiros * lotes, -holdings), -holdings)
+        caixa = patrimonio - ((holdings + ordem) @ preco)
+        return ordem, caixa
+
+    ordem, caixa_final = _ordens(np.round(lotes_faltando))
+    estourou = caixa_final < 0
+    if estourou.any():
+        ordem_baixo, caixa_baixo = _ordens(np.floor(lotes_faltando))
+        ordem = np.where(estourou[:, np.newaxis], ordem_baixo, ordem)
+        caixa_final = np.where(estourou, caixa_baixo, caixa_final)
+
+    # -0.0 (posição zerada sem venda) vira 0.0
+    ordem = ordem + 0.0
+    return holdings + ordem, ordem, caixa_final
+
+
+def allocate_optimal_lots(cotacao, selected, total_invest, lot_size, sectors=None, sector_cap=None):
+    """
+    Alocação em lotes inteiros que nunca passa de `total_invest` e deixa o mínimo de caixa
+    parado, mantendo os valores o mais próximos possível de pesos iguais.
+
+    1. Cada empresa selecionada recebe o valor ideal (total / número de empresas), limitado
+       pelo teto do setor quando `sector_cap` (fração do total, e.g. 0.3) é informado, e
+       compra o número de lotes arredondado para baixo: o total nunca é ultrapassado.
+    2. O caixa que sobra é distribuído lote a lote, sempre para a empresa com o menor valor
+       no meio do próximo lote (valor atual + meio lote, via heap: a compra que mais aproxima
+       os valores entre si), enquanto algum lote couber no caixa e no teto do setor. Ao
+       final, nenhum lote adicional cabe: o caixa restante é menor que o lote mais barato
+       ainda permitido.
+
+    Deixar o caixa no mínimo é um problema da mochila; a distribuição gulosa não garante a
+    menor sobra possível, mas garante a propriedade acima, sem passar do total.
+
+    `sectors` é um array (n,) com o setor de cada empresa (valores ausentes formam um grupo).
+    Retorna (qtd_acoes, valor_alocado, peso_carteira), cada um com forma (n,), como
+    `allocate_equal_weight`.
+    """
+    cotacao = np.asarray(cotacao, dtype=float)
+    n = len(cotacao)
+    with np.errstate(invalid='ignore'):
+        compra = np.asarray(selected, dtype=bool) & np.isfinite(cotacao) & (cotacao > 0)
+    qtd_acoes = np.zeros(n)
+    num_selecionadas = int(np.asarray(selected, dtype=bool).sum())
+    if total_invest <= 0 or num_selecionadas == 0 or not compra.any():
+        return qtd_acoes, np.zeros(n), np.zeros(n)
+
+    positions = np.flatnonzero(compra)
+    preco = cotacao[positions]
+    custo_lote = preco * lot_size
+    alvo = np.full(len(positions), total_invest / num_selecionadas)
+
+    setor = np.zeros(len(positions), dtype=np.int64)
+    teto_setor = None
+    if sectors is not None and sector_cap is not None:
+        setor, _ = pd.factorize(pd.Series(np.asarray(sectors, dtype=object)[positions]), use_na_sentinel=False)
+        teto_setor = np.full(setor.max() + 1, sector_cap * total_invest)
+        # Setor cujo peso igual passaria do teto: o teto é dividido entre as suas empresas
+        alvo = np.minimum(alvo, (teto_setor / np.bincount(setor))[setor])
+
+    lotes = np.floor(alvo / custo_lote)
+    valor = lotes * custo_lote
+    caixa = total_invest - valor.sum()
+    folga_setor = None if teto_setor is None else teto_setor - np.bincount(setor, weights=valor, minlength=len(teto_setor))
+
+    # Muito caixa em relação ao lote mais barato (e.g., valor alto no lote fracionário):
+    # sobe todas as empresas até um mesmo nível de uma vez, antes do heap
+    if caixa / custo_lote.min() > 4 * len(positions):
+        extra = _fill_to_level(valor, custo_lote, caixa, setor, folga_setor)
+        lotes += extra
+        valor = lotes * custo_lote
+        caixa -= (extra * custo_lote).sum()
+        if folga_setor is not None:
+            folga_setor -= np.bincount(setor, weights=extra * custo_lote, minlength=len(folga_setor))
+
+    # Listas do Python: cada passo do heap mexe em um só elemento
+    lotes_lista, valor_lista, custo_lista = lotes.tolist(), valor.tolist(), custo_lote.tolist()
+    setor_lista = setor.tolist()
+    folga_lista = None if folga_setor is None else folga_setor.tolist()
+    heap = [(v + c / 2, i) for i, (v, c) in enumerate(zip(valor_lista, custo_lista))]
+    heapq.heapify(heap)
+    while heap:
+        valor_apos, i = heapq.heappop(heap)
+        custo = custo_lista[i]
+        # O caixa e a folga do setor só diminuem: se o lote não cabe agora, não cabe mais
+        k = int((caixa + 1e-9) // custo)
+        if folga_lista is not None:
+            k = min(k, int((folga_lista[setor_lista[i]] + 1e-9) // custo))
+        if k == 0:
+            continue
+        # Compra de uma vez os lotes que mantêm a empresa como a de menor valor
+        if heap:
+            k = min(k, max(1, int((heap[0][0] - valor_lista[i]) // custo + 0.5)))
+        lotes_lista[i] += k
+        valor_lista[i] += k * custo
+        caixa -= k * custo
+        if folga_lista is not None:
+            folga_lista[setor_lista[i]] -= k * custo
+        heapq.heappush(heap, (valor_lista[i] + custo / 2, i))
+    lotes = np.array(lotes_lista)
+    valor = np.array(valor_lista)
+
+    qtd_acoes[positions] = lotes * lot_size
+    valor_alocado = np.zeros(n)
+    valor_alocado[positions] = valor
+    total_alocado = valor_alocado.sum()
+    peso_carteira = valor_alocado / total_alocado * 100 if total_alocado > 0 else np.zeros(n)
+    return qtd_acoes, valor_alocado, peso_carteira
+
+
+def _fill_to_level(valor, custo_lote, caixa, setor, folga_setor, iterations=50):
+    """
+    Lotes a comprar em cada empresa para levá-las ao maior nível de valor comum que cabe no
+    caixa (e nas folgas dos setores): cada empresa compra os lotes cujo meio fica até o
+    nível, o mesmo critério do heap. O nível é encontrado por bisseção (o custo cresce com
+    o nível).
+    """
+    def lotes_ate(level):
+        return np.maximum(np.floor((level - valor) / custo_lote + 0.5), 0.0)
+
+    def cabe(lotes):
+        gasto = lotes * custo_lote
+        if gasto.sum() > caixa:
+            return False
+        return folga_setor is None or (np.bincount(setor, weights=gasto, minlength=len(folga_setor)) <= folga_setor).all()
+
+    low, high = valor.min(), valor.max() + caixa
+    for _ in range(iterations):
+        middle = (low + high) / 2
+        if cabe(lotes_ate(middle)):
+            low = middle
+        else:
+            high = middle
+    return lotes_ate(low)
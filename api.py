@@ -0,0 +1,302 @@
+"""
+API JSON (versão 1) para ranking e alocação, servida pelo mesmo Flask do Dash.
+
+Rotas (prefixo /api/v1; `?data=AAAA-MM-DD` usa uma data do histórico):
+- GET  /versao: versão e data de execução do dataset carregado;
+- GET  /ranking?num_empresas=20&min_volume=20.000.000: as N melhores pelo ranking;
+- GET  /alocacao?num_empresas=...&min_volume=...&total_investimento=...&tipo_compra=...&tickers=A,B:
+  uma alocação;
+- POST /alocacao: várias alocações de uma vez, com o corpo
+  {"requisicoes": [{"num_empresas": 20, "min_volume": 20000000, "total_investimento": 10000,
+  "tipo_compra": "padrao", "tickers": ["PETR4", "VALE3"]}, ...]} (ou um único objeto).
+
+Em cada requisição, `tickers` (opcional) restringe a alocação a essas empresas dentre as N
+do ranking, como as caixas de seleção da tabela; os que não estão entre as N voltam em
+`tickers_ignorados`. Números em texto aceitam o padrão BR ("20.000.000", "1.234,56") e o
+ponto decimal quando não há milhares nem vírgula ("10.5"; "10.500" são dez mil e quinhentos).
+`num_empresas` vai até MAX_NUM_EMPRESAS e a soma dos `num_empresas` de um lote até
+MAX_BATCH_ROWS (acima disso, 413). Cada
+resultado traz, em `alocacao`, ticker, posição, seleção e alocação das N empresas; os dados
+das empresas (API_COLUMNS) vêm uma única vez, em `empresas`, para todo o lote.
+
+O lote é avaliado de uma vez: as N melhores são buscadas uma vez por volume mínimo distinto
+(com o maior N pedido; as demais são prefixos) e as alocações saem de allocation.allocate_batch
+sobre as empresas que aparecem em alguma requisição, em blocos de requisições cujas matrizes
+(requisições x empresas do bloco) têm no máximo MAX_CHUNK_CELLS células: a memória de um
+lote não cresce com o produto entre o número de requisições e o de empresas.
+
+As respostas têm ETag da versão do dataset + URL (e corpo, no POST): um cliente que repete
+a chamada com If-None-Match recebe, sem recálculo enquanto o dataset não mudar, 304 no GET
+e 412 no POST (o resultado que ele já tem continua valendo).
+"""
+
+import numpy as np
+from flask import Blueprint, jsonify, request
+
+from allocation import TIPO_COMPRA_FRACIONARIO, TIPO_COMPRA_PADRAO, allocate_batch, lot_size_for
+from dataset_schema import widen_float32
+from formatting import parse_number_text
+from rebalance import normalize_ticker
+
+API_PREFIX = '/api/v1'
+
+# Colunas de cada empresa nas respostas (as que existirem no dataset)
+API_COLUMNS = [
+    'ticker', 'empresa', 'setor', 'subsetor', 'cotacao', 'vol_med_2m', 'roic_clean',
+    'earnings_yield_clean', 'rank_roic', 'rank_ey', 'magic_formula_rank',
+]
+
+DEFAULT_NUM_EMPRESAS = 20
+DEFAULT_MIN_VOLUME = 0.0
+MAX_NUM_EMPRESAS = 1_000
+MAX_BATCH_ROWS = 1_000_000
+# Células (requisições x empresas) das matrizes de cada chamada a allocate_batch
+MAX_CHUNK_CELLS = 1_000_000
+
+_TIPOS_COMPRA = {
+    'fracionario': TIPO_COMPRA_FRACIONARIO,
+    'padrao': TIPO_COMPRA_PADRAO,
+    TIPO_COMPRA_FRACIONARIO: TIPO_COMPRA_FRACIONARIO,
+    TIPO_COMPRA_PADRAO: TIPO_COMPRA_PADRAO,
+}
+
+
+class ApiError(ValueError):
+    """Requisição inválida: vira uma resposta 400 (ou `status`) com a mensagem em 'erro'."""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def _number(value, field, default):
+    if value is None or value == '':
+        return default
+    if isinstance(value, bool):
+        raise ApiError(f"'{field}' deve ser um número.")
+    if isinstance(value, (int, float)):
+        number = float(value)
+    else:
+        try:
+            number = parse_number_text(value)
+        except ValueError:
+            raise ApiError(f"'{field}' deve ser um número: {value!r}.") from None
+    if not np.isfinite(number) or number < 0:
+        raise ApiError(f"'{field}' deve ser um número não negativo: {value!r}.")
+    return number
+
+
+def _tickers(value):
+    if value is None or value == '':
+        return None
+    if isinstance(value, str):
+        value = value.split(',')
+    if not isinstance(value, list) or not all(isinstance(ticker, str) for ticker in value):
+        raise ApiError("'tickers' deve ser uma lista de tickers.")
+    return [normalize_ticker(ticker) for ticker in value if ticker.strip()]
+
+
+def parse_request(item):
+    """Normaliza uma requisição (dict) de ranking/alocação; ApiError se algum campo for inválido."""
+    if not isinstance(item, dict):
+        raise ApiError("Cada requisição deve ser um objeto JSON.")
+    tipo_compra = item.get('tipo_compra') or 'fracionario'
+    if tipo_compra not in _TIPOS_COMPRA:
+        raise ApiError(f"'tipo_compra' deve ser 'fracionario' ou 'padrao': {tipo_compra!r}.")
+    num_empresas = int(_number(item.get('num_empresas'), 'num_empresas', DEFAULT_NUM_EMPRESAS))
+    if num_empresas > MAX_NUM_EMPRESAS:
+        raise ApiError(f"'num_empresas' deve ser no máximo {MAX_NUM_EMPRESAS}: {num_empresas}.")
+    return {
+        'num_empresas': num_empresas,
+        'min_volume': _number(item.get('min_volume'), 'min_volume', DEFAULT_MIN_VOLUME),
+        'total_investimento': _number(item.get('total_investimento'), 'total_investimento', 0.0),
+        'tipo_compra': _TIPOS_COMPRA[tipo_compra],
+        'tickers': _tickers(item.get('tickers')),
+    }
+
+
+def parse_batch(payload, max_batch):
+    """Lista de requisições normalizadas de um corpo {"requisicoes": [...]} (ou um único objeto)."""
+    if isinstance(payload, dict) and 'requisicoes' in payload:
+        items = payload['requisicoes']
+    elif isinstance(payload, dict):
+        items = [payload]
+    else:
+        items = payload
+    if not isinstance(items, list) or not items:
+        raise ApiError("O corpo deve ser {\"requisicoes\": [...]} com ao menos uma requisição.")
+    if len(items) > max_batch:
+        raise ApiError(f"No máximo {max_batch} requisições por chamada (recebidas {len(items)}).", status=413)
+    requests = []
+    for number, item in enumerate(items):
+        try:
+            requests.append(parse_request(item))
+        except ApiError as e:
+            raise ApiError(f"Requisição {number}: {e}", e.status) from None
+    rows = sum(req['num_empresas'] for req in requests)
+    if rows > MAX_BATCH_ROWS:
+        raise ApiError(f"No máximo {MAX_BATCH_ROWS} empresas somando todas as requisições (pedidas {rows}).", status=413)
+    return requests
+
+
+def _records(df, positions):
+    """Linhas `positions` de df como dicts com API_COLUMNS (NaN -> None)."""
+    columns = [col for col in API_COLUMNS if col in df.columns]
+    values = []
+    for col in columns:
+        column = widen_float32(df[col].iloc[positions].to_numpy())
+        values.append([None if value != value else value for value in column.tolist()])
+    return [dict(zip(columns, row)) for row in zip(*values)]
+
+
+def ranked_positions(rank_index, requests):
+    """
+    Posições (para df.iloc), na ordem do ranking, das N melhores de cada requisição. As N
+    melhores de um volume mínimo são um prefixo das N' melhores para N' > N: uma busca por
+    volume mínimo distinto, com o maior N pedido.
+    """
+    largest = {}
+    for req in requests:
+        largest[req['min_volume']] = max(largest.get(req['min_volume'], 0), req['num_empresas'])
+    top = {min_volume: rank_index.top_n(num, min_volume) for min_volume, num in largest.items()}
+    return [top[req['min_volume']][:req['num_empresas']] for req in requests]
+
+
+def _chunks(ranked, max_cells=None):
+    """
+    Intervalos [início, fim) de requisições consecutivas em que (requisições x empresas
+    distintas do bloco) não passa de `max_cells` (padrão MAX_CHUNK_CELLS; um bloco tem ao
+    menos uma requisição).
+    """
+    max_cells = max_cells or MAX_CHUNK_CELLS
+    start, union = 0, set()
+    for stop, positions in enumerate(ranked):
+        merged = union.union(positions.tolist())
+        if stop > start and (stop - start + 1) * len(merged) > max_cells:
+            yield start, stop
+            start, merged = stop, set(positions.tolist())
+        union = merged
+    if start < len(ranked):
+        yield start, len(ranked)
+
+
+def _evaluate_chunk(requests, ranked, tickers, cotacao):
+    """Resultados (ver evaluate_batch) de um bloco de requisições, com uma chamada a allocate_batch."""
+    universe, columns = np.unique(np.concatenate(ranked + [np.empty(0, dtype=np.int64)]), return_inverse=True)
+
+    # Matriz (requisições x empresas de alguma requisição do bloco) com a seleção de cada uma
+    masks = np.zeros((len(requests), len(universe)), dtype=bool)
+    ignored = [[] for _ in requests]
+    offset = 0
+    for row, (req, positions) in enumerate(zip(requests, ranked)):
+        row_columns = columns[offset:offset + len(positions)]
+        offset += len(positions)
+        if req['tickers'] is None:
+            masks[row, row_columns] = True
+            continue
+        wanted = set(req['tickers'])
+        ranked_tickers = tickers[positions]
+        masks[row, row_columns] = [ticker in wanted for ticker in ranked_tickers]
+        ignored[row] = sorted(wanted.difference(ranked_tickers))
+
+    qtd_acoes, valor_alocado, peso_carteira = allocate_batch(
+        cotacao[universe], masks,
+        np.array([req['total_investimento'] for req in requests]),
+        np.array([lot_size_for(req['tipo_compra']) for req in requests]),
+    )
+
+    results = []
+    offset = 0
+    for row, (req, positions) in enumerate(zip(requests, ranked)):
+        row_columns = columns[offset:offset + len(positions)]
+        offset += len(positions)
+        alocacao = [
+            {'ticker': ticker, 'posicao': posicao, 'selecionada': selected,
+             'qtd_acoes': qtd, 'valor_alocado': valor, 'peso_carteira': peso}
+            for posicao, (ticker, selected, qtd, valor, peso) in enumerate(zip(
+                tickers[positions].tolist(), masks[row, row_columns].tolist(), qtd_acoes[row, row_columns].tolist(),
+                valor_alocado[row, row_columns].tolist(), peso_carteira[row, row_columns].tolist()), start=1)
+        ]
+        total_alocado = float(valor_alocado[row].sum())
+        results.append({
+            'num_empresas': req['num_empresas'],
+            'min_volume': req['min_volume'],
+            'total_investimento': req['total_investimento'],
+            'tipo_compra': req['tipo_compra'],
+            'num_selecionadas': int(masks[row].sum()),
+            'total_alocado': total_alocado,
+            'nao_alocado': req['total_investimento'] - total_alocado,
+            'tickers_ignorados': ignored[row],
+            'alocacao': alocacao,
+        })
+    return results
+
+
+def evaluate_batch(df, rank_index, requests):
+    """
+    Ranking e alocação de cada requisição (ver parse_request) sobre o dataset `df` e o seu
+    RankVolumeIndex. Retorna (resultados, na ordem das requisições; empresas). Cada
+    resultado lista só ticker, posição e alocação das N empresas; os dados das empresas
+    (API_COLUMNS) vêm uma única vez em `empresas`, para todo o lote.
+    """
+    ranked = ranked_positions(rank_index, requests)
+    tickers = df['ticker'].to_numpy(dtype=object)
+    cotacao = df['cotacao'].to_numpy(dtype=float)
+    results = []
+    for start, stop in _chunks(ranked):
+        results.extend(_evaluate_chunk(requests[start:stop], ranked[start:stop], tickers, cotacao))
+    universe = np.unique(np.concatenate(ranked + [np.empty(0, dtype=np.int64)]))
+    return results, _records(df, universe)
+
+
+def create_api_blueprint(load_dataset, responses, version_of, max_batch=10_000):
+    """
+    Blueprint com as rotas da API. `load_dataset(data)` retorna (df, RankVolumeIndex,
+    versão, data_execucao) do dataset atual (data None) ou de uma data do histórico;
+    `version_of()` é a versão da requisição corrente, usada no ETag (`responses.versioned`).
+    """
+    blueprint = Blueprint('api_v1', __name__, url_prefix=API_PREFIX)
+    versioned = responses.versioned(version_of)
+
+    def envelope(version, data_execucao, **payload):
+        return jsonify(versao=version, data_execucao=None if data_execucao is None else str(data_execucao), **payload)
+
+    @blueprint.errorhandler(ApiError)
+    def api_error(error):
+        return jsonify(erro=str(error)), error.status
+
+    @blueprint.route('/versao')
+    @versioned
+    def versao():
+        _, _, version, data_execucao = load_dataset(request.args.get('data'))
+        return envelope(version, data_execucao)
+
+    @blueprint.route('/ranking')
+    @versioned
+    def ranking():
+        req = parse_request(request.args.to_dict())
+        df, rank_index, version, data_execucao = load_dataset(request.args.get('data'))
+        positions = rank_index.top_n(req['num_empresas'], req['min_volume'])
+        empresas = [{**record, 'posicao': posicao} for posicao, record in enumerate(_records(df, positions), start=1)]
+        return envelope(version, data_execucao, empresas=empresas)
+
+    @blueprint.route('/alocacao', methods=['GET'])
+    @versioned
+    def alocacao():
+        requests = [parse_request(request.args.to_dict())]
+        df, rank_index, version, data_execucao = load_dataset(request.args.get('data'))
+        results, empresas = evaluate_batch(df, rank_index, requests)
+        return envelope(version, data_execucao, empresas=empresas, **results[0])
+
+    @blueprint.route('/alocacao', methods=['POST'])
+    @versioned
+    def alocacao_lote():
+        payload = request.get_json(silent=True)
+        if payload is None:
+            raise ApiError("O corpo deve ser JSON (Content-Type: application/json).")
+        requests = parse_batch(payload, max_batch)
+        df, rank_index, version, data_execucao = load_dataset(request.args.get('data'))
+        results, empresas = evaluate_batch(df, rank_index, requests)
+        return envelope(version, data_execucao, empresas=empresas, resultados=results)
+
+    return blueprint
@@ -1,73 +1,34 @@
 import dash
+import flask
 from dash import dcc, html, dash_table
 from dash.dependencies import Input, Output, State
+import numpy as np
 import pandas as pd
 import datetime
-import io
-
-# --- Funções Auxiliares para Formatação e Leitura de Números BR ---
-def format_thousands(number):
-    """
-    Formata um número inteiro com ponto como separador de milhares.
-    Ex: 1234567 -> '1.234.567'
-    """
-    s = str(abs(int(number)))
-    parts = []
-    while s:
-        parts.append(s[-3:])
-        s = s[:-3]
-    return ('' if number >= 0 else '-') + '.'.join(reversed(parts))
-
-def format_br_float(value, decimals=2):
-    """
-    Formata um float em uma string com o padrão BR (ponto para milhares, vírgula para decimal).
-    Ex: 12345.67 -> '12.345,67'
-    """
-    if pd.isna(value) or value is None:
-        return ""
-    
-    sign = '-' if value < 0 else ''
-    abs_value = abs(value)
-
-    integer_part = int(abs_value)
-    
-    formatted_integer = format_thousands(integer_part)
-
-    if decimals > 0:
-        frac_str = f"{abs_value - integer_part:.{decimals}f}".split('.')[-1]
-        if frac_str == f"{0:0{decimals}d}":
-            frac_str = '0' * decimals
-        
-        return f"{sign}{formatted_integer},{frac_str}"
-    else:
-        return f"{sign}{formatted_integer}"
-
-def format_br_int(value):
-    """
-    Formata um número (inteiro ou float) em uma string com o padrão BR (ponto para milhares).
-    Ex: 20000000 -> '20.000.000'
-    """
-    if pd.isna(value) or value is None:
-        return ""
-    return format_thousands(int(value))
-
-def parse_br_number(text_input):
-    """
-    Converte uma string formatada no padrão BR (ponto para milhares, vírgula para decimal)
-    em um float. Retorna 0.0 se a entrada for vazia ou inválida.
-    """
-    if not isinstance(text_input, str):
-        return float(text_input) if pd.notna(text_input) else 0.0
-    if not text_input.strip():
-        return 0.0
-    cleaned_text = text_input.replace('.', '')
-    cleaned_text = cleaned_text.replace(',', '.')
-    try:
-        return float(cleaned_text)
-    except ValueError:
-        print(f"Erro de conversão: '{text_input}' não pode ser convertido para número. Retornando 0.0.")
-        return 0.0
-
+import hashlib
+import json
+import os
+import time
+
+from allocation import MODO_ALOCACAO_ARREDONDAMENTO, MODO_ALOCACAO_OTIMIZADO, allocate_equal_weight, allocate_optimal_lots, lot_size_for
+from api import create_api_blueprint
+from data_cache import DatasetCache
+from export import EXPORTERS
+from formatting import (
+    format_br_date_series,
+    format_br_float,
+    format_br_float_series,
+    format_br_int_series,
+    parse_br_number,
+)
+from history import SnapshotHistory
+from http_responses import create_response_optimizer_from_env
+from metrics import create_metrics_from_env
+from pipeline import create_pipeline_from_env
+from rank_index import RankVolumeIndex, ReRankIndex
+from rebalance import OPERACAO_COMPRA, OPERACAO_VENDA, decode_upload, orders_frame, parse_holdings, rebalance_universe
+from snapshot import SCHEMA_FILE, load_dataset, snapshot_path_for
+from table_query import apply_filter, apply_sort, page_count, page_slice
 
 # --- Mapeamento de todas as colunas possíveis e seus nomes de exibição ---
 ALL_COLUMNS_MAP = {
@@ -92,26 +53,35 @@ ALL_COLUMNS_MAP = {
     'valor_alocado': 'Valor Alocado (R$)',
     'qtd_acoes': 'Qtd. Ações',
     'peso_carteira': '% na Carteira',
+    'operacao': 'Operação',
+    'qtd_atual': 'Qtd. Atual',
+    'ordem_qtd': 'Ordem (Qtd.)',
+    'valor_ordem': 'Valor da Ordem (R$)',
     'data_execucao': 'Data Execução',
 }
 
 # --- Regras de Formatação para os nomes de exibição das colunas ---
+# Cada regra recebe a coluna inteira (pd.Series) e devolve a coluna formatada.
+# O resultado é idêntico a aplicar format_br_float/format_br_int célula a célula.
 FORMATTING_RULES = {
-    'ROIC (%)': lambda x: format_br_float(x, decimals=2),
-    'EY (%)': lambda x: format_br_float(x, decimals=2),
-    'Cotação (R$)': lambda x: f'R$ {format_br_float(x, decimals=2)}',
-    'Vol. Médio 2M (R$)': lambda x: f'R$ {format_br_int(x)}',
-    'P/L': lambda x: format_br_float(x, decimals=2),
-    'P/VP': lambda x: format_br_float(x, decimals=2),
-    'Div. Yield (%)': lambda x: f'{format_br_float(x, decimals=2)}%',
-    'LPA (R$)': lambda x: f'R$ {format_br_float(x, decimals=2)}',
-    'Ret. 30D (%)': lambda x: f'{format_br_float(x, decimals=2)}%',
-    'Ret. 12M (%)': lambda x: f'{format_br_float(x, decimals=2)}%',
-    'Margem Líquida (%)': lambda x: f'{format_br_float(x, decimals=2)}%',
-    'Valor Alocado (R$)': lambda x: f'R$ {format_br_float(x, decimals=2)}',
-    'Qtd. Ações': lambda x: format_br_int(x),
-    '% na Carteira': lambda x: f'{format_br_float(x, decimals=2)}%',
-    'Data Execução': lambda x: pd.to_datetime(x).strftime('%d/%m/%Y') if pd.notna(x) else 'N/A',
+    'ROIC (%)': lambda s: format_br_float_series(s, decimals=2),
+    'EY (%)': lambda s: format_br_float_series(s, decimals=2),
+    'Cotação (R$)': lambda s: format_br_float_series(s, decimals=2, prefix='R$ '),
+    'Vol. Médio 2M (R$)': lambda s: format_br_int_series(s, prefix='R$ '),
+    'P/L': lambda s: format_br_float_series(s, decimals=2),
+    'P/VP': lambda s: format_br_float_series(s, decimals=2),
+    'Div. Yield (%)': lambda s: format_br_float_series(s, decimals=2, suffix='%'),
+    'LPA (R$)': lambda s: format_br_float_series(s, decimals=2, prefix='R$ '),
+    'Ret. 30D (%)': lambda s: format_br_float_series(s, decimals=2, suffix='%'),
+    'Ret. 12M (%)': lambda s: format_br_float_series(s, decimals=2, suffix='%'),
+    'Margem Líquida (%)': lambda s: format_br_float_series(s, decimals=2, suffix='%'),
+    'Valor Alocado (R$)': lambda s: format_br_float_series(s, decimals=2, prefix='R$ '),
+    'Qtd. Ações': lambda s: format_br_int_series(s),
+    '% na Carteira': lambda s: format_br_float_series(s, decimals=2, suffix='%'),
+    'Qtd. Atual': lambda s: format_br_int_series(s),
+    'Ordem (Qtd.)': lambda s: format_br_int_series(s),
+    'Valor da Ordem (R$)': lambda s: format_br_float_series(s, decimals=2, prefix='R$ '),
+    'Data Execução': lambda s: format_br_date_series(s),
 }
 
 # --- Colunas selecionadas por padrão no multiselect (usando os nomes de exibição) ---
@@ -129,66 +99,375 @@ DEFAULT_SELECTED_COLUMNS_DISPLAY = [
     '% na Carteira',
 ]
 
-# --- Função para carregar dados do arquivo CSV exportado ---
-def get_magic_formula_data():
-    try:
-        df = pd.read_csv('fundamentus_data.csv') 
-        
-        if 'data_execucao' in df.columns:
-            df['data_execucao'] = pd.to_datetime(df['data_execucao'], errors='coerce') 
+# --- Valores iniciais dos controles da barra lateral (também usados no aquecimento, ver warm_up) ---
+DEFAULT_NUM_EMPRESAS = 20
+DEFAULT_MIN_VOLUME = "20.000.000"
+DEFAULT_TOTAL_INVESTIMENTO = "10.000"
+DEFAULT_TIPO_COMPRA = 'Fracionário (1+ ações)'
+DEFAULT_RERANK = []
+DEFAULT_MODO_ALOCACAO = MODO_ALOCACAO_ARREDONDAMENTO
 
-        for col in ['_30_dias', '_12_meses']:
-            if col in df.columns:
-                df[col] = pd.to_numeric(df[col], errors='coerce')
+# --- Função para carregar dados do arquivo CSV exportado ---
+DATA_FILE = 'fundamentus_data.csv'
 
-        for alloc_col in ['valor_alocado', 'qtd_acoes', 'peso_carteira']:
-            if alloc_col not in df.columns:
-                df[alloc_col] = 0.0
+def _first_data_execucao(df):
+    if 'data_execucao' in df.columns and not df.empty and pd.notna(df['data_execucao'].iloc[0]):
+        return df['data_execucao'].iloc[0]
+    return None
 
-        data_execucao_val = None
-        if 'data_execucao' in df.columns and not df.empty and pd.notna(df['data_execucao'].iloc[0]):
-            data_execucao_val = df['data_execucao'].iloc[0]
+def _read_magic_formula_data():
+    try:
+        # Usa o snapshot colunar compilado (snapshot.py) quando ele está atualizado
+        df = load_dataset(DATA_FILE)
 
-        return df, data_execucao_val
+        return df, _first_data_execucao(df)
     except Exception as e:
         print(f"Erro ao carregar dados do arquivo: {e}")
         return pd.DataFrame(), None
 
+# Cache do dataset compartilhado por todas as sessões do processo (worker).
+# O CSV só é relido quando o mtime/tamanho do arquivo muda; cada recarga é comparada com a
+# versão anterior por ticker, e o índice de ranking é reaproveitado se o ranking e o volume
+# não mudaram. Com MF_RELOAD_INTERVAL (segundos), cada worker verifica os arquivos em segundo
+# plano e troca de versão sem esperar uma requisição.
+DATASET_CACHE = DatasetCache(
+    [DATA_FILE, os.path.join(snapshot_path_for(DATA_FILE), SCHEMA_FILE)],
+    _read_magic_formula_data,
+    frame_of=lambda value: value[0],
+    watch_interval=float(os.environ.get('MF_RELOAD_INTERVAL', 0)),
+)
+
+def get_magic_formula_data():
+    df, data_execucao_val = DATASET_CACHE.get()
+    # Cópia para que os callbacks possam alterar o DataFrame sem afetar o cache
+    return df.copy(), data_execucao_val
+
+# --- Histórico de snapshots diários (ver history.py) ---
+# Cada data é carregada só quando pedida; no máximo MF_HISTORY_MAX_RESIDENT datas ficam em memória.
+HISTORY = SnapshotHistory(
+    os.environ.get('MF_HISTORY_DIR', 'history'),
+    max_resident=int(os.environ.get('MF_HISTORY_MAX_RESIDENT', 8)),
+)
+LATEST_DATA_OPTION = 'latest'
+
+def _data_date_options():
+    options = [{'label': 'Mais recente', 'value': LATEST_DATA_OPTION}]
+    for date in reversed(HISTORY.dates()):
+        options.append({'label': date.strftime('%d/%m/%Y'), 'value': date.isoformat()})
+    return options
+
+def _load_versioned_data(selected_date, version=None):
+    """
+    Retorna (df, data_execucao, versão) do dataset atual ou de uma data do histórico.
+    Com `version`, usa essa versão do dataset atual enquanto ela estiver retida no cache.
+    """
+    if selected_date and selected_date != LATEST_DATA_OPTION and selected_date in HISTORY:
+        df = HISTORY.load(selected_date)
+        return df, _first_data_execucao(df), f"hist-{selected_date}"
+    (df, data_execucao), version = DATASET_CACHE.get_versioned(version)
+    return df, data_execucao, version
+
+
+# --- DataFrames no servidor ---
+# Os dcc.Store do navegador guardam apenas referências pequenas (versão + parâmetros usados
+# no cálculo). O DataFrame bruto é lido pela versão do DATASET_CACHE/HISTORY, que cada
+# processo já mantém em memória; os derivados ficam no PIPELINE. Se um resultado tiver
+# expirado ou estiver em outro worker, é recalculado a partir dos parâmetros da referência.
+
+def _with_selection_column(df):
+    # Cópia rasa: as colunas continuam compartilhadas com o cache (e com o snapshot mapeado)
+    df_raw = df.copy(deep=False)
+    df_raw['_selected_for_allocation'] = True
+    return df_raw
+
+def _get_raw_frame(raw_ref):
+    # Montado uma vez por versão e processo, como derivado da versão no cache: não passa por
+    # um backend em disco (cada callback desserializaria o universo inteiro)
+    if raw_ref['version'].startswith('hist-') and raw_ref.get('date') in HISTORY:
+        return HISTORY.get_derived(raw_ref['date'], 'raw_frame', _with_selection_column)
+    df_raw, _ = DATASET_CACHE.get_derived(
+        'raw_frame', lambda value: _with_selection_column(value[0]), version=raw_ref['version'])
+    return df_raw
+
+def _get_rank_index(raw_ref, df_raw, index_class=RankVolumeIndex):
+    # O índice pertence à versão do dataset: é reaproveitado nas recargas que não mudam as
+    # colunas de que ele depende (index_class.COLUMNS), e sessões numa versão anterior ainda
+    # retida usam o índice dela. Se a versão da sessão já saiu do cache, monta um índice só para ela.
+    name = index_class.__name__
+    if raw_ref['version'].startswith('hist-') and raw_ref.get('date') in HISTORY:
+        rank_index = HISTORY.get_derived(raw_ref['date'], name, index_class)
+        version = raw_ref['version']
+    else:
+        rank_index, version = DATASET_CACHE.get_derived(
+            name, lambda value: index_class(value[0]) if not value[0].empty else None,
+            columns=index_class.COLUMNS, version=raw_ref['version'],
+        )
+    if rank_index is None or version != raw_ref['version'] or rank_index.size != len(df_raw):
+        rank_index = index_class(df_raw)
+    return rank_index
+
+# --- Pipeline de etapas memoizadas, compartilhado por todas as sessões (ver pipeline.py) ---
+# Universo filtrado, alocação e página formatada ficam guardados por versão do dataset +
+# parâmetros: sessões com as mesmas entradas reaproveitam o cálculo. Configure com
+# MF_PIPELINE_BACKEND (`memory` ou `disk`), MF_PIPELINE_DIR, MF_PIPELINE_MAX_ENTRIES e
+# MF_PIPELINE_TTL. Os resultados são compartilhados: copie antes de alterar.
+PIPELINE = create_pipeline_from_env()
+# Versões que saem do DATASET_CACHE numa recarga não serão mais pedidas: descarta suas etapas
+DATASET_CACHE.on_reload(lambda version, dropped: PIPELINE.invalidate(dropped))
+
+def _filtered_stage(raw_ref, num_empresas, min_volume, ranking=None):
+    def build():
+        df_raw = _get_raw_frame(raw_ref)
+        rerank_index = _get_rank_index(raw_ref, df_raw, ReRankIndex) if ranking else None
+        return filter_magic_formula_df(
+            df_raw, num_empresas, min_volume, _get_rank_index(raw_ref, df_raw), ranking, rerank_index)
+    return PIPELINE.run('filtered', raw_ref['version'], (num_empresas, min_volume, ranking), build)
+
+def _filtered_stage_for(filtered_ref):
+    return _filtered_stage(
+        filtered_ref['raw'], filtered_ref['num_empresas'], filtered_ref['min_volume'], filtered_ref.get('ranking'))
+
+def _selection_digest(selected_rows):
+    # A seleção pode ter o universo inteiro: entra na chave como hash dos ids
+    if selected_rows is None:
+        return None
+    return hashlib.sha1(np.asarray(selected_rows, dtype=np.int64).tobytes()).hexdigest()
+
+def _calculated_stage(filtered_ref, selected_rows, total_investimento, tipo_compra, holdings=None,
+                      modo_alocacao=None, teto_setor=None):
+    if holdings:
+        (df_calculated, _, _), key = _rebalance_stage(filtered_ref, selected_rows, total_investimento, tipo_compra, holdings)
+        return df_calculated, key
+
+    def build():
+        return allocate_selected_rows(
+            _get_filtered_frame(filtered_ref), selected_rows, total_investimento, tipo_compra, modo_alocacao, teto_setor)
+    # A chave do filtro já identifica versão, N, volume e filtros do ranking
+    params = (filtered_ref['key'], _selection_digest(selected_rows), total_investimento, tipo_compra)
+    if modo_alocacao == MODO_ALOCACAO_OTIMIZADO:
+        params += (modo_alocacao, teto_setor)
+    return PIPELINE.run('calculated', filtered_ref['raw']['version'], params, build)
+
+def _rebalance_stage(filtered_ref, selected_rows, aporte, tipo_compra, holdings):
+    """Rebalanceamento da carteira `holdings`; o valor é (DataFrame calculado, ordens, caixa final)."""
+    def build():
+        return rebalance_selected_rows(
+            _get_filtered_frame(filtered_ref), _get_raw_frame(filtered_ref['raw']),
+            selected_rows, aporte, tipo_compra, holdings,
+        )
+    params = (filtered_ref['key'], _selection_digest(selected_rows), aporte, tipo_compra, sorted(holdings.items()))
+    return PIPELINE.run('rebalance', filtered_ref['raw']['version'], params, build)
+
+def _calculated_stage_for(calculated_ref):
+    return _calculated_stage(
+        calculated_ref['filtered'], calculated_ref['selected_rows'],
+        calculated_ref['total_investimento'], calculated_ref['tipo_compra'], calculated_ref.get('holdings'),
+        calculated_ref.get('modo_alocacao'), calculated_ref.get('teto_setor'),
+    )
+
+def _get_filtered_frame(filtered_ref):
+    df_filtered, _ = _filtered_stage_for(filtered_ref)
+    return df_filtered.copy()
+
+def _get_calculated_frame(calculated_ref):
+    df_calculated, _ = _calculated_stage_for(calculated_ref)
+    return df_calculated.copy()
+
 
 # --- Função para calcular alocação para um dado DataFrame ---
-def calculate_allocation_for_df(df_to_calc, total_invest, tipo_compra):
+def calculate_allocation_for_df(df_to_calc, total_invest, tipo_compra, modo_alocacao=None, teto_setor=None):
     df_to_calc['cotacao'] = pd.to_numeric(df_to_calc['cotacao'], errors='coerce')
-    
-    df_to_calc['qtd_acoes'] = 0.0
-    df_to_calc['valor_alocado'] = 0.0
-    df_to_calc['peso_carteira'] = 0.0
-
-    df_selected_for_calc = df_to_calc[df_to_calc['_selected_for_allocation']].copy()
-
-    if total_invest > 0 and not df_selected_for_calc.empty:
-        num_empresas_selecionadas_para_alocacao = len(df_selected_for_calc)
-        if num_empresas_selecionadas_para_alocacao > 0:
-            investimento_por_empresa_ideal = total_invest / num_empresas_selecionadas_para_alocacao
-            lot_size = 1 if tipo_compra == 'Fracionário (1+ ações)' else 100
-
-            for index, row in df_selected_for_calc.iterrows():
-                cotacao = row['cotacao']
-                if pd.notna(cotacao) and cotacao > 0:
-                    ideal_shares = investimento_por_empresa_ideal / cotacao
-                    if tipo_compra == 'Fracionário (1+ ações)':
-                        shares_to_buy = round(ideal_shares)
-                    else:
-                        shares_to_buy = round(ideal_shares / lot_size) * lot_size
-                    if shares_to_buy < 0:
-                        shares_to_buy = 0
-                    df_to_calc.loc[index, 'qtd_acoes'] = shares_to_buy
-                    df_to_calc.loc[index, 'valor_alocado'] = shares_to_buy * cotacao
-
-            total_alocado_real = df_to_calc['valor_alocado'].sum()
-            if total_alocado_real > 0:
-                df_to_calc['peso_carteira'] = (df_to_calc['valor_alocado'] / total_alocado_real) * 100
+    cotacao = df_to_calc['cotacao'].to_numpy(dtype=float)
+    selected = df_to_calc['_selected_for_allocation'].to_numpy(dtype=bool)
+
+    if modo_alocacao == MODO_ALOCACAO_OTIMIZADO:
+        # Lotes inteiros sem passar do valor a investir e com o mínimo de caixa parado,
+        # opcionalmente com teto por setor (% do total): ver allocation.allocate_optimal_lots
+        sectors = df_to_calc['setor'].to_numpy(dtype=object) if 'setor' in df_to_calc.columns else None
+        qtd_acoes, valor_alocado, peso_carteira = allocate_optimal_lots(
+            cotacao, selected, total_invest, lot_size_for(tipo_compra),
+            sectors, teto_setor / 100 if teto_setor and sectors is not None else None,
+        )
+    else:
+        # Cálculo vetorizado (sem iterrows): ver allocation.allocate_batch
+        qtd_acoes, valor_alocado, peso_carteira = allocate_equal_weight(
+            cotacao, selected, total_invest, lot_size_for(tipo_compra))
+    df_to_calc['qtd_acoes'] = qtd_acoes
+    df_to_calc['valor_alocado'] = valor_alocado
+    df_to_calc['peso_carteira'] = peso_carteira
     return df_to_calc
 
+# --- Filtro de liquidez + ranking: as N melhores empresas pela Fórmula Mágica ---
+def ranking_params(excluded_setores=None, excluded_subsetores=None, min_roic=None, min_ey=None, recalcular=False):
+    """
+    Filtros do ranking além do volume (ou None, se nenhum estiver ativo): setores e subsetores
+    excluídos, ROIC e EY mínimos (%) e se os ranks são recalculados no universo filtrado.
+    """
+    ranking = {
+        'recalcular': bool(recalcular),
+        'setores_excluidos': sorted(excluded_setores or []),
+        'subsetores_excluidos': sorted(excluded_subsetores or []),
+        'min_roic': min_roic,
+        'min_ey': min_ey,
+    }
+    active = ranking['recalcular'] or ranking['setores_excluidos'] or ranking['subsetores_excluidos'] \
+        or min_roic is not None or min_ey is not None
+    return ranking if active else None
+
+def filter_magic_formula_df(df_raw, num_empresas, min_volume, rank_index=None, ranking=None, rerank_index=None):
+    if df_raw.empty:
+        return df_raw.copy()
+
+    # O índice devolve direto as posições das N melhores com volume >= mínimo,
+    # sem filtrar e ordenar o universo inteiro (ver rank_index.RankVolumeIndex)
+    if rank_index is None:
+        rank_index = RankVolumeIndex(df_raw)
+
+    if not ranking:
+        df_filtered = df_raw.iloc[rank_index.top_n(num_empresas, min_volume)].copy()
+    else:
+        # Filtros de setor/ROIC/EY (rank_index.ReRankIndex); com 'recalcular', os ranks de
+        # ROIC e EY e a soma passam a ser os do universo filtrado, e não os do CSV
+        if rerank_index is None:
+            rerank_index = ReRankIndex(df_raw)
+        filters = dict(
+            min_volume=min_volume,
+            excluded_setores=ranking['setores_excluidos'],
+            excluded_subsetores=ranking['subsetores_excluidos'],
+            min_roic=ranking['min_roic'],
+            min_ey=ranking['min_ey'],
+        )
+        if ranking['recalcular']:
+            positions, rank_roic, rank_ey, magic_formula_rank = rerank_index.top_n(num_empresas, **filters)
+            df_filtered = df_raw.iloc[positions].copy()
+            df_filtered['rank_roic'] = rank_roic
+            df_filtered['rank_ey'] = rank_ey
+            df_filtered['magic_formula_rank'] = magic_formula_rank
+        else:
+            mask = rerank_index.eligible(**filters)
+            df_filtered = df_raw.iloc[rank_index.top_n_masked(num_empresas, mask)].copy()
+    df_filtered.reset_index(drop=True, inplace=True)
+
+    df_filtered['_selected_for_allocation'] = True 
+    return df_filtered
+
+# --- Marca as linhas selecionadas na tabela e calcula a alocação ---
+def allocate_selected_rows(df_filtered, selected_rows_indices, total_investimento, tipo_compra,
+                           modo_alocacao=None, teto_setor=None):
+    df_filtered['_selected_for_allocation'] = False
+    if selected_rows_indices is not None:
+        df_filtered.loc[selected_rows_indices, '_selected_for_allocation'] = True
+
+    return calculate_allocation_for_df(df_filtered.copy(), total_investimento, tipo_compra, modo_alocacao, teto_setor)
+
+# --- Rebalanceamento: parte da carteira atual em vez do caixa (ver rebalance.py) ---
+def rebalance_selected_rows(df_filtered, df_raw, selected_rows_indices, aporte, tipo_compra, holdings):
+    """
+    Leva a carteira `holdings` ({ticker: qtd}) às empresas selecionadas, com pesos iguais.
+    Posições fora do ranking filtrado são buscadas em `df_raw` (cotação) e vendidas.
+    Retorna (DataFrame filtrado com a alocação alvo, ordens, caixa final): 'qtd_acoes' é a
+    quantidade após as ordens, 'qtd_atual' e 'ordem_qtd' a posição atual e a ordem.
+    """
+    df_filtered['_selected_for_allocation'] = False
+    if selected_rows_indices is not None:
+        df_filtered.loc[selected_rows_indices, '_selected_for_allocation'] = True
+    df_filtered['cotacao'] = pd.to_numeric(df_filtered['cotacao'], errors='coerce')
+
+    universe, qtd_atual, qtd_alvo, ordem, caixa_final = rebalance_universe(
+        df_filtered, df_filtered['_selected_for_allocation'].to_numpy(dtype=bool), [holdings],
+        tipo_compra, aporte, df_reference=df_raw,
+    )
+    n = len(df_filtered)
+    valor_alocado = np.where(qtd_alvo[0, :n] > 0, qtd_alvo[0, :n] * df_filtered['cotacao'].to_numpy(dtype=float), 0.0)
+    total_alocado = valor_alocado.sum()
+
+    df_filtered['qtd_acoes'] = qtd_alvo[0, :n]
+    df_filtered['valor_alocado'] = valor_alocado
+    df_filtered['peso_carteira'] = valor_alocado / total_alocado * 100 if total_alocado > 0 else 0.0
+    df_filtered['qtd_atual'] = qtd_atual[0, :n]
+    df_filtered['ordem_qtd'] = ordem[0, :n]
+
+    orders = orders_frame(universe, qtd_atual, qtd_alvo, ordem).drop(columns='carteira')
+    orders = orders.merge(universe[['ticker', 'empresa']].drop_duplicates('ticker'), on='ticker', how='left')
+    return df_filtered, orders, float(caixa_final[0])
+
+# --- Paginação, ordenação e filtro da tabela no servidor ---
+# A tabela recebe só a página visível. Cada linha leva um 'id' igual à sua posição no
+# DataFrame filtrado (a ordem do ranking), e a seleção das caixas é guardada no
+# 'selection-store' como lista desses ids, valendo para todas as páginas.
+TABLE_PAGE_SIZE = 50
+
+def _slider_marks(max_value):
+    step = 10
+    while max_value / step > 6:
+        step = step * 5 // 2 if str(step).startswith('2') else step * 2
+    return {i: str(i) for i in range(0, max_value + 1, step)}
+
+# Colunas que mudam a cada alteração de seleção, valor ou lote (o resto da tabela não muda)
+ALLOCATION_COLUMNS = ('qtd_acoes', 'valor_alocado', 'peso_carteira')
+
+def _table_formatters(columns):
+    return {col['id']: FORMATTING_RULES[col['name']] for col in columns or [] if col['name'] in FORMATTING_RULES}
+
+def format_table_columns(page_rows, columns):
+    """Valores exibidos de cada coluna ({id: lista}), formatados com FORMATTING_RULES."""
+    formatters = _table_formatters(columns)
+    return {
+        col['id']: list(formatters[col['id']](page_rows[col['id']])) if col['id'] in formatters
+        else page_rows[col['id']].tolist()
+        for col in columns or [] if col['id'] in page_rows.columns
+    }
+
+def build_table_page(df_source, columns, page_current, page_size, sort_by, filter_query):
+    """
+    Aplica filtro e ordenação sobre os valores brutos e formata só a página pedida.
+    Retorna (registros da página, total de páginas, página atual).
+    """
+    view = df_source.copy(deep=False)
+    view.insert(0, 'Nº', range(1, 1 + len(view)))
+    view['id'] = range(len(view))
+
+    formatters = _table_formatters(columns)
+    view = apply_sort(apply_filter(view, filter_query, formatters), sort_by)
+    page, page_current = page_slice(view, page_current, page_size)
+
+    values = format_table_columns(page, columns)
+    page_ids = page['id'].tolist()
+    records = [{col_id: column[i] for col_id, column in values.items()} for i in range(len(page_ids))]
+    for record, row_id in zip(records, page_ids):
+        record['id'] = row_id
+    return records, page_count(len(view), page_size), page_current
+
+def page_selected_rows(records, selection):
+    """Posições (na página) das linhas cujo id está na seleção global."""
+    selected = set(selection or [])
+    return [i for i, record in enumerate(records) if record['id'] in selected]
+
+def allocation_patch(page_data, df_calculated, columns):
+    """
+    dash.Patch com as células de alocação que mudaram nas linhas da página visível
+    (ou None, se nenhuma mudou). As demais colunas não são reenviadas.
+    """
+    allocation_columns = [col for col in columns or [] if col['id'] in ALLOCATION_COLUMNS]
+    page_rows = df_calculated.iloc[[row['id'] for row in page_data]]
+    values = format_table_columns(page_rows, allocation_columns)
+
+    patch = dash.Patch()
+    changed = False
+    for i, row in enumerate(page_data):
+        for col_id, column in values.items():
+            if row.get(col_id) != column[i]:
+                patch[i][col_id] = column[i]
+                changed = True
+    return patch if changed else None
+
+def update_selection(selection, page_data, selected_rows):
+    """Seleção global (ids) após uma mudança nas caixas da página visível."""
+    page_data = page_data or []
+    page_ids = {row['id'] for row in page_data}
+    chosen = {page_data[i]['id'] for i in selected_rows or [] if i < len(page_data)}
+    return sorted((set(selection or []) - page_ids) | chosen)
+
 # --- Inicialização do App Dash ---
 # Adicionando o link para o Font Awesome para ícones
 app = dash.Dash(__name__, external_stylesheets=[
@@ -198,12 +477,113 @@ app = dash.Dash(__name__, external_stylesheets=[
 server = app.server
 app.title = "Fórmula Mágica de Joel Greenblatt"
 
+# --- Métricas dos callbacks (MF_METRICS=1), expostas em /metrics no formato do Prometheus ---
+METRICS = create_metrics_from_env()
+METRICS.init_app(server)
+METRICS.register_collector('dataset_cache', DATASET_CACHE.stats)
+METRICS.register_collector('pipeline', PIPELINE.stats)
+METRICS.register_collector('history', HISTORY.stats)
+
+# --- Compressão (gzip/brotli) e ETag/304 das respostas (MF_COMPRESSION=0 desliga) ---
+# Registrado depois das métricas: o Flask executa os after_request na ordem inversa, então
+# as métricas contam os bytes já comprimidos.
+RESPONSES = create_response_optimizer_from_env()
+RESPONSES.init_app(server)
+METRICS.register_collector('http', RESPONSES.stats)
+
+
+# --- Exportação das ordens de compra e do universo ranqueado (CSV/XLSX em streaming) ---
+# O formulário abaixo do resumo envia a referência da alocação (a mesma do calculated-data-store)
+# por POST; o arquivo é recalculado a partir dela (em geral um acerto no PIPELINE) e gerado em
+# blocos por export.py. O universo também pode ser baixado por GET, com ETag da versão dos dados.
+EXPORT_ALLOCATION_COLUMNS = ['Nº', 'ticker', 'empresa', 'setor', 'cotacao', 'qtd_acoes', 'valor_alocado', 'peso_carteira']
+# Com carteira atual (rebalanceamento), o arquivo traz as ordens de compra e venda
+REBALANCE_ORDER_COLUMNS = ['ticker', 'empresa', 'operacao', 'qtd_atual', 'qtd_acoes', 'ordem_qtd', 'cotacao', 'valor_ordem']
+
+def _export_response(kind, fmt, df, columns, br_format):
+    exporter, mimetype = EXPORTERS[fmt]
+    headers = [ALL_COLUMNS_MAP.get(col_id, col_id) for col_id in columns]
+    formatters = None
+    if br_format:
+        formatters = {col_id: FORMATTING_RULES[name] for col_id, name in zip(columns, headers) if name in FORMATTING_RULES}
+    filename = f"formula_magica_{kind}_{datetime.date.today():%Y%m%d}.{fmt}"
+    return flask.Response(
+        exporter(df, columns, headers, formatters), mimetype=mimetype,
+        headers={'Content-Disposition': f'attachment; filename="{filename}"'},
+    )
+
+def _universe_export_frame(df_raw):
+    df = df_raw.copy(deep=False)
+    df.insert(0, 'Nº', range(1, 1 + len(df)))
+    columns = ['Nº'] + [col_id for col_id in ALL_COLUMNS_MAP
+                        if col_id in df.columns and col_id not in ALLOCATION_COLUMNS]
+    return df, columns
+
+def _allocation_export_frame(calculated_ref):
+    if calculated_ref.get('holdings'):
+        orders = _rebalance_stage(
+            calculated_ref['filtered'], calculated_ref['selected_rows'],
+            calculated_ref['total_investimento'], calculated_ref['tipo_compra'], calculated_ref['holdings'],
+        )[0][1]
+        return orders, REBALANCE_ORDER_COLUMNS
+    df = _calculated_stage_for(calculated_ref)[0]
+    # 'Nº' é a posição no ranking filtrado, como na tabela
+    df = df.assign(**{'Nº': range(1, 1 + len(df))})[df['_selected_for_allocation'].to_numpy(dtype=bool)]
+    return df, [col_id for col_id in EXPORT_ALLOCATION_COLUMNS if col_id in df.columns]
+
+def export_view(kind, fmt):
+    if fmt not in EXPORTERS or kind not in ('alocacao', 'universo'):
+        flask.abort(404)
+    try:
+        calculated_ref = json.loads(flask.request.form.get('ref') or 'null')
+    except ValueError:
+        calculated_ref = None
+    if not calculated_ref or not calculated_ref.get('key'):
+        flask.abort(400, "Nenhuma alocação calculada para exportar.")
+
+    br_format = flask.request.args.get('br') == '1'
+    if kind == 'universo':
+        df, columns = _universe_export_frame(_get_raw_frame(calculated_ref['filtered']['raw']))
+    else:
+        df, columns = _allocation_export_frame(calculated_ref)
+    return _export_response(kind, fmt, df, columns, br_format)
+
+def _universe_version():
+    selected_date = flask.request.args.get('data')
+    if selected_date and selected_date in HISTORY:
+        return f"hist-{selected_date}"
+    return DATASET_CACHE.version
+
+@RESPONSES.versioned(_universe_version)
+def export_universe_view(fmt):
+    if fmt not in EXPORTERS:
+        flask.abort(404)
+    df_raw, _, _ = _load_versioned_data(flask.request.args.get('data'))
+    df, columns = _universe_export_frame(df_raw)
+    return _export_response('universo', fmt, df, columns, flask.request.args.get('br') == '1')
+
+server.add_url_rule('/export/<kind>.<fmt>', 'export', export_view, methods=['POST'])
+server.add_url_rule('/export/universo.<fmt>', 'export_universe', export_universe_view, methods=['GET'])
+
+
+# --- API JSON de ranking e alocação em lote (/api/v1, ver api.py) ---
+# Calcula direto do dataset residente e do índice de ranking (sem PIPELINE nem sessão);
+# as respostas têm ETag da versão dos dados. MF_API_MAX_BATCH limita as requisições por chamada.
+def _api_dataset(selected_date):
+    df_raw, data_execucao, version = _load_versioned_data(selected_date)
+    return df_raw, _get_rank_index({'version': version, 'date': selected_date}, df_raw), version, data_execucao
+
+server.register_blueprint(create_api_blueprint(
+    _api_dataset, RESPONSES, _universe_version, max_batch=int(os.environ.get('MF_API_MAX_BATCH', 10_000))))
+
 
 # --- Layout do Dashboard ---
 app.layout = html.Div([
     dcc.Store(id='raw-data-store'),
     dcc.Store(id='filtered-data-store'),
     dcc.Store(id='calculated-data-store'),
+    dcc.Store(id='selection-store'),
+    dcc.Store(id='holdings-store'),
     dcc.Store(id='sidebar-status-store', data=True),
 
     html.Div(id='fixed-header-container', children=[
@@ -222,12 +602,23 @@ app.layout = html.Div([
     html.Div(className='main-content-wrapper', children=[
         html.Div(id='sidebar', children=[
             html.H3("Configurações do Ranking"),
+            html.Div([
+                html.P("Data dos dados:", className='sidebar-label'),
+                dcc.Dropdown(
+                    id='data-execucao-dropdown',
+                    options=[{'label': 'Mais recente', 'value': LATEST_DATA_OPTION}],
+                    value=LATEST_DATA_OPTION,
+                    clearable=False,
+                    className='dash-dropdown-custom'
+                )
+            ]),
             html.Div([
                 html.P("Número de empresas a exibir e pré-selecionar:", className='sidebar-label'),
                 dcc.Slider(
                     id='num-empresas-slider',
-                    min=1, max=50, step=1, value=20,
+                    min=1, max=50, step=1, value=DEFAULT_NUM_EMPRESAS,
                     marks={i: str(i) for i in range(0, 51, 10)},
+                    tooltip={'placement': 'bottom'},
                     className='dash-slider-custom'
                 )
             ]),
@@ -236,11 +627,60 @@ app.layout = html.Div([
                 dcc.Input(
                     id='min-volume-input',
                     type='text',
-                    value="20.000.000", # Definindo valor inicial como string formatada
+                    value=DEFAULT_MIN_VOLUME, # Definindo valor inicial como string formatada
                     className='dash-input-custom',
                     placeholder="Ex: 20.000.000"
                 )
             ]),
+            html.Div([
+                html.P("Setores excluídos:", className='sidebar-label'),
+                dcc.Dropdown(
+                    id='excluded-setores-dropdown',
+                    options=[],
+                    value=[],
+                    multi=True,
+                    placeholder="Ex: bancos, energia elétrica",
+                    className='dash-dropdown-custom'
+                )
+            ]),
+            html.Div([
+                html.P("Subsetores excluídos:", className='sidebar-label'),
+                dcc.Dropdown(
+                    id='excluded-subsetores-dropdown',
+                    options=[],
+                    value=[],
+                    multi=True,
+                    className='dash-dropdown-custom'
+                )
+            ]),
+            html.Div([
+                html.P("ROIC mínimo (%):", className='sidebar-label'),
+                dcc.Input(
+                    id='min-roic-input',
+                    type='text',
+                    value='',
+                    debounce=True,
+                    className='dash-input-custom',
+                    placeholder="Ex: 10"
+                )
+            ]),
+            html.Div([
+                html.P("EY mínimo (%):", className='sidebar-label'),
+                dcc.Input(
+                    id='min-ey-input',
+                    type='text',
+                    value='',
+                    debounce=True,
+                    className='dash-input-custom',
+                    placeholder="Ex: 5"
+                )
+            ]),
+            dcc.Checklist(
+                id='rerank-checklist',
+                options=[{'label': ' Recalcular os ranks no universo filtrado', 'value': 'rerank'}],
+                value=DEFAULT_RERANK,
+                className='sidebar-label'
+            ),
             html.Hr(),
             html.H3("Configurações de Investimento"),
             html.Div([
@@ -248,7 +688,7 @@ app.layout = html.Div([
                 dcc.Input(
                     id='total-investimento-input',
                     type='text',
-                    value="10.000", # Definindo valor inicial como string formatada e sem decimais
+                    value=DEFAULT_TOTAL_INVESTIMENTO, # Definindo valor inicial como string formatada e sem decimais
                     className='dash-input-custom',
                     placeholder="Ex: 10.000"
                 )
@@ -261,17 +701,55 @@ app.layout = html.Div([
                         {'label': 'Fracionário (1+ ações)', 'value': 'Fracionário (1+ ações)'},
                         {'label': 'Padrão (100+ ações)', 'value': 'Padrão (100+ ações)'}
                     ],
-                    value='Fracionário (1+ ações)',
+                    value=DEFAULT_TIPO_COMPRA,
                     className='dash-radioitems-custom'
                 )
             ]),
+            html.Div([
+                html.P("Modo de Alocação:", className='sidebar-label'),
+                dcc.RadioItems(
+                    id='allocation-mode-radio',
+                    options=[
+                        {'label': MODO_ALOCACAO_ARREDONDAMENTO, 'value': MODO_ALOCACAO_ARREDONDAMENTO},
+                        {'label': MODO_ALOCACAO_OTIMIZADO, 'value': MODO_ALOCACAO_OTIMIZADO}
+                    ],
+                    value=DEFAULT_MODO_ALOCACAO,
+                    className='dash-radioitems-custom'
+                )
+            ]),
+            html.Div([
+                html.P("Teto por Setor (% do total, modo otimizado):", className='sidebar-label'),
+                dcc.Input(
+                    id='sector-cap-input',
+                    type='text',
+                    value='',
+                    debounce=True,
+                    className='dash-input-custom',
+                    placeholder="Ex: 30"
+                )
+            ]),
+            html.Div([
+                html.P("Carteira Atual (rebalanceamento):", className='sidebar-label'),
+                dcc.Textarea(
+                    id='holdings-input',
+                    value='',
+                    placeholder="Uma posição por linha, e.g.:\nPETR4;100\nVALE3;1.000",
+                    className='holdings-textarea'
+                ),
+                dcc.Upload(
+                    id='holdings-upload',
+                    children=html.Div("Arraste ou selecione um CSV (ticker;qtd)"),
+                    className='holdings-upload'
+                ),
+                html.P(id='holdings-status', className='holdings-status'),
+            ]),
             html.Hr(),
             html.H3("Colunas a Exibir"),
             html.Div([
                 html.P("Selecione as colunas para exibir (a ordem de seleção define a ordem na tabela):", className='sidebar-label'),
                 dcc.Dropdown(
                     id='selected-columns-dropdown',
-                    options=[{'label': col, 'value': col} for col in ALL_COLUMNS_MAP.values() if col not in ['Data Execução', 'Valor Alocado (R$)', 'Qtd. Ações', '% na Carteira']],
+                    options=[{'label': col, 'value': col} for col in ALL_COLUMNS_MAP.values() if col not in ['Data Execução', 'Valor Alocado (R$)', 'Qtd. Ações', '% na Carteira', 'Operação', 'Qtd. Atual', 'Ordem (Qtd.)', 'Valor da Ordem (R$)']],
                     value=DEFAULT_SELECTED_COLUMNS_DISPLAY,
                     multi=True,
                     className='dash-dropdown-custom'
@@ -286,6 +764,15 @@ app.layout = html.Div([
             dash_table.DataTable(
                 id='magic-formula-table',
                 row_selectable='multi',
+                page_action='custom',
+                page_current=0,
+                page_size=TABLE_PAGE_SIZE,
+                sort_action='custom',
+                sort_mode='single',
+                sort_by=[],
+                filter_action='custom',
+                filter_query='',
+                filter_options={'case': 'insensitive'},
                 style_as_list_view=True,
                 style_table={'overflowX': 'auto', 'border': '1px solid #1E3D82', 'borderRadius': '8px', 'boxShadow': '0 4px 8px rgba(0,0,0,0.1)'},
                 style_header={
@@ -345,6 +832,25 @@ app.layout = html.Div([
             html.H3("Resumo da Alocação de Investimento"),
             html.Div(id='allocation-summary'),
 
+            # Exportação: o formulário envia a referência da alocação por POST (o arquivo é gerado no servidor)
+            html.Form(id='export-form', method='POST', className='export-form', children=[
+                dcc.Input(id='export-ref-input', type='hidden', name='ref', value=''),
+                dcc.RadioItems(
+                    id='export-format-radio',
+                    options=[{'label': 'CSV', 'value': 'csv'}, {'label': 'Excel (XLSX)', 'value': 'xlsx'}],
+                    value='csv',
+                    inline=True,
+                    className='dash-radioitems-custom'
+                ),
+                dcc.Checklist(
+                    id='export-br-checklist',
+                    options=[{'label': ' Números no formato brasileiro (R$ 1.234,56)', 'value': 'br'}],
+                    value=['br'],
+                ),
+                html.Button("Baixar ordens de compra", id='export-allocation-button', type='submit', disabled=True),
+                html.Button("Baixar universo ranqueado", id='export-universe-button', type='submit', disabled=True),
+            ]),
+
             html.Hr(),
             html.H3("Entendendo as Métricas:"),
             html.Ul([
@@ -443,14 +949,46 @@ app.layout = html.Div([
 
 # --- Callbacks ---
 
+def _table_page(filtered_data_ref, calculated_data_ref, columns, page_current, page_size, sort_by, filter_query):
+    """
+    Página formatada da tabela, memoizada no PIPELINE. Retorna (registros, total de páginas, página atual).
+    A página não depende da seleção: sessões com a mesma fonte, colunas, ordenação e filtro
+    compartilham a página formatada.
+    """
+    # A referência inteira identifica o filtro da alocação (a mesma sessão pode voltar a um filtro anterior)
+    if calculated_data_ref and calculated_data_ref.get('key') and calculated_data_ref['filtered'] == filtered_data_ref:
+        source_key, load_source = calculated_data_ref['key'], lambda: _get_calculated_frame(calculated_data_ref)
+    else:
+        source_key, load_source = filtered_data_ref['key'], lambda: _get_filtered_frame(filtered_data_ref)
+
+    def build():
+        with METRICS.stage('load'):
+            df_source = load_source()
+        with METRICS.stage('format'):
+            return build_table_page(df_source, columns, page_current, page_size, sort_by, filter_query)
+
+    page, _ = PIPELINE.run(
+        'page', filtered_data_ref['raw']['version'],
+        (source_key, columns, page_current, page_size, sort_by, filter_query), build,
+    )
+    return page
+
+
 @app.callback(
     Output('raw-data-store', 'data'),
     Output('last-updated-date-text', 'children'),
     Output('source-text', 'children'),
-    Input('raw-data-store', 'data')
+    Output('data-execucao-dropdown', 'options'),
+    Output('num-empresas-slider', 'max'),
+    Output('num-empresas-slider', 'marks'),
+    Output('excluded-setores-dropdown', 'options'),
+    Output('excluded-subsetores-dropdown', 'options'),
+    Input('data-execucao-dropdown', 'value')
 )
-def load_raw_data(dummy_input):
-    df_raw, data_execucao = get_magic_formula_data()
+@METRICS.instrument()
+def load_raw_data(selected_date):
+    with METRICS.stage('load'):
+        df_raw, data_execucao, version = _load_versioned_data(selected_date)
     
     date_text = ""
     source_elem = html.Span()
@@ -466,38 +1004,53 @@ def load_raw_data(dummy_input):
         date_text = "Data de atualização dos dados não disponível."
         source_elem = html.Span()
 
-    df_raw['_selected_for_allocation'] = True
-
-    return df_raw.to_json(date_format='iso', orient='split'), date_text, source_elem
+    # O DataFrame bruto é o mesmo para todas as sessões: a referência leva só a versão
+    # (ver _get_raw_frame)
+    raw_ref = {'version': version, 'date': selected_date}
+    # O slider vai até o universo inteiro: a tabela é paginada no servidor
+    slider_max = max(len(df_raw), 1)
+    setores, subsetores = ([sorted(df_raw[col].dropna().unique().tolist()) if col in df_raw.columns else []
+                            for col in ('setor', 'subsetor')])
+    return (raw_ref, date_text, source_elem, _data_date_options(), slider_max, _slider_marks(slider_max),
+            setores, subsetores)
 
 @app.callback(
     [Output('filtered-data-store', 'data'),
-     Output('magic-formula-table', 'data'),
-     Output('magic-formula-table', 'columns'),
-     Output('magic-formula-table', 'selected_rows')],
+     Output('magic-formula-table', 'columns')],
     [Input('num-empresas-slider', 'value'),
      Input('min-volume-input', 'value'), 
      Input('selected-columns-dropdown', 'value'),
-     Input('raw-data-store', 'data')] 
+     Input('raw-data-store', 'data'),
+     Input('excluded-setores-dropdown', 'value'),
+     Input('excluded-subsetores-dropdown', 'value'),
+     Input('min-roic-input', 'value'),
+     Input('min-ey-input', 'value'),
+     Input('rerank-checklist', 'value')]
 )
-def update_filtered_data_and_table(num_empresas, min_volume_str, selected_cols_display, raw_data_json):
-    if not raw_data_json:
-        return pd.DataFrame().to_json(date_format='iso', orient='split'), [], [], []
+@METRICS.instrument()
+def update_filtered_data_and_table(num_empresas, min_volume_str, selected_cols_display, raw_data_ref,
+                                   excluded_setores=None, excluded_subsetores=None, min_roic_str='', min_ey_str='',
+                                   rerank_options=DEFAULT_RERANK):
+    if not raw_data_ref:
+        return {'key': None}, []
 
-    df_raw = pd.read_json(io.StringIO(raw_data_json), orient='split') 
+    with METRICS.stage('load'):
+        df_raw = _get_raw_frame(raw_data_ref)
 
     if df_raw.empty:
-        return pd.DataFrame().to_json(date_format='iso', orient='split'), [], [], []
+        return {'key': None}, []
 
     min_volume = parse_br_number(min_volume_str) 
+    # Campo vazio = sem mínimo (parse_br_number devolveria 0)
+    ranking = ranking_params(
+        excluded_setores, excluded_subsetores,
+        parse_br_number(min_roic_str) if (min_roic_str or '').strip() else None,
+        parse_br_number(min_ey_str) if (min_ey_str or '').strip() else None,
+        'rerank' in (rerank_options or []),
+    )
 
-    df_filtered = df_raw[df_raw['vol_med_2m'] >= min_volume].copy()
-    df_filtered = df_filtered.sort_values(by='magic_formula_rank')
-
-    df_filtered = df_filtered.head(num_empresas)
-    df_filtered.reset_index(drop=True, inplace=True)
-
-    df_filtered['_selected_for_allocation'] = True 
+    with METRICS.stage('compute'):
+        df_filtered, filtered_key = _filtered_stage(raw_data_ref, num_empresas, min_volume, ranking)
 
     dash_table_columns = [
         {"name": "Nº", "id": "Nº"},
@@ -516,50 +1069,180 @@ def update_filtered_data_and_table(num_empresas, min_volume_str, selected_cols_d
         if original_name in df_filtered.columns and original_name not in [col['id'] for col in dash_table_columns]:
             dash_table_columns.append({"name": display_name, "id": original_name})
 
+    # A página visível é montada em update_table_page
+    filtered_ref = {
+        'key': filtered_key,
+        'raw': raw_data_ref,
+        'num_empresas': num_empresas,
+        'min_volume': min_volume,
+        'ranking': ranking,
+    }
 
-    df_for_display = df_filtered.copy()
-    df_for_display.insert(0, 'Nº', range(1, 1 + len(df_for_display)))
-
-    for col_def in dash_table_columns:
-        col_id = col_def['id']
-        col_name_for_formatting = col_def['name']
-        if col_name_for_formatting in FORMATTING_RULES and col_id in df_for_display.columns:
-            df_for_display[col_id] = df_for_display[col_id].apply(FORMATTING_RULES[col_name_for_formatting])
-
-    table_data = df_for_display.to_dict('records')
+    return filtered_ref, dash_table_columns
 
-    initial_selected_rows_indices = list(range(len(df_filtered))) 
+@app.callback(
+    Output('magic-formula-table', 'data'),
+    Output('magic-formula-table', 'selected_rows'),
+    Output('magic-formula-table', 'page_count'),
+    Output('magic-formula-table', 'page_current'),
+    Output('selection-store', 'data'),
+    Input('filtered-data-store', 'data'),
+    Input('magic-formula-table', 'page_current'),
+    Input('magic-formula-table', 'page_size'),
+    Input('magic-formula-table', 'sort_by'),
+    Input('magic-formula-table', 'filter_query'),
+    Input('magic-formula-table', 'selected_rows'),
+    State('magic-formula-table', 'data'),
+    State('magic-formula-table', 'columns'),
+    State('selection-store', 'data'),
+    State('calculated-data-store', 'data'),
+)
+@METRICS.instrument()
+def update_table_page(filtered_data_ref, page_current, page_size, sort_by, filter_query, selected_rows,
+                      page_data, columns, selection, calculated_data_ref):
+    if not filtered_data_ref or not filtered_data_ref['key']:
+        return [], [], 1, 0, []
+
+    triggered = {t['prop_id'] for t in dash.callback_context.triggered}
+
+    # Só as caixas da página mudaram: atualiza a seleção global, sem redesenhar a página
+    if triggered == {'magic-formula-table.selected_rows'}:
+        new_selection = update_selection(selection, page_data, selected_rows)
+        if new_selection == sorted(selection or []):
+            raise dash.exceptions.PreventUpdate
+        return dash.no_update, dash.no_update, dash.no_update, dash.no_update, new_selection
+
+    selection_output = dash.no_update
+    if 'filtered-data-store.data' in triggered:
+        # Novo filtro de ranking/liquidez: todas as empresas pré-selecionadas, volta à 1ª página
+        with METRICS.stage('load'):
+            df_filtered, _ = _filtered_stage_for(filtered_data_ref)
+        selection = selection_output = list(range(len(df_filtered)))
+        page_current = 0
+
+    records, total_pages, page_current = _table_page(
+        filtered_data_ref, calculated_data_ref, columns, page_current, page_size, sort_by, filter_query
+    )
+    return records, page_selected_rows(records, selection), total_pages, page_current, selection_output
 
-    return df_filtered.to_json(date_format='iso', orient='split'), table_data, dash_table_columns, initial_selected_rows_indices
+@app.callback(
+    Output('holdings-store', 'data'),
+    Output('holdings-input', 'value'),
+    Output('holdings-status', 'children'),
+    Input('holdings-input', 'n_blur'),
+    Input('holdings-upload', 'contents'),
+    State('holdings-input', 'value'),
+    prevent_initial_call=True
+)
+def update_holdings(n_blur, upload_contents, holdings_text):
+    # O texto é lido ao sair do campo (não a cada tecla); um CSV enviado substitui o texto
+    text_output = dash.no_update
+    triggered = {t['prop_id'] for t in dash.callback_context.triggered}
+    if 'holdings-upload.contents' in triggered and upload_contents:
+        holdings_text = text_output = decode_upload(upload_contents)
+
+    holdings, invalid = parse_holdings(holdings_text)
+    status = []
+    if holdings:
+        status.append(f"{len(holdings)} posições: o valor a investir é somado à carteira como aporte.")
+    if invalid:
+        status.append(f"Linhas ignoradas: {', '.join(invalid[:5])}{'...' if len(invalid) > 5 else ''}")
+    return holdings or None, text_output, ' '.join(status)
+
+def _rebalance_summary(orders, caixa_final, aporte, num_empresas_selecionadas):
+    """Resumo e tabela de ordens do modo de rebalanceamento."""
+    valor_atual = (orders['qtd_atual'] * orders['cotacao']).sum()
+    vendas = orders[orders['operacao'] == OPERACAO_VENDA]
+    compras = orders[orders['operacao'] == OPERACAO_COMPRA]
+    sem_cotacao = orders.loc[orders['cotacao'].isna(), 'ticker'].tolist()
+
+    elements = [
+        html.P(f"Valor Atual da Carteira: R$ {format_br_float(valor_atual, decimals=2)}"),
+        html.P(f"Aporte: R$ {format_br_float(aporte, decimals=2)}"),
+        html.P(f"Número de Empresas Selecionadas para Alocação: {num_empresas_selecionadas}"),
+    ]
+    if num_empresas_selecionadas > 0:
+        ideal = (valor_atual + aporte) / num_empresas_selecionadas
+        elements.append(html.P(f"Valor por Empresa (Ideal): R$ {format_br_float(ideal, decimals=2)}"))
+    elements.append(html.P(f"Vendas: {len(vendas)} ordens, R$ {format_br_float(-vendas['valor_ordem'].sum(), decimals=2)}"))
+    elements.append(html.P(f"Compras: {len(compras)} ordens, R$ {format_br_float(compras['valor_ordem'].sum(), decimals=2)}"))
+    elements.append(html.P(f"Caixa Após as Ordens: R$ {format_br_float(caixa_final, decimals=2)}"))
+    if sem_cotacao:
+        elements.append(html.P(f"Sem cotação nos dados (venda integral, valor não estimado): {', '.join(sem_cotacao)}"))
+
+    columns = [{'name': ALL_COLUMNS_MAP[col_id], 'id': col_id} for col_id in REBALANCE_ORDER_COLUMNS]
+    values = format_table_columns(orders, columns)
+    records = [{col_id: column[i] for col_id, column in values.items()} for i in range(len(orders))]
+    elements.append(dash_table.DataTable(
+        id='rebalance-orders-table',
+        columns=columns,
+        data=records,
+        page_size=20,
+        style_as_list_view=True,
+        style_table={'overflowX': 'auto', 'marginTop': '10px'},
+        style_header={'backgroundColor': '#EEEEEE', 'fontWeight': 'bold', 'color': '#1E3D82'},
+        style_cell={'textAlign': 'center', 'fontFamily': 'Open Sans', 'fontSize': 14, 'padding': '6px 10px'},
+        style_data_conditional=[
+            {'if': {'filter_query': f'{{operacao}} = "{OPERACAO_VENDA}"'}, 'color': '#B03A2E'},
+            {'if': {'filter_query': f'{{operacao}} = "{OPERACAO_COMPRA}"'}, 'color': '#1E8449'},
+        ],
+    ))
+    return elements
 
 @app.callback(
     [Output('calculated-data-store', 'data'),
      Output('allocation-summary', 'children')],
-    [Input('magic-formula-table', 'selected_rows'),
+    [Input('selection-store', 'data'),
      Input('total-investimento-input', 'value'), 
-     Input('tipo-compra-radio', 'value')],
+     Input('tipo-compra-radio', 'value'),
+     Input('holdings-store', 'data'),
+     Input('allocation-mode-radio', 'value'),
+     Input('sector-cap-input', 'value')],
     [State('filtered-data-store', 'data')]
 )
-def update_allocation_and_summary(selected_rows_indices, total_investimento_str, tipo_compra, filtered_data_json):
-    if not filtered_data_json:
-        return pd.DataFrame().to_json(date_format='iso', orient='split'), html.P("Não há dados para calcular alocação.")
+@METRICS.instrument()
+def update_allocation_and_summary(selected_rows_indices, total_investimento_str, tipo_compra, holdings,
+                                  modo_alocacao, teto_setor_str, filtered_data_ref):
+    if not filtered_data_ref:
+        return {'key': None}, html.P("Não há dados para calcular alocação.")
 
-    df_filtered = pd.read_json(io.StringIO(filtered_data_json), orient='split') 
+    with METRICS.stage('load'):
+        df_filtered = _filtered_stage_for(filtered_data_ref)[0] if filtered_data_ref['key'] else pd.DataFrame()
 
     if df_filtered.empty:
-        return pd.DataFrame().to_json(date_format='iso', orient='split'), html.P("Nenhuma empresa atende aos critérios de filtro.")
+        return {'key': None}, html.P("Nenhuma empresa atende aos critérios de filtro.")
 
     total_investimento = parse_br_number(total_investimento_str) 
 
-    df_filtered['_selected_for_allocation'] = False
-    if selected_rows_indices is not None:
-        df_filtered.loc[selected_rows_indices, '_selected_for_allocation'] = True
+    calculated_ref = {
+        'key': None,
+        'filtered': filtered_data_ref,
+        'selected_rows': selected_rows_indices,
+        'total_investimento': total_investimento,
+        'tipo_compra': tipo_compra,
+    }
 
-    df_with_allocation = calculate_allocation_for_df(df_filtered.copy(), total_investimento, tipo_compra)
+    if holdings:
+        # Rebalanceamento: o valor a investir é o aporte somado à carteira atual
+        with METRICS.stage('compute'):
+            (df_with_allocation, orders, caixa_final), calculated_key = _rebalance_stage(
+                filtered_data_ref, selected_rows_indices, total_investimento, tipo_compra, holdings)
+        num_empresas_selecionadas = int(df_with_allocation['_selected_for_allocation'].sum())
+        calculated_ref.update(key=calculated_key, holdings=holdings)
+        return calculated_ref, html.Div(_rebalance_summary(orders, caixa_final, total_investimento, num_empresas_selecionadas))
 
-    df_selected_final = df_with_allocation[df_with_allocation['_selected_for_allocation']].copy()
-    total_alocado_real_final = df_selected_final['valor_alocado'].sum()
-    num_empresas_selecionadas_final = len(df_selected_final)
+    teto_setor = parse_br_number(teto_setor_str) if teto_setor_str else None
+    if teto_setor is not None and teto_setor <= 0:
+        teto_setor = None
+    calculated_ref.update(modo_alocacao=modo_alocacao, teto_setor=teto_setor)
+
+    with METRICS.stage('compute'):
+        df_with_allocation, calculated_key = _calculated_stage(
+            filtered_data_ref, selected_rows_indices, total_investimento, tipo_compra, None, modo_alocacao, teto_setor)
+
+        df_selected_final = df_with_allocation[df_with_allocation['_selected_for_allocation']].copy()
+        total_alocado_real_final = df_selected_final['valor_alocado'].sum()
+        num_empresas_selecionadas_final = len(df_selected_final)
 
     summary_elements = []
     summary_elements.append(html.P(f"Valor a Investir: R$ {format_br_float(total_investimento, decimals=2)}"))
@@ -573,47 +1256,57 @@ def update_allocation_and_summary(selected_rows_indices, total_investimento_str,
 
     summary_elements.append(html.P(f"Valor Total Alocado (Real): R$ {format_br_float(total_alocado_real_final, decimals=2)}"))
     summary_elements.append(html.P(f"Diferença (Não Alocado): R$ {format_br_float(total_investimento - total_alocado_real_final, decimals=2)}"))
+    if modo_alocacao == MODO_ALOCACAO_OTIMIZADO and teto_setor is not None:
+        summary_elements.append(html.P(f"Teto por Setor: {format_br_float(teto_setor, decimals=2)}% do valor a investir"))
 
-    return df_with_allocation.to_json(date_format='iso', orient='split'), html.Div(summary_elements)
+    calculated_ref['key'] = calculated_key
+    return calculated_ref, html.Div(summary_elements)
 
 @app.callback(
     Output('magic-formula-table', 'data', allow_duplicate=True),
     [Input('calculated-data-store', 'data')],
-    [State('selected-columns-dropdown', 'value')],
+    [State('magic-formula-table', 'data'),
+     State('magic-formula-table', 'columns'),
+     State('filtered-data-store', 'data')],
     prevent_initial_call=True
 )
-def update_table_with_calculated_data(calculated_data_json, selected_cols_display):
-    if not calculated_data_json:
+@METRICS.instrument()
+def update_table_with_calculated_data(calculated_data_ref, page_data, columns, filtered_data_ref):
+    if not calculated_data_ref or not calculated_data_ref['key']:
         return []
+    # A página exibida é de outro filtro (a alocação chegou atrasada): nada a atualizar
+    if not page_data or calculated_data_ref['filtered'] != filtered_data_ref:
+        raise dash.exceptions.PreventUpdate
 
-    df_calculated = pd.read_json(io.StringIO(calculated_data_json), orient='split') 
-
-    dash_table_columns_ids = ["Nº"] # Lista de IDs de colunas (strings)
-    reverse_map = {v: k for k, v in ALL_COLUMNS_MAP.items()}
-
-    for col_display_name in selected_cols_display:
-        original_col_name = reverse_map.get(col_display_name, col_display_name)
-        if original_col_name in df_calculated.columns and original_col_name not in ['Nº', 'valor_alocado', 'qtd_acoes', 'peso_carteira', 'data_execucao']:
-            dash_table_columns_ids.append(original_col_name) # Adiciona apenas o ID da coluna (string)
-            
-    fixed_cols_original_names = ['valor_alocado', 'qtd_acoes', 'peso_carteira'] 
-    for original_name in fixed_cols_original_names:
-        display_name = ALL_COLUMNS_MAP[original_name]
-        # Verifica se a coluna está no DataFrame e se ainda não foi adicionada (como um ID de string)
-        if original_name in df_calculated.columns and original_name not in dash_table_columns_ids:
-            dash_table_columns_ids.append(original_name) # Adiciona apenas o ID da coluna (string)
-
-
-    df_for_display = df_calculated.copy()
-    df_for_display.insert(0, 'Nº', range(1, 1 + len(df_for_display)))
+    with METRICS.stage('load'):
+        # Só leitura: usa o resultado do PIPELINE sem copiar
+        df_calculated, _ = _calculated_stage_for(calculated_data_ref)
 
-    for col_id in dash_table_columns_ids: # col_id é uma string aqui, como esperado
-        col_name_for_formatting = ALL_COLUMNS_MAP.get(col_id, col_id)
-        if col_name_for_formatting in FORMATTING_RULES and col_id in df_for_display.columns:
-            df_for_display[col_id] = df_for_display[col_id].apply(FORMATTING_RULES[col_name_for_formatting])
+    # Só as colunas de alocação mudam: envia apenas as células alteradas da página visível
+    with METRICS.stage('format'):
+        patch = allocation_patch(page_data, df_calculated, columns)
+    if patch is None:
+        raise dash.exceptions.PreventUpdate
 
+    return patch
 
-    return df_for_display[dash_table_columns_ids].to_dict('records')
+@app.callback(
+    Output('export-ref-input', 'value'),
+    Output('export-allocation-button', 'formAction'),
+    Output('export-universe-button', 'formAction'),
+    Output('export-allocation-button', 'disabled'),
+    Output('export-universe-button', 'disabled'),
+    Input('calculated-data-store', 'data'),
+    Input('export-format-radio', 'value'),
+    Input('export-br-checklist', 'value'),
+)
+def update_export_form(calculated_data_ref, export_format, br_options):
+    query = '?br=1' if 'br' in (br_options or []) else ''
+    allocation_action = app.get_relative_path(f'/export/alocacao.{export_format}') + query
+    universe_action = app.get_relative_path(f'/export/universo.{export_format}') + query
+    if not calculated_data_ref or not calculated_data_ref.get('key'):
+        return '', allocation_action, universe_action, True, True
+    return json.dumps(calculated_data_ref), allocation_action, universe_action, False, False
 
 @app.callback(
     Output('sidebar', 'style'),
@@ -699,6 +1392,30 @@ app.clientside_callback(
 )
 # --- FIM CLIENTSIDE CALLBACKS ---
 
+# --- Aquecimento antes de atender requisições (ver gunicorn.conf.py) ---
+def warm_up():
+    """
+    Executa os callbacks mais usados com os valores iniciais do layout: carrega o dataset,
+    monta o índice de ranking e deixa no PIPELINE o filtro, a alocação e a primeira página
+    padrão. Com o preload do gunicorn, roda no master e os workers herdam tudo pronto
+    (as páginas de memória são compartilhadas após o fork). Retorna o tempo gasto (s).
+    """
+    start = time.perf_counter()
+    raw_ref = load_raw_data(LATEST_DATA_OPTION)[0]
+    filtered_ref, columns = update_filtered_data_and_table(
+        DEFAULT_NUM_EMPRESAS, DEFAULT_MIN_VOLUME, DEFAULT_SELECTED_COLUMNS_DISPLAY, raw_ref)
+    if filtered_ref['key']:
+        df_filtered, _ = _filtered_stage_for(filtered_ref)
+        _table_page(filtered_ref, None, columns, 0, TABLE_PAGE_SIZE, [], '')
+        calculated_ref, _ = update_allocation_and_summary(
+            list(range(len(df_filtered))), DEFAULT_TOTAL_INVESTIMENTO, DEFAULT_TIPO_COMPRA, None,
+            DEFAULT_MODO_ALOCACAO, '', filtered_ref)
+        _table_page(filtered_ref, calculated_ref, columns, 0, TABLE_PAGE_SIZE, [], '')
+    # A thread de recarga (MF_RELOAD_INTERVAL) não deve atravessar o fork: cada worker inicia a sua
+    DATASET_CACHE.stop_watcher()
+    return time.perf_counter() - start
+
+
 
 if __name__ == '__main__':
     app.run_server(debug=True) 
\ No newline at end of file
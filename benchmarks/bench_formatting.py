@@ -0,0 +1,59 @@
+"""
+Compara a formatação célula a célula (Series.apply com format_br_float/format_br_int)
+com a formatação por coluna de formatting.py, em universos de 400 a 100 mil linhas.
+
+Uso: python benchmarks/bench_formatting.py
+"""
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from formatting import format_br_float, format_br_float_series, format_br_int, format_br_int_series
+
+SIZES = [400, 1_000, 10_000, 100_000]
+
+# Colunas representativas da tabela: (nome, regra célula a célula, regra por coluna, gerador)
+COLUMNS = [
+    ('Cotação (R$)',
+     lambda x: f'R$ {format_br_float(x, decimals=2)}',
+     lambda s: format_br_float_series(s, decimals=2, prefix='R$ '),
+     lambda rng, n: np.round(rng.lognormal(3, 1, n), 2)),
+    ('Vol. Médio 2M (R$)',
+     lambda x: f'R$ {format_br_int(x)}',
+     lambda s: format_br_int_series(s, prefix='R$ '),
+     lambda rng, n: np.round(rng.lognormal(16, 2, n))),
+    ('Margem Líquida (%)',
+     lambda x: f'{format_br_float(x, decimals=2)}%',
+     lambda s: format_br_float_series(s, decimals=2, suffix='%'),
+     lambda rng, n: np.round(rng.normal(10, 50, n), 2)),
+]
+
+
+def _best_of(func, repeat=3):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    rng = np.random.default_rng(42)
+    print(f"{'linhas':>8}  {'coluna':<20} {'apply (ms)':>11} {'coluna (ms)':>12} {'speedup':>8}")
+    for n in SIZES:
+        for name, cell_rule, column_rule, generator in COLUMNS:
+            series = pd.Series(generator(rng, n))
+            assert series.apply(cell_rule).tolist() == column_rule(series).tolist()
+            t_apply = _best_of(lambda: series.apply(cell_rule))
+            t_column = _best_of(lambda: column_rule(series))
+            print(f"{n:>8}  {name:<20} {t_apply * 1e3:>11.2f} {t_column * 1e3:>12.2f} {t_apply / t_column:>7.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+"""
+Compara a alocação otimizada em lotes (allocation.allocate_optimal_lots) com o
+arredondamento para o lote mais próximo (allocation.allocate_equal_weight) em seleções
+aleatórias do CSV de dados, para cada tipo de lote e valor a investir:
+- tempo de cálculo (mediana e máximo);
+- caixa não alocado (% do valor a investir; negativo = passou do valor);
+- quantas vezes o arredondamento passa do valor a investir;
+- desvio médio do peso de cada empresa em relação ao peso igual (pontos percentuais).
+
+Uso: python benchmarks/bench_lot_solver.py [--data-file fundamentus_data.csv] [--trials 200] [--n 20]
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from allocation import allocate_equal_weight, allocate_optimal_lots  # noqa: E402
+from snapshot import load_dataset  # noqa: E402
+
+LOT_SIZES = [1, 100]
+TOTALS = [10_000.0, 100_000.0, 1_000_000.0]
+
+
+def _weight_deviation(valor, total):
+    # Desvio do peso de cada empresa (sobre o valor a investir) em relação ao peso igual
+    return np.abs(valor / total - 1 / len(valor)).mean() * 100
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Alocação otimizada em lotes x arredondamento.")
+    parser.add_argument('--data-file', default=os.path.join(ROOT, 'fundamentus_data.csv'))
+    parser.add_argument('--trials', type=int, default=200, help="Seleções aleatórias por cenário")
+    parser.add_argument('--n', type=int, default=20, help="Empresas por seleção")
+    args = parser.parse_args()
+
+    df = load_dataset(args.data_file)
+    cotacao = df['cotacao'].to_numpy(dtype=float)
+    cotacao = cotacao[np.isfinite(cotacao) & (cotacao > 0)]
+    rng = np.random.default_rng(42)
+    selected = np.ones(args.n, dtype=bool)
+
+    print(f"{'lote':>5} {'valor (R$)':>12} | {'mediana (ms)':>12} {'máx (ms)':>9} | "
+          f"{'sobra ótimo':>11} {'sobra arred.':>12} {'passou':>7} | {'desvio ótimo':>12} {'desvio arred.':>13}")
+    for lot_size in LOT_SIZES:
+        for total in TOTALS:
+            times, left_opt, left_round, dev_opt, dev_round, overshoots = [], [], [], [], [], 0
+            for _ in range(args.trials):
+                precos = rng.choice(cotacao, args.n, replace=False)
+                start = time.perf_counter()
+                _, valor_opt, _ = allocate_optimal_lots(precos, selected, total, lot_size)
+                times.append(time.perf_counter() - start)
+                _, valor_round, _ = allocate_equal_weight(precos, selected, total, lot_size)
+
+                assert valor_opt.sum() <= total + 1e-6
+                left_opt.append((total - valor_opt.sum()) / total * 100)
+                left_round.append((total - valor_round.sum()) / total * 100)
+                overshoots += valor_round.sum() > total
+                dev_opt.append(_weight_deviation(valor_opt, total))
+                dev_round.append(_weight_deviation(valor_round, total))
+            print(f"{lot_size:>5} {total:>12,.0f} | {np.median(times) * 1e3:>12.3f} {max(times) * 1e3:>9.3f} | "
+                  f"{np.mean(left_opt):>10.3f}% {np.mean(left_round):>11.3f}% {overshoots:>7} | "
+                  f"{np.mean(dev_opt):>11.3f}pp {np.mean(dev_round):>12.3f}pp")
+
+
+if __name__ == '__main__':
+    main()
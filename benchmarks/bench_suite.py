@@ -0,0 +1,250 @@
+"""
+Suíte de benchmarks do dashboard sobre universos sintéticos (benchmarks/synthetic.py).
+
+Para cada tamanho (400 a 100 mil linhas), mede:
+- get_magic_formula_data (primeira carga do CSV e acessos seguintes, via DATASET_CACHE);
+- calculate_allocation_for_df sobre o universo inteiro (arredondamento e modo otimizado);
+- format_br_float / format_br_int / parse_br_number (célula a célula) e as versões por coluna;
+- o ranking recalculado com filtro de volume (rank_index.ReRankIndex);
+- o rebalanceamento de 500 carteiras contra o universo (rebalance.py);
+- um lote de 1.000 alocações da API JSON (api.evaluate_batch);
+- a exportação em streaming do universo para CSV e XLSX (export.py);
+- cada callback do Dash chamado diretamente, com o universo inteiro selecionado (pior caso).
+  Os callbacks de filtro e de alocação são memoizados no PIPELINE: cada um é medido com o
+  pipeline descartado antes de cada repetição ('[cold]', o cálculo) e com o resultado já
+  guardado ('[warm]', o acerto no PIPELINE).
+
+Os resultados vão para um JSON. Com --compare, cada medida é comparada com a de um JSON
+de referência e as mais lentas que `--threshold` vezes a referência são apontadas como
+regressão (código de saída 1).
+
+Uso:
+    python benchmarks/bench_suite.py --output bench.json
+    python benchmarks/bench_suite.py --sizes 400 10000 --compare bench.json
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import synthetic  # noqa: E402
+
+DEFAULT_SIZES = [400, 1_000, 10_000, 100_000]
+
+
+def _timings(func, repeat, setup=None):
+    # `setup` roda antes de cada repetição, fora da medida
+    times = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _use_dataset(app, csv_path):
+    """Aponta o app para o CSV sintético (novo DATASET_CACHE, sem snapshot compilado)."""
+    from data_cache import DatasetCache
+    app.DATA_FILE = csv_path
+    app.DATASET_CACHE = DatasetCache([csv_path], app._read_magic_formula_data, frame_of=lambda value: value[0])
+
+
+def run_size(app, n, repeat, workdir):
+    """Mede todos os casos para um universo de `n` linhas; retorna {nome: [tempos]}."""
+    from formatting import format_br_float, format_br_float_series, format_br_int, parse_br_number, parse_br_series
+
+    df = synthetic.generate(n)
+    csv_path = os.path.join(workdir, f"fundamentus_{n}.csv")
+    df.to_csv(csv_path, index=False)
+    _use_dataset(app, csv_path)
+
+    results = {}
+    results['get_magic_formula_data[cold]'] = _timings(
+        lambda: (app.DATASET_CACHE.invalidate(), app.get_magic_formula_data()), repeat)
+    results['get_magic_formula_data[warm]'] = _timings(app.get_magic_formula_data, repeat)
+
+    df_data, _ = app.get_magic_formula_data()
+    df_data['_selected_for_allocation'] = True
+    for tipo in ('Fracionário (1+ ações)', 'Padrão (100+ ações)'):
+        results[f'calculate_allocation_for_df[{tipo.split()[0]}]'] = _timings(
+            lambda: app.calculate_allocation_for_df(df_data, 1_000_000.0, tipo), repeat)
+
+    results['calculate_allocation_for_df[Otimizado]'] = _timings(
+        lambda: app.calculate_allocation_for_df(df_data, 1_000_000.0, 'Padrão (100+ ações)', 'Otimizado (sem sobra de caixa)', 30.0),
+        repeat)
+
+    prices = df_data['cotacao'].astype(float)
+    volumes = df_data['vol_med_2m'].astype(float)
+    price_list = prices.tolist()
+    volume_list = volumes.tolist()
+    texts = format_br_float_series(prices, decimals=2).tolist()
+    results['format_br_float[cell]'] = _timings(lambda: [format_br_float(x, decimals=2) for x in price_list], repeat)
+    results['format_br_int[cell]'] = _timings(lambda: [format_br_int(x) for x in volume_list], repeat)
+    results['parse_br_number[cell]'] = _timings(lambda: [parse_br_number(x) for x in texts], repeat)
+    results['format_br_float_series'] = _timings(lambda: format_br_float_series(prices, decimals=2, prefix='R$ '), repeat)
+    results['parse_br_series'] = _timings(lambda: parse_br_series(texts), repeat)
+
+    from rank_index import ReRankIndex
+    rerank_index = ReRankIndex(df)
+    results['ReRankIndex[build]'] = _timings(lambda: ReRankIndex(df), repeat)
+    results['ReRankIndex.top_n[20]'] = _timings(lambda: rerank_index.top_n(20, 1_000_000.0), repeat)
+    results['ReRankIndex.top_n[all]'] = _timings(lambda: rerank_index.top_n(n, 0.0), repeat)
+
+    from rebalance import rebalance_universe
+    rng = np.random.default_rng(0)
+    tickers = df['ticker'].to_numpy()
+    target_mask = df['magic_formula_rank'].rank(method='first').to_numpy() <= 20
+    portfolios = [dict(zip(rng.choice(tickers, min(16, n), replace=False), rng.integers(1, 1000, min(16, n)).tolist()))
+                  for _ in range(500)]
+    results['rebalance_universe[500 carteiras]'] = _timings(
+        lambda: rebalance_universe(df, target_mask, portfolios, 'Padrão (100+ ações)', 1_000.0), repeat)
+
+    from api import evaluate_batch, parse_request
+    from rank_index import RankVolumeIndex
+    rank_index = RankVolumeIndex(df)
+    api_requests = [parse_request({'num_empresas': int(rng.integers(5, 40)), 'min_volume': float(rng.choice([0, 1e6, 2e7])),
+                                   'total_investimento': float(rng.choice([1e4, 1e5])), 'tipo_compra': 'padrao'})
+                    for _ in range(1000)]
+    results['api.evaluate_batch[1000 requisições]'] = _timings(lambda: evaluate_batch(df, rank_index, api_requests), repeat)
+
+    from export import iter_csv, iter_xlsx
+    export_columns = list(df.columns)
+    for name, exporter in (('export_csv', iter_csv), ('export_xlsx', iter_xlsx)):
+        results[name] = _timings(lambda: sum(len(chunk) for chunk in exporter(df, export_columns)), repeat)
+
+    columns = app.DEFAULT_SELECTED_COLUMNS_DISPLAY
+    state = {}
+
+    def load():
+        state['raw'] = app.load_raw_data(None)[0]
+
+    def filtered():
+        state['filtered'], state['columns'] = app.update_filtered_data_and_table(n, '0', columns, state['raw'])
+        state['selection'] = list(range(n))
+
+    def page():
+        # update_table_page depende do contexto do Dash e memoiza a página no PIPELINE;
+        # aqui a página é sempre montada por build_table_page
+        df_source = app._get_filtered_frame(state['filtered'])
+        state['page'] = app.build_table_page(df_source, state['columns'], 0, app.TABLE_PAGE_SIZE, [], '')[0]
+        app.page_selected_rows(state['page'], state['selection'])
+
+    def allocation():
+        state['calculated'] = app.update_allocation_and_summary(
+            state['selection'], '1.000.000', 'Fracionário (1+ ações)', None, 'Arredondamento', '', state['filtered'])
+
+    def table():
+        app.update_table_with_calculated_data(state['calculated'][0], state['page'], state['columns'], state['filtered'])
+
+    def cold_pipeline():
+        app.PIPELINE.invalidate([state['raw']['version']])
+
+    def cold_allocation():
+        # Só a alocação é recalculada: o filtro volta ao PIPELINE fora da medida
+        cold_pipeline()
+        filtered()
+
+    results['callback.load_raw_data'] = _timings(load, repeat)
+    results['callback.update_filtered_data_and_table[cold]'] = _timings(filtered, repeat, setup=cold_pipeline)
+    results['callback.update_filtered_data_and_table[warm]'] = _timings(filtered, repeat)
+    results['callback.update_table_page'] = _timings(page, repeat)
+    results['callback.update_allocation_and_summary[cold]'] = _timings(allocation, repeat, setup=cold_allocation)
+    results['callback.update_allocation_and_summary[warm]'] = _timings(allocation, repeat)
+    # O patch da tabela é sempre montado; só a leitura da alocação vem do PIPELINE
+    results['callback.update_table_with_calculated_data'] = _timings(table, repeat)
+    return results
+
+
+def compare(current, baseline, threshold):
+    """Lista de (caso, linhas, referência, atual, razão) com razão > threshold."""
+    reference = {(r['name'], r['rows']): r for r in baseline['results']}
+    regressions = []
+    for result in current['results']:
+        ref = reference.get((result['name'], result['rows']))
+        if ref is None or ref['best'] <= 0:
+            continue
+        ratio = result['best'] / ref['best']
+        result['baseline_best'] = ref['best']
+        result['ratio'] = ratio
+        if ratio > threshold:
+            regressions.append((result['name'], result['rows'], ref['best'], result['best'], ratio))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks do dashboard em universos sintéticos.")
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES)
+    parser.add_argument('--repeat', type=int, default=5, help="Repetições por caso (vale o melhor tempo)")
+    parser.add_argument('--output', default='bench_results.json')
+    parser.add_argument('--compare', help="JSON de referência para apontar regressões")
+    parser.add_argument('--threshold', type=float, default=1.25,
+                        help="Razão atual/referência acima da qual o caso é uma regressão")
+    args = parser.parse_args()
+
+    os.environ.setdefault('MF_HISTORY_DIR', os.path.join(tempfile.gettempdir(), 'mf-bench-history'))
+    import app
+
+    report = {
+        'created_at': datetime.datetime.now().isoformat(timespec='seconds'),
+        'commit': _git_commit(),
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'numpy': np.__version__,
+        'machine': platform.machine(),
+        'cpu_count': os.cpu_count(),
+        'repeat': args.repeat,
+        'results': [],
+    }
+    print(f"{'caso':<45} {'linhas':>8} {'melhor (ms)':>12} {'mediana (ms)':>13}")
+    with tempfile.TemporaryDirectory(prefix='mf-bench-') as workdir:
+        for n in args.sizes:
+            for name, times in run_size(app, n, args.repeat, workdir).items():
+                best, median = min(times), float(np.median(times))
+                report['results'].append({'name': name, 'rows': n, 'best': best, 'median': median, 'times': times})
+                print(f"{name:<45} {n:>8} {best * 1e3:>12.3f} {median * 1e3:>13.3f}")
+
+    regressions = []
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.threshold)
+        report['baseline'] = {'path': args.compare, 'commit': baseline.get('commit'), 'threshold': args.threshold}
+        report['regressions'] = len(regressions)
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=1)
+    print(f"Resultados gravados em {args.output}.")
+
+    if args.compare:
+        if regressions:
+            print(f"\n{len(regressions)} regressão(ões) acima de {args.threshold:.2f}x:")
+            for name, rows, ref, cur, ratio in regressions:
+                print(f"  {name} [{rows} linhas]: {ref * 1e3:.3f}ms -> {cur * 1e3:.3f}ms ({ratio:.2f}x)")
+            sys.exit(1)
+        print(f"Nenhuma regressão acima de {args.threshold:.2f}x em relação a {args.compare}.")
+
+
+if __name__ == '__main__':
+    main()
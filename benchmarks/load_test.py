@@ -0,0 +1,441 @@
+"""
+Teste de carga da cadeia de callbacks do Dash com várias sessões simultâneas.
+
+Cada sessão faz o que o navegador faz: baixa a página, o layout e o grafo de callbacks
+(/_dash-layout e /_dash-dependencies), dispara os callbacks iniciais e segue a cascata
+(as saídas de um callback que são entradas de outro disparam o próximo), sempre com POSTs
+para /_dash-update-component. O roteiro de cada iteração:
+- carregamento da página (callbacks iniciais);
+- arrastar 'num-empresas-slider' (o slider só envia o valor ao soltar: um callback por arrasto);
+- digitar em 'min-volume-input' (sem debounce: um callback por tecla);
+- marcar e desmarcar caixas de seleção da tabela ('selected_rows' da página exibida).
+Os callbacks do lado do cliente (clientside) não passam pelo servidor e são ignorados.
+
+Para cada configuração de workers x threads do gunicorn (`--configs 1x4 2x4`), o script
+sobe o servidor com gunicorn.conf.py em uma porta livre, roda `--sessions` sessões durante
+`--duration` segundos e mede a vazão (requisições/s) e a latência (p50/p95/p99) total e
+por callback (identificado pela primeira saída, e.g. 'filtered-data-store.data'). Com
+`--url`, usa um servidor já em execução em vez de subir um. Erros são contados por tipo
+('HTTP 500', 'ConnectionError'...): o reinício de um worker por MF_MAX_REQUESTS derruba as
+conexões em andamento e aparece como erro de conexão (MF_MAX_REQUESTS=0 desliga o reinício;
+as demais variáveis do gunicorn.conf.py também passam para o servidor).
+
+Uso:
+    python benchmarks/load_test.py --configs 1x4 2x4 4x2 --sessions 8 32 --duration 30
+    python benchmarks/load_test.py --url http://localhost:7860 --sessions 16 --output carga.json
+"""
+import argparse
+import copy
+import datetime
+import json
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import requests
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+DEFAULT_CONFIGS = ['1x4', '2x4', '4x2']
+DEFAULT_SESSIONS = [8]
+
+SLIDER_ID = 'num-empresas-slider'
+MIN_VOLUME_ID = 'min-volume-input'
+TABLE_ID = 'magic-formula-table'
+
+# Valores digitados em 'min-volume-input', tecla a tecla (o callback clientside formata o texto)
+MIN_VOLUMES_TYPED = ['1', '10', '100', '1.000', '10.000', '100.000', '1.000.000', '10.000.000']
+
+
+def _split_outputs(output):
+    # Saída múltipla: '..a.data...b.children..'; saída única: 'a.data'
+    if output.startswith('..'):
+        return output[2:-2].split('...')
+    return [output]
+
+
+def _prop_spec(prop_id):
+    component_id, prop = prop_id.rsplit('.', 1)
+    return {'id': component_id, 'property': prop}
+
+
+def _without_hash(prop_id):
+    # Saídas duplicadas (allow_duplicate) vêm como 'tabela.data@<hash>'
+    return prop_id.split('@')[0]
+
+
+def _apply_patch(value, operations):
+    """Aplica as operações de um dash.Patch (como o dash-renderer) a uma cópia de `value`."""
+    value = copy.deepcopy(value)
+    for op in operations:
+        location, params = op['location'], op['params']
+        if not location:
+            raise ValueError(f"Patch na raiz da propriedade não suportado: {op['operation']}")
+        target = value
+        for key in location[:-1]:
+            target = target[key]
+        key = location[-1]
+        if op['operation'] == 'Assign':
+            target[key] = params['value']
+        elif op['operation'] == 'Merge':
+            target[key].update(params['value'])
+        elif op['operation'] == 'Extend':
+            target[key].extend(params['value'])
+        elif op['operation'] == 'Append':
+            target[key].append(params['value'])
+        elif op['operation'] == 'Prepend':
+            target[key].insert(0, params['value'])
+        elif op['operation'] == 'Insert':
+            target[key].insert(params['index'], params['value'])
+        elif op['operation'] == 'Delete':
+            del target[key]
+        elif op['operation'] == 'Clear':
+            target[key].clear()
+        else:
+            raise ValueError(f"Operação de Patch não suportada: {op['operation']}")
+    return value
+
+
+def _layout_props(node, props):
+    """Propriedades iniciais ('id.prop' -> valor) dos componentes com id do layout (JSON)."""
+    if isinstance(node, list):
+        for child in node:
+            _layout_props(child, props)
+        return props
+    if not isinstance(node, dict) or 'props' not in node:
+        return props
+    component_id = node['props'].get('id')
+    for prop, value in node['props'].items():
+        if prop == 'children':
+            _layout_props(value, props)
+        elif component_id and isinstance(component_id, str) and prop != 'id':
+            props[f"{component_id}.{prop}"] = value
+    return props
+
+
+class CallbackGraph:
+    """Callbacks do servidor (a partir de /_dash-dependencies), sem os clientside."""
+
+    def __init__(self, dependencies):
+        self.callbacks = []
+        for dep in dependencies:
+            if dep.get('clientside_function'):
+                continue
+            outputs = _split_outputs(dep['output'])
+            self.callbacks.append({
+                'output': dep['output'],
+                'outputs': outputs,
+                'props_out': [_without_hash(prop_id) for prop_id in outputs],
+                'inputs': [f"{spec['id']}.{spec['property']}" for spec in dep['inputs']],
+                'state': [f"{spec['id']}.{spec['property']}" for spec in dep['state']],
+                'prevent_initial_call': bool(dep.get('prevent_initial_call')),
+                'name': _without_hash(outputs[0]),
+            })
+
+    def triggered_by(self, prop_id):
+        return [i for i, cb in enumerate(self.callbacks) if prop_id in cb['inputs']]
+
+
+class Session:
+    """Uma sessão de navegador: propriedades dos componentes + cascata de callbacks."""
+
+    def __init__(self, base_url, graph, layout_props, record, think_time=0.0, rng=None):
+        self.base_url = base_url.rstrip('/')
+        self.graph = graph
+        self.layout_props = layout_props
+        self.record = record
+        self.think_time = think_time
+        self.rng = rng or random.Random()
+        self.http = requests.Session()
+        self.props = {}
+
+    def _timed(self, name, method, path, **kwargs):
+        start = time.perf_counter()
+        try:
+            response = self.http.request(method, self.base_url + path, timeout=120, **kwargs)
+            error = None if response.status_code in (200, 204) else f"HTTP {response.status_code}"
+        except requests.RequestException as e:
+            response, error = None, type(e).__name__
+        self.record(name, time.perf_counter() - start, error)
+        return None if error else response
+
+    def _think(self):
+        if self.think_time > 0:
+            time.sleep(self.rng.uniform(0.5, 1.5) * self.think_time)
+
+    def _call(self, cb, changed):
+        def spec(prop_id):
+            return {**_prop_spec(prop_id), 'value': self.props.get(prop_id)}
+
+        outputs = [_prop_spec(prop_id) for prop_id in cb['outputs']]
+        body = {
+            'output': cb['output'],
+            'outputs': outputs if cb['output'].startswith('..') else outputs[0],
+            'inputs': [spec(prop_id) for prop_id in cb['inputs']],
+            'state': [spec(prop_id) for prop_id in cb['state']],
+            'changedPropIds': sorted(changed),
+        }
+        response = self._timed(cb['name'], 'POST', '/_dash-update-component', json=body)
+        if response is None or response.status_code == 204:
+            return set()
+        updated = set()
+        for component_id, props in response.json()['response'].items():
+            for prop, value in props.items():
+                prop_id = f"{component_id}.{prop}"
+                if isinstance(value, dict) and value.get('__dash_patch_update'):
+                    value = _apply_patch(self.props.get(prop_id), value['operations'])
+                self.props[prop_id] = value
+                updated.add(prop_id)
+        return updated
+
+    def _run(self, pending):
+        """Executa os callbacks pendentes ({índice: propriedades alteradas}) e a cascata."""
+        callbacks = self.graph.callbacks
+        while pending:
+            # Como o dash-renderer: só dispara um callback quando nenhuma das suas entradas
+            # ainda vai ser produzida por outro callback pendente
+            waiting = {i: {prop for j in pending if j != i for prop in callbacks[j]['props_out']} for i in pending}
+            ready = [i for i in pending if not set(callbacks[i]['inputs']) & waiting[i]]
+            index = min(ready or pending)
+            changed = pending.pop(index)
+            for prop_id in self._call(callbacks[index], changed):
+                for j in self.graph.triggered_by(prop_id):
+                    if not (j == index and prop_id in callbacks[index]['props_out']):
+                        pending.setdefault(j, set()).add(prop_id)
+
+    def set_prop(self, prop_id, value):
+        """O usuário muda uma propriedade: dispara os callbacks que a têm como entrada."""
+        self.props[prop_id] = value
+        self._run({i: {prop_id} for i in self.graph.triggered_by(prop_id)})
+
+    def page_load(self):
+        self._timed('GET /', 'GET', '/')
+        self._timed('GET /_dash-layout', 'GET', '/_dash-layout')
+        self._timed('GET /_dash-dependencies', 'GET', '/_dash-dependencies')
+        self.props = copy.deepcopy(self.layout_props)
+        self._run({i: set() for i, cb in enumerate(self.graph.callbacks) if not cb['prevent_initial_call']})
+
+    def drag_slider(self, moves=3):
+        for _ in range(moves):
+            self._think()
+            self.set_prop(f'{SLIDER_ID}.value', self.rng.randint(5, 50))
+
+    def type_min_volume(self):
+        self._think()
+        for text in MIN_VOLUMES_TYPED[:self.rng.randint(4, len(MIN_VOLUMES_TYPED))]:
+            self.set_prop(f'{MIN_VOLUME_ID}.value', text)
+
+    def toggle_checkboxes(self, toggles=4):
+        for _ in range(toggles):
+            self._think()
+            rows = len(self.props.get(f'{TABLE_ID}.data') or [])
+            if not rows:
+                return
+            selected = set(self.props.get(f'{TABLE_ID}.selected_rows') or [])
+            selected ^= {self.rng.randrange(rows)}
+            self.set_prop(f'{TABLE_ID}.selected_rows', sorted(selected))
+
+    def iteration(self):
+        self.page_load()
+        self.drag_slider()
+        self.type_min_volume()
+        self.toggle_checkboxes()
+
+
+class Recorder:
+    """Latências e erros (por tipo: 'HTTP 500', 'ConnectionError'...) por nome, seguros entre threads."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = {}
+        self.errors = {}
+        self.error_kinds = {}
+        self.enabled = True
+
+    def __call__(self, name, seconds, error):
+        if not self.enabled:
+            return
+        with self.lock:
+            self.latencies.setdefault(name, []).append(seconds)
+            if error:
+                self.errors[name] = self.errors.get(name, 0) + 1
+                self.error_kinds[error] = self.error_kinds.get(error, 0) + 1
+
+
+def _stats(latencies, errors, elapsed):
+    values = np.array(latencies) * 1e3
+    return {
+        'requests': len(values),
+        'errors': errors,
+        'throughput': len(values) / elapsed,
+        'p50_ms': float(np.percentile(values, 50)),
+        'p95_ms': float(np.percentile(values, 95)),
+        'p99_ms': float(np.percentile(values, 99)),
+        'max_ms': float(values.max()),
+    }
+
+
+def fetch_app(base_url):
+    """(CallbackGraph, propriedades iniciais do layout) do servidor em `base_url`."""
+    dependencies = requests.get(base_url + '/_dash-dependencies', timeout=60).json()
+    layout = requests.get(base_url + '/_dash-layout', timeout=60).json()
+    return CallbackGraph(dependencies), _layout_props(layout, {})
+
+
+def run_load(base_url, sessions, duration, think_time, seed=0):
+    """Roda `sessions` sessões por `duration` segundos; retorna o relatório da rodada."""
+    graph, layout_props = fetch_app(base_url)
+    recorder = Recorder()
+
+    # Uma iteração fora da medição: conexões abertas e caches do servidor aquecidos
+    recorder.enabled = False
+    Session(base_url, graph, layout_props, recorder).iteration()
+    recorder.enabled = True
+
+    deadline = time.perf_counter() + duration
+    iterations = []
+
+    def worker(number):
+        session = Session(base_url, graph, layout_props, recorder, think_time, random.Random(seed + number))
+        done = 0
+        while time.perf_counter() < deadline:
+            session.iteration()
+            done += 1
+        iterations.append(done)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=sessions) as pool:
+        list(pool.map(worker, range(sessions)))
+    elapsed = time.perf_counter() - start
+
+    everything = [value for values in recorder.latencies.values() for value in values]
+    return {
+        'sessions': sessions,
+        'elapsed': elapsed,
+        'iterations': int(sum(iterations)),
+        'total': _stats(everything, sum(recorder.errors.values()), elapsed),
+        'error_kinds': recorder.error_kinds,
+        'by_name': {name: _stats(values, recorder.errors.get(name, 0), elapsed)
+                    for name, values in sorted(recorder.latencies.items())},
+    }
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(workers, threads, log_file, startup_timeout=300):
+    """Sobe o gunicorn (gunicorn.conf.py) com `workers` x `threads`; retorna (processo, URL)."""
+    port = _free_port()
+    env = dict(os.environ, WEB_CONCURRENCY=str(workers), MF_THREADS=str(threads),
+               MF_BIND=f"127.0.0.1:{port}")
+    process = subprocess.Popen([sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'app:server'],
+                               cwd=ROOT, env=env, stdout=log_file, stderr=subprocess.STDOUT)
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + startup_timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"gunicorn terminou com código {process.returncode} (log em {log_file.name})")
+        try:
+            if requests.get(base_url + '/_dash-layout', timeout=5).status_code == 200:
+                return process, base_url
+        except requests.RequestException:
+            pass
+        time.sleep(0.5)
+    stop_server(process)
+    raise RuntimeError(f"gunicorn não respondeu em {startup_timeout}s (log em {log_file.name})")
+
+
+def stop_server(process):
+    process.terminate()
+    try:
+        process.wait(timeout=40)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+
+def _parse_config(text):
+    try:
+        workers, threads = (int(part) for part in text.lower().split('x'))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"configuração deve ser WORKERSxTHREADS (e.g., 2x4): {text!r}") from None
+    return workers, threads
+
+
+def print_round(label, result, by_callback):
+    total = result['total']
+    print(f"{label:<10} {result['sessions']:>7} {result['iterations']:>9} {total['requests']:>8} {total['errors']:>6} "
+          f"{total['throughput']:>8.1f} {total['p50_ms']:>8.1f} {total['p95_ms']:>8.1f} {total['p99_ms']:>8.1f}")
+    if result['error_kinds']:
+        print(f"    erros: {', '.join(f'{kind} ({count})' for kind, count in result['error_kinds'].items())}")
+    if by_callback:
+        for name, stats in result['by_name'].items():
+            print(f"    {name:<40} {stats['requests']:>7} {stats['errors']:>5} {stats['throughput']:>8.1f} "
+                  f"{stats['p50_ms']:>8.1f} {stats['p95_ms']:>8.1f} {stats['p99_ms']:>8.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Teste de carga dos callbacks do Dash com sessões simultâneas.")
+    parser.add_argument('--configs', type=_parse_config, nargs='+', default=[_parse_config(c) for c in DEFAULT_CONFIGS],
+                        help="Configurações WORKERSxTHREADS do gunicorn a comparar")
+    parser.add_argument('--url', help="Servidor já em execução (ignora --configs)")
+    parser.add_argument('--sessions', type=int, nargs='+', default=DEFAULT_SESSIONS,
+                        help="Sessões simultâneas (uma rodada para cada valor)")
+    parser.add_argument('--duration', type=float, default=30.0, help="Segundos de carga por rodada")
+    parser.add_argument('--think', type=float, default=0.0,
+                        help="Pausa média (s) entre as ações de cada sessão; 0 = carga máxima")
+    parser.add_argument('--by-callback', action='store_true', help="Mostra as latências de cada callback")
+    parser.add_argument('--output', help="Grava os resultados em JSON")
+    args = parser.parse_args()
+
+    report = {
+        'created_at': datetime.datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'cpu_count': os.cpu_count(),
+        'duration': args.duration,
+        'think': args.think,
+        'results': [],
+    }
+    targets = [('externo', None)] if args.url else [(f"{w}x{t}", (w, t)) for w, t in args.configs]
+
+    print(f"{'config':<10} {'sessões':>7} {'iterações':>9} {'req.':>8} {'erros':>6} "
+          f"{'req/s':>8} {'p50 (ms)':>8} {'p95 (ms)':>8} {'p99 (ms)':>8}")
+    for label, config in targets:
+        process = None
+        log_file = None
+        try:
+            if config is None:
+                base_url = args.url.rstrip('/')
+            else:
+                log_file = tempfile.NamedTemporaryFile(prefix=f'mf-gunicorn-{label}-', suffix='.log', delete=False)
+                process, base_url = start_server(*config, log_file)
+            for sessions in args.sessions:
+                result = run_load(base_url, sessions, args.duration, args.think)
+                result['config'] = label
+                report['results'].append(result)
+                print_round(label, result, args.by_callback)
+        finally:
+            if process is not None:
+                stop_server(process)
+            if log_file is not None:
+                log_file.close()
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=1)
+        print(f"Resultados gravados em {args.output}.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+"""
+Gera datasets sintéticos no formato do fundamentus_data.csv (mesmas colunas e tipos),
+com qualquer número de linhas, para medir a escala do dashboard.
+
+Uso: python benchmarks/synthetic.py 100000 --output /tmp/fundamentus_100k.csv
+"""
+import argparse
+import string
+
+import numpy as np
+import pandas as pd
+
+COLUMNS = [
+    'ticker', 'empresa', 'setor', 'subsetor', 'roic_clean', 'earnings_yield_clean',
+    'rank_roic', 'rank_ey', 'magic_formula_rank', 'cotacao', 'vol_med_2m', 'pl', 'pvp',
+    'div_yield', 'lpa', '30_dias', '12_meses', 'marg_liquida', 'data_execucao',
+]
+
+SETORES = [
+    'Bens Industriais', 'Comércio', 'Construção e Transporte', 'Consumo Cíclico',
+    'Consumo não Cíclico', 'Energia Elétrica', 'Financeiro e Outros', 'Materiais Básicos',
+    'Petróleo, Gás e Biocombustíveis', 'Saúde', 'Tecnologia da Informação', 'Telecomunicações',
+    'Utilidade Pública', 'Programas e Serviços', 'Mineração', 'Agropecuária',
+]
+SUBSETORES_POR_SETOR = 4
+
+
+def _tickers(rng, n):
+    letters = np.array(list(string.ascii_uppercase))
+    # Quatro letras + número sequencial (garante unicidade em qualquer tamanho) + classe
+    prefix = [''.join(chars) for chars in letters[rng.integers(0, 26, (n, 4))]]
+    classes = rng.choice(['3', '4', '11'], n, p=[0.6, 0.3, 0.1])
+    return [f"{p}{i}{c}" for i, (p, c) in enumerate(zip(prefix, classes))]
+
+
+def generate(n, seed=0, data_execucao='2025-09-01'):
+    """DataFrame sintético com `n` empresas, já ranqueado como o CSV exportado."""
+    rng = np.random.default_rng(seed)
+    setor_idx = rng.integers(0, len(SETORES), n)
+    subsetor_idx = rng.integers(0, SUBSETORES_POR_SETOR, n)
+    setores = np.asarray(SETORES, dtype=object)[setor_idx]
+
+    df = pd.DataFrame({
+        'ticker': _tickers(rng, n),
+        'empresa': [f"EMPRESA {i} ON NM" for i in range(n)],
+        'setor': setores,
+        'subsetor': [f"{setor} - {sub + 1}" for setor, sub in zip(setores, subsetor_idx)],
+        'roic_clean': np.round(rng.lognormal(2.3, 0.9, n), 2),
+        'earnings_yield_clean': np.round(rng.lognormal(2.4, 0.7, n), 3),
+        'cotacao': np.round(rng.lognormal(2.5, 1.0, n), 2),
+        'vol_med_2m': np.where(rng.random(n) < 0.25, 0.0, np.round(rng.lognormal(15, 2.5, n))),
+        'pl': np.round(rng.normal(12, 20, n), 2),
+        'pvp': np.round(rng.lognormal(0.2, 0.8, n), 2),
+        'div_yield': np.round(np.clip(rng.normal(5, 4, n), 0, None), 2),
+        'lpa': np.round(rng.normal(1.5, 3, n), 2),
+        '30_dias': np.round(rng.normal(0, 8, n), 2),
+        '12_meses': np.round(rng.normal(8, 35, n), 2),
+        'marg_liquida': np.round(rng.normal(10, 30, n), 1),
+        'data_execucao': data_execucao,
+    })
+    df['rank_roic'] = df['roic_clean'].rank(ascending=False, method='min').astype(int)
+    df['rank_ey'] = df['earnings_yield_clean'].rank(ascending=False, method='min').astype(int)
+    df['magic_formula_rank'] = df['rank_roic'] + df['rank_ey']
+    df = df.sort_values('magic_formula_rank', kind='stable').reset_index(drop=True)
+    return df[COLUMNS]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Gera um fundamentus_data.csv sintético.")
+    parser.add_argument('rows', type=int)
+    parser.add_argument('--output', default='fundamentus_synthetic.csv')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    generate(args.rows, args.seed).to_csv(args.output, index=False)
+    print(f"{args.rows} linhas gravadas em {args.output}.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,247 @@
+import collections
+import hashlib
+import os
+import threading
+import time
+
+from snapshot_diff import diff_frames
+
+
+class _CacheEntry:
+    """
+    Valor carregado junto com a assinatura dos arquivos que o originaram.
+    A entrada é imutável: uma recarga cria uma nova entrada e troca a referência.
+    """
+    __slots__ = ('signature', 'value', 'version', 'loaded_at', 'derived', 'diff')
+
+    def __init__(self, signature, value):
+        self.signature = signature
+        self.value = value
+        self.derived = {}
+        self.diff = None
+        self.version = hashlib.sha1(repr(signature).encode('utf-8')).hexdigest()[:12]
+        self.loaded_at = time.time()
+
+
+class DatasetCache:
+    """
+    Cache de processo para o dataset lido do disco.
+
+    A cada acesso, compara a assinatura (mtime + tamanho) dos arquivos monitorados
+    com a da última carga. Se nada mudou, devolve o valor em memória (hit); se algum
+    arquivo mudou, recarrega uma única vez sob lock e troca a entrada de forma atômica.
+
+    Com `frame_of` (função que extrai o DataFrame do valor carregado), cada recarga é
+    comparada com a versão anterior por ticker (snapshot_diff.diff_frames), e as estruturas
+    derivadas cujas colunas de origem não mudaram passam para a nova versão sem serem
+    reconstruídas. As últimas `keep_versions` versões substituídas continuam acessíveis
+    pela versão, para que sessões iniciadas antes da recarga terminem sobre os mesmos dados.
+
+    Caches que dependem da versão (e.g., o pipeline.StagedPipeline do app) se registram
+    com `on_reload()` para descartar o que foi calculado sobre versões que saíram do cache.
+
+    `watch_interval` (segundos) liga uma thread que verifica os arquivos periodicamente e
+    recarrega fora das requisições; em cada processo (e.g., worker do gunicorn após o fork)
+    a thread é iniciada no primeiro acesso.
+    """
+
+    def __init__(self, paths, loader, frame_of=None, keep_versions=2, watch_interval=0):
+        self.paths = [paths] if isinstance(paths, str) else list(paths)
+        self._loader = loader
+        self._frame_of = frame_of
+        self._lock = threading.Lock()
+        self._entry = None
+        self._retired = collections.OrderedDict()
+        self._keep_versions = keep_versions
+        self._derived_columns = {}
+        self._watch_interval = watch_interval
+        self._watcher_pid = None
+        self._watcher_thread = None
+        self._watcher_wakeup = threading.Event()
+        self._reload_listeners = []
+        self.hits = 0
+        self.misses = 0
+        self.reloads = 0
+        self.derived_reused = 0
+        self.derived_rebuilt = 0
+
+    def _signature(self):
+        signature = []
+        for path in self.paths:
+            try:
+                st = os.stat(path)
+                signature.append((path, st.st_mtime_ns, st.st_size))
+            except OSError:
+                signature.append((path, None, None))
+        return tuple(signature)
+
+    def _current_entry(self):
+        if self._watch_interval and self._watcher_pid != os.getpid():
+            self._start_watcher()
+        signature = self._signature()
+        entry = self._entry
+        if entry is not None and entry.signature == signature:
+            self.hits += 1
+            return entry
+
+        with self._lock:
+            # Outra thread pode ter recarregado enquanto esperávamos o lock
+            entry = self._entry
+            if entry is not None and entry.signature == signature:
+                self.hits += 1
+                return entry
+
+            new_entry = _CacheEntry(signature, self._loader())
+            dropped = []
+            if entry is None:
+                self.misses += 1
+            else:
+                self.reloads += 1
+                self._carry_over(entry, new_entry)
+                self._retired[entry.version] = entry
+                while len(self._retired) > self._keep_versions:
+                    dropped.append(self._retired.popitem(last=False)[0])
+            # Troca atômica: quem já tem a entrada anterior termina sobre ela
+            self._entry = new_entry
+
+        if entry is not None:
+            self._notify_reload(new_entry.version, dropped)
+        return new_entry
+
+    def on_reload(self, listener):
+        """
+        Registra `listener(nova_versão, versões_descartadas)`, chamado após cada recarga
+        (fora do lock) e em `invalidate()` (com nova_versão None). As versões descartadas
+        são as que deixaram de ser acessíveis; a versão substituída continua retida.
+        """
+        self._reload_listeners.append(listener)
+
+    def _notify_reload(self, version, dropped):
+        for listener in self._reload_listeners:
+            try:
+                listener(version, dropped)
+            except Exception as e:
+                print(f"Erro ao notificar recarga dos dados: {e}")
+
+    def _carry_over(self, old_entry, new_entry):
+        """Compara a nova versão com a anterior e reaproveita as derivadas ainda válidas."""
+        if self._frame_of is None:
+            return
+        try:
+            new_entry.diff = diff_frames(self._frame_of(old_entry.value), self._frame_of(new_entry.value))
+        except (KeyError, TypeError, ValueError):
+            return
+        for name, derived in old_entry.derived.items():
+            columns = self._derived_columns.get(name)
+            if columns is not None and new_entry.diff.unchanged(columns):
+                new_entry.derived[name] = derived
+                self.derived_reused += 1
+
+    def _start_watcher(self):
+        with self._lock:
+            if self._watcher_pid == os.getpid():
+                return
+            self._watcher_pid = os.getpid()
+        thread = threading.Thread(target=self._watch, name='dataset-cache-watcher', daemon=True)
+        self._watcher_thread = thread
+        thread.start()
+
+    def stop_watcher(self):
+        """
+        Encerra a thread de verificação deste processo e espera por ela. Usado antes do fork
+        dos workers (gunicorn com preload): cada worker inicia a sua no primeiro acesso.
+        """
+        thread = self._watcher_thread
+        self._watcher_pid = None
+        self._watcher_thread = None
+        if thread is not None and thread.is_alive():
+            self._watcher_wakeup.set()
+            thread.join()
+        self._watcher_wakeup.clear()
+
+    def _watch(self):
+        pid = os.getpid()
+        while self._watcher_pid == pid:
+            self._watcher_wakeup.wait(self._watch_interval)
+            if self._watcher_pid != pid:
+                break
+            entry = self._entry
+            if entry is not None and entry.signature == self._signature():
+                continue
+            try:
+                self._current_entry()
+            except Exception as e:
+                print(f"Erro ao recarregar dados: {e}")
+
+    def _entry_for(self, version):
+        entry = self._entry
+        if version is not None:
+            if entry is not None and entry.version == version:
+                return entry
+            retired = self._retired.get(version)
+            if retired is not None:
+                return retired
+        return self._current_entry()
+
+    def get(self):
+        """Retorna o valor carregado, recarregando se os arquivos mudaram."""
+        return self._current_entry().value
+
+    def get_versioned(self, version=None):
+        """
+        Retorna (valor, versão) lidos da mesma entrada, sem corrida com uma recarga.
+        Com `version`, devolve essa versão enquanto ela estiver retida; senão, a atual.
+        """
+        entry = self._entry_for(version)
+        return entry.value, entry.version
+
+    def get_derived(self, name, builder, columns=None, version=None):
+        """
+        Estrutura derivada do valor carregado (e.g., índices), construída uma única vez
+        por versão com `builder(valor)`. Retorna (estrutura, versão).
+
+        `columns` declara as colunas das quais a estrutura depende: se uma recarga não
+        alterar nenhuma delas (nem a posição das linhas), a estrutura é reaproveitada na
+        nova versão. Sem `columns`, ela é reconstruída a cada recarga.
+        """
+        if columns is not None:
+            self._derived_columns[name] = tuple(columns)
+        entry = self._entry_for(version)
+        if name not in entry.derived:
+            with self._lock:
+                if name not in entry.derived:
+                    entry.derived[name] = builder(entry.value)
+                    self.derived_rebuilt += 1
+        return entry.derived[name], entry.version
+
+    @property
+    def version(self):
+        """Identificador curto da versão atualmente carregada (derivado da assinatura)."""
+        return self._current_entry().version
+
+    def invalidate(self):
+        """Descarta a entrada atual; o próximo acesso recarrega do disco."""
+        with self._lock:
+            dropped = list(self._retired)
+            if self._entry is not None:
+                dropped.append(self._entry.version)
+            self._entry = None
+            self._retired.clear()
+        self._notify_reload(None, dropped)
+
+    def stats(self):
+        """Contadores de uso do cache (hits, misses, reloads) e versão carregada."""
+        entry = self._entry
+        total = self.hits + self.misses + self.reloads
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'reloads': self.reloads,
+            'hit_rate': self.hits / total if total else 0.0,
+            'version': entry.version if entry is not None else None,
+            'loaded_at': entry.loaded_at if entry is not None else None,
+            'retained_versions': list(self._retired),
+            'derived_reused': self.derived_reused,
+            'derived_rebuilt': self.derived_rebuilt,
+            'last_diff': entry.diff.summary() if entry is not None and entry.diff is not None else None,
+        }
@@ -0,0 +1,126 @@
+"""
+Schema explícito das colunas do dataset, aplicado na carga (CSV, snapshot e histórico).
+
+O pandas lê o CSV com os tipos padrão: texto como objetos Python e todos os números em
+64 bits. O schema deixa o DataFrame residente compacto:
+- setor e subsetor viram category (poucos valores distintos: códigos + uma cópia de cada
+  texto). Ticker e empresa continuam texto: são quase únicos em cada data;
+- métricas (ROIC, EY, P/L, retornos etc.) viram float32: os valores do Fundamentus têm
+  duas casas decimais, bem dentro da precisão de 7 dígitos;
+- cotação, volume e colunas de alocação continuam float64 (entram em somas de dinheiro);
+- ranks viram int16 ou int32 (o menor que comporta os valores; float32 se houver vazios);
+- o índice do DataFrame passa a ser o ticker (sem nome, para não conflitar com a coluna),
+  para consultas como df.loc['PETR4']. As posições (df.iloc) continuam as do arquivo.
+
+Os nomes do cabeçalho são normalizados antes (e.g., '30_dias' -> '_30_dias', o nome usado
+em ALL_COLUMNS_MAP). Aplicar o schema a um DataFrame que já está nos tipos certos não
+copia as colunas: snapshots compilados continuam mapeados em memória.
+
+Uso (relatório de memória antes/depois, com o universo replicado N vezes como N datas):
+    python dataset_schema.py fundamentus_data.csv --scale 100
+"""
+import argparse
+
+import numpy as np
+import pandas as pd
+
+# Nomes do cabeçalho do CSV (ingest.py) que não são identificadores válidos de coluna no app
+COLUMN_RENAMES = {'30_dias': '_30_dias', '12_meses': '_12_meses'}
+
+CATEGORY_COLUMNS = ['setor', 'subsetor']
+FLOAT32_COLUMNS = [
+    'roic_clean', 'earnings_yield_clean', 'pl', 'pvp', 'div_yield', 'lpa', '_30_dias', '_12_meses',
+    'marg_liquida',
+]
+FLOAT64_COLUMNS = ['cotacao', 'vol_med_2m', 'valor_alocado', 'qtd_acoes', 'peso_carteira']
+RANK_COLUMNS = ['rank_roic', 'rank_ey', 'magic_formula_rank']
+
+
+def _rank_dtype(series):
+    if series.dtype in (np.int16, np.int32):
+        return series.dtype
+    values = pd.to_numeric(series, errors='coerce')
+    if values.isna().any():
+        return np.float32
+    if values.empty or (values.min() >= np.iinfo(np.int16).min and values.max() <= np.iinfo(np.int16).max):
+        return np.int16
+    return np.int32
+
+
+def apply_schema(df):
+    """DataFrame com os nomes normalizados, os tipos do schema e o índice de tickers."""
+    df = df.rename(columns={old: new for old, new in COLUMN_RENAMES.items() if old in df.columns})
+    columns = {}
+    for col in CATEGORY_COLUMNS:
+        if col in df.columns and not isinstance(df[col].dtype, pd.CategoricalDtype):
+            columns[col] = df[col].astype('category')
+    for cols, dtype_of in ((FLOAT32_COLUMNS, lambda s: np.float32), (FLOAT64_COLUMNS, lambda s: np.float64),
+                           (RANK_COLUMNS, _rank_dtype)):
+        for col in cols:
+            if col in df.columns:
+                dtype = dtype_of(df[col])
+                if df[col].dtype != dtype:
+                    columns[col] = pd.to_numeric(df[col], errors='coerce').astype(dtype)
+    if columns:
+        df = df.assign(**columns)
+    if 'ticker' in df.columns:
+        df.index = pd.Index(df['ticker'].to_numpy(), name=None)
+    return df
+
+
+def widen_float32(values):
+    """
+    float32 -> float64 pela menor representação decimal (np.float32(48.9) -> 48.9, e não
+    48.900001525878906), para saídas em que o número aparece como está (JSON, CSV/XLSX sem
+    formatação). Outros tipos voltam como vieram.
+    """
+    values = np.asarray(values)
+    if values.dtype != np.float32:
+        return values
+    return values.astype(str).astype(np.float64)
+
+
+def _memory_usage(df):
+    # O índice de tickers aponta para os mesmos textos da coluna 'ticker': conta só os ponteiros
+    usage = df.memory_usage(deep=True, index=False)
+    return pd.concat([pd.Series({'Index': df.index.memory_usage(deep=False)}), usage])
+
+
+def memory_report(before, after):
+    """Bytes por coluna (memory_usage com deep=True) antes e depois do schema, mais o índice e o total."""
+    usage_before = _memory_usage(before)
+    usage_after = _memory_usage(after)
+    usage_before.index = [COLUMN_RENAMES.get(col, col) for col in usage_before.index]
+    report = pd.DataFrame({'antes': usage_before, 'depois': usage_after}).fillna(0).astype(np.int64)
+    report['tipo_antes'] = pd.Series({COLUMN_RENAMES.get(col, col): str(dtype) for col, dtype in before.dtypes.items()})
+    report['tipo_depois'] = pd.Series({col: str(dtype) for col, dtype in after.dtypes.items()})
+    report[['tipo_antes', 'tipo_depois']] = report[['tipo_antes', 'tipo_depois']].fillna('')
+    report.loc['total'] = [report['antes'].sum(), report['depois'].sum(), '', '']
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Memória do dataset com os tipos padrão do pandas e com o schema.")
+    parser.add_argument('csv_path', nargs='?', default='fundamentus_data.csv')
+    parser.add_argument('--scale', type=int, default=1,
+                        help="Replica o universo N vezes (como N datas) antes de medir")
+    args = parser.parse_args()
+
+    from snapshot import read_fundamentus_csv
+    before = read_fundamentus_csv(args.csv_path, typed=False)
+    if args.scale > 1:
+        before = pd.concat([before] * args.scale, ignore_index=True)
+    after = apply_schema(before)
+
+    report = memory_report(before, after)
+    print(f"{len(before)} linhas")
+    print(f"{'coluna':<22} {'antes (KB)':>12} {'depois (KB)':>12}  tipos")
+    for col, row in report.iterrows():
+        types = f"{row['tipo_antes']} -> {row['tipo_depois']}" if row['tipo_antes'] else ''
+        print(f"{col:<22} {row['antes'] / 1024:>12.1f} {row['depois'] / 1024:>12.1f}  {types}")
+    total_before, total_after = report.loc['total', 'antes'], report.loc['total', 'depois']
+    print(f"Redução: {1 - total_after / total_before:.0%} ({total_before / total_after:.1f}x menor)")
+
+
+if __name__ == '__main__':
+    main()
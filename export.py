@@ -0,0 +1,199 @@
+"""
+Exportação em streaming de DataFrames para CSV e XLSX.
+
+Os geradores produzem o arquivo em blocos de `chunk_size` linhas: a resposta HTTP começa
+a ser enviada antes de todo o arquivo existir, e a memória usada não cresce com o número
+de linhas (além do próprio DataFrame, que já está no servidor).
+
+Com `formatters` ({coluna: função que recebe a pd.Series}), os valores saem como texto no
+padrão brasileiro (as mesmas funções de FORMATTING_RULES, em app.py); no CSV o separador
+passa a ser ';', como o Excel em português espera. Sem formatação, os números saem como
+números (CSV com ',' e ponto decimal; XLSX com células numéricas).
+
+O XLSX é escrito diretamente (SpreadsheetML mínimo dentro de um zip), sem depender de
+openpyxl/xlsxwriter, que montam a planilha inteira antes de gravar.
+"""
+import csv
+import io
+import math
+import zipfile
+from xml.sax.saxutils import escape
+
+import numpy as np
+import pandas as pd
+
+from dataset_schema import widen_float32
+
+CSV_MIMETYPE = 'text/csv'
+XLSX_MIMETYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+DEFAULT_CHUNK_SIZE = 5000
+
+
+def _chunk_columns(chunk, columns, formatters):
+    """Colunas do bloco como listas de valores prontos para escrita (None = vazio)."""
+    values = []
+    for col_id in columns:
+        series = chunk[col_id]
+        if formatters and col_id in formatters:
+            values.append(list(formatters[col_id](series)))
+        else:
+            if series.dtype == np.float32:
+                # 48.9 em float32 sai como 48.9, e não 48.900001525878906
+                series = pd.Series(widen_float32(series.to_numpy()), index=series.index)
+            if series.hasnans:
+                values.append(series.astype(object).where(series.notna(), None).tolist())
+            else:
+                values.append(series.tolist())
+    return values
+
+
+def _chunks(df, chunk_size):
+    for start in range(0, len(df), chunk_size):
+        yield df.iloc[start:start + chunk_size]
+
+
+# --- CSV ---
+
+class _LineBuffer:
+    """Destino do csv.writer que acumula o texto até o bloco ser enviado."""
+
+    def __init__(self):
+        self._parts = []
+
+    def write(self, text):
+        self._parts.append(text)
+
+    def drain(self):
+        text = ''.join(self._parts)
+        self._parts.clear()
+        return text
+
+
+def iter_csv(df, columns, headers=None, formatters=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Gera o CSV de `df[columns]` em blocos de bytes (UTF-8 com BOM, para o Excel reconhecer
+    os acentos). `headers` são os títulos das colunas (padrão: os próprios ids).
+    """
+    buffer = _LineBuffer()
+    writer = csv.writer(buffer, delimiter=';' if formatters else ',', lineterminator='\r\n')
+    writer.writerow(headers or columns)
+    yield ('\ufeff' + buffer.drain()).encode('utf-8')
+
+    for chunk in _chunks(df, chunk_size):
+        values = _chunk_columns(chunk, columns, formatters)
+        writer.writerows(zip(*values))
+        yield buffer.drain().encode('utf-8')
+
+
+# --- XLSX ---
+
+_CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/xl/workbook.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+    '<Override PartName="/xl/worksheets/sheet1.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+    '</Types>'
+)
+_ROOT_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+    'Target="xl/workbook.xml"/>'
+    '</Relationships>'
+)
+_WORKBOOK = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+    'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+    '<sheets><sheet name="{name}" sheetId="1" r:id="rId1"/></sheets>'
+    '</workbook>'
+)
+_WORKBOOK_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+    'Target="worksheets/sheet1.xml"/>'
+    '</Relationships>'
+)
+_SHEET_START = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+)
+_SHEET_END = '</sheetData></worksheet>'
+
+
+class _ZipStream(io.RawIOBase):
+    """
+    Arquivo só de escrita e sem seek: o zipfile passa a gravar cada membro com data
+    descriptor, e os bytes já escritos podem ser enviados e descartados a qualquer momento.
+    """
+
+    def __init__(self):
+        self._parts = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._parts.append(bytes(data))
+        return len(data)
+
+    def drain(self):
+        data = b''.join(self._parts)
+        self._parts.clear()
+        return data
+
+
+def _xlsx_cell(value):
+    if value is None:
+        return '<c/>'
+    if isinstance(value, bool):
+        return f'<c t="b"><v>{int(value)}</v></c>'
+    if isinstance(value, (int, float)):
+        if isinstance(value, float) and not math.isfinite(value):
+            return '<c/>'
+        return f'<c><v>{value!r}</v></c>'
+    if isinstance(value, pd.Timestamp):
+        value = value.strftime('%Y-%m-%d')
+    return f'<c t="inlineStr"><is><t>{escape(str(value))}</t></is></c>'
+
+
+def _xlsx_row(number, values):
+    return f'<row r="{number}">' + ''.join(_xlsx_cell(value) for value in values) + '</row>'
+
+
+def iter_xlsx(df, columns, headers=None, formatters=None, chunk_size=DEFAULT_CHUNK_SIZE, sheet_name='Dados'):
+    """Gera o XLSX de `df[columns]` (uma planilha) em blocos de bytes."""
+    stream = _ZipStream()
+    with zipfile.ZipFile(stream, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr('[Content_Types].xml', _CONTENT_TYPES)
+        archive.writestr('_rels/.rels', _ROOT_RELS)
+        archive.writestr('xl/workbook.xml', _WORKBOOK.format(name=escape(sheet_name, {'"': '&quot;'})))
+        archive.writestr('xl/_rels/workbook.xml.rels', _WORKBOOK_RELS)
+        yield stream.drain()
+
+        with archive.open('xl/worksheets/sheet1.xml', 'w', force_zip64=True) as sheet:
+            sheet.write((_SHEET_START + _xlsx_row(1, headers or columns)).encode('utf-8'))
+            row_number = 2
+            for chunk in _chunks(df, chunk_size):
+                rows = zip(*_chunk_columns(chunk, columns, formatters))
+                parts = []
+                for values in rows:
+                    parts.append(_xlsx_row(row_number, values))
+                    row_number += 1
+                sheet.write(''.join(parts).encode('utf-8'))
+                yield stream.drain()
+            sheet.write(_SHEET_END.encode('utf-8'))
+    yield stream.drain()
+
+
+EXPORTERS = {
+    'csv': (iter_csv, CSV_MIMETYPE),
+    'xlsx': (iter_xlsx, XLSX_MIMETYPE),
+}
@@ -0,0 +1,243 @@
+import functools
+import re
+
+import numpy as np
+import pandas as pd
+
+# --- Funções Auxiliares para Formatação e Leitura de Números BR ---
+def format_thousands(number):
+    """
+    Formata um número inteiro com ponto como separador de milhares.
+    Ex: 1234567 -> '1.234.567'
+    """
+    s = str(abs(int(number)))
+    parts = []
+    while s:
+        parts.append(s[-3:])
+        s = s[:-3]
+    return ('' if number >= 0 else '-') + '.'.join(reversed(parts))
+
+def format_br_float(value, decimals=2):
+    """
+    Formata um float em uma string com o padrão BR (ponto para milhares, vírgula para decimal).
+    Ex: 12345.67 -> '12.345,67'
+    """
+    if pd.isna(value) or value is None:
+        return ""
+    
+    sign = '-' if value < 0 else ''
+    abs_value = abs(value)
+
+    integer_part = int(abs_value)
+    
+    formatted_integer = format_thousands(integer_part)
+
+    if decimals > 0:
+        frac_str = f"{abs_value - integer_part:.{decimals}f}".split('.')[-1]
+        if frac_str == f"{0:0{decimals}d}":
+            frac_str = '0' * decimals
+        
+        return f"{sign}{formatted_integer},{frac_str}"
+    else:
+        return f"{sign}{formatted_integer}"
+
+def format_br_int(value):
+    """
+    Formata um número (inteiro ou float) em uma string com o padrão BR (ponto para milhares).
+    Ex: 20000000 -> '20.000.000'
+    """
+    if pd.isna(value) or value is None:
+        return ""
+    return format_thousands(int(value))
+
+def parse_br_number(text_input):
+    """
+    Converte uma string formatada no padrão BR (ponto para milhares, vírgula para decimal)
+    em um float. Retorna 0.0 se a entrada for vazia ou inválida.
+    """
+    if not isinstance(text_input, str):
+        return float(text_input) if pd.notna(text_input) else 0.0
+    if not text_input.strip():
+        return 0.0
+    cleaned_text = text_input.replace('.', '')
+    cleaned_text = cleaned_text.replace(',', '.')
+    try:
+        return float(cleaned_text)
+    except ValueError:
+        print(f"Erro de conversão: '{text_input}' não pode ser convertido para número. Retornando 0.0.")
+        return 0.0
+
+
+# Texto no padrão BR: milhares com ponto (e.g., "20.000.000") ou decimal com vírgula
+_BR_NUMBER = re.compile(r'^[+-]?(\d{1,3}(\.\d{3})+|\d+)(,\d*)?$')
+_BR_THOUSANDS = re.compile(r'^[+-]?\d{1,3}(\.\d{3})+(,|$)')
+
+def parse_number_text(text):
+    """
+    Converte um número digitado no padrão BR ("20.000.000", "1.234,56", "10,5") ou com ponto
+    decimal ("10.5", "1e6"). Grupos de 3 dígitos depois de pontos são milhares: "1.000" é mil
+    e "10.500" dez mil e quinhentos. Levanta ValueError se o texto não for um número.
+    """
+    text = str(text).strip()
+    if ',' in text or _BR_THOUSANDS.match(text):
+        if not _BR_NUMBER.match(text):
+            raise ValueError(f"Número inválido: {text!r}")
+        return float(text.replace('.', '').replace(',', '.'))
+    return float(text)
+
+def parse_br_series(values, default=0.0, percent=False):
+    """
+    Versão vetorizada de parse_br_number para uma coluna inteira de strings no padrão BR.
+    Entradas vazias ou inválidas viram `default` (0.0, como na versão escalar; use np.nan
+    para manter a ausência). Com percent=True, aceita também o sufixo '%' (e.g., '12,5%').
+    """
+    series = pd.Series(values)
+    if pd.api.types.is_numeric_dtype(series):
+        return series.astype(float).fillna(default)
+
+    # Conversão direta do array (rápida); se houver texto inválido, cai no to_numeric com coerção
+    # (float() já ignora espaços nas pontas)
+    if percent:
+        text = [_BR_MISSING if v is None else v.strip().rstrip('%').replace('.', '').replace(',', '.')
+                if isinstance(v, str) else v for v in series.tolist()]
+    else:
+        text = [_BR_MISSING if v is None else v.replace('.', '').replace(',', '.')
+                if isinstance(v, str) else v for v in series.tolist()]
+    text = np.array(text, dtype=object)
+    try:
+        parsed = text.astype(float)
+    except (TypeError, ValueError):
+        parsed = pd.to_numeric(pd.Series(text), errors='coerce').to_numpy(dtype=float)
+    return pd.Series(parsed, index=series.index).fillna(default)
+
+
+_BR_MISSING = float('nan')
+
+
+# --- Formatação por coluna (vetorizada) ---
+# Acima deste valor a parte inteira deixa de ser exata em float64/int64:
+# esses elementos são formatados pelo caminho escalar do Python.
+_MAX_EXACT_INTEGER = 2 ** 53
+
+# Tabelas de grupos de milhar: o primeiro grupo sem zeros à esquerda, os demais com 3 dígitos
+_LEADING_GROUPS = np.array([str(i) for i in range(1000)])
+_PADDED_GROUPS = np.array([f"{i:03d}" for i in range(1000)])
+
+
+def _as_float_array(values):
+    return pd.to_numeric(pd.Series(values), errors='raise').to_numpy(dtype=float)
+
+
+def _thousands_strings(integers):
+    """
+    Equivalente vetorizado de format_thousands para inteiros não negativos (int64):
+    monta cada grupo de 3 dígitos por consulta em tabela e concatena com np.char.add.
+    """
+    n_groups = np.ones(integers.shape, dtype=np.int64)
+    limit = 1000
+    while limit <= _MAX_EXACT_INTEGER:
+        n_groups += integers >= limit
+        limit *= 1000
+
+    out = np.empty(integers.shape, dtype='<U24')
+    for ng in np.unique(n_groups).tolist():
+        mask = n_groups == ng
+        vals = integers[mask]
+        text = _LEADING_GROUPS[vals // 1000 ** (ng - 1) % 1000]
+        for j in range(ng - 2, -1, -1):
+            text = np.char.add(np.char.add(text, '.'), _PADDED_GROUPS[vals // 1000 ** j % 1000])
+        out[mask] = text
+    return out
+
+
+@functools.lru_cache(maxsize=None)
+def _digit_table(decimals):
+    return np.array([f"{i:0{decimals}d}" for i in range(10 ** decimals)])
+
+
+def _frac_digits(frac, decimals):
+    """
+    Dígitos decimais de `frac` (0 <= frac < 1) como f"{frac:.{decimals}f}" geraria,
+    inclusive quando o arredondamento resulta em "1.00" (os dígitos ficam "00").
+    Só os valores a um fio de distância do meio-termo passam pela formatação do Python.
+    """
+    scale = 10 ** decimals
+    scaled = frac * scale
+    digits = np.floor(scaled + 0.5).astype(np.int64) % scale
+    near_half = np.flatnonzero(np.abs(scaled - np.floor(scaled) - 0.5) < 1e-6)
+    for i in near_half:
+        digits[i] = int(f"{frac[i]:.{decimals}f}".split('.')[-1])
+    return _digit_table(decimals)[digits]
+
+
+def _fill_result(result, valid, text, prefix, suffix):
+    if prefix:
+        text = np.char.add(prefix, text)
+    if suffix:
+        text = np.char.add(text, suffix)
+    if valid.all():
+        return text.astype(object)
+    result[valid] = text.astype(object)
+    return result
+
+
+def format_br_float_series(values, decimals=2, prefix='', suffix=''):
+    """
+    Formata uma coluna inteira no padrão BR (ponto para milhares, vírgula para decimal).
+    Equivale a aplicar f"{prefix}{format_br_float(x, decimals)}{suffix}" em cada valor,
+    mas monta sinal, milhares e casas decimais com operações vetorizadas do NumPy.
+    Valores ausentes viram f"{prefix}{suffix}", como na versão escalar.
+    """
+    index = values.index if isinstance(values, pd.Series) else None
+    arr = _as_float_array(values)
+    result = np.full(arr.shape, prefix + suffix, dtype=object)
+
+    valid = ~np.isnan(arr)
+    if not valid.any():
+        return pd.Series(result, index=index, dtype=object)
+
+    v = arr[valid]
+    abs_v = np.abs(v)
+    if not np.isfinite(abs_v).all() or (abs_v >= _MAX_EXACT_INTEGER).any():
+        # Fora da faixa exata: mantém o comportamento do formatador escalar
+        result[valid] = [f"{prefix}{format_br_float(x, decimals=decimals)}{suffix}" for x in v.tolist()]
+        return pd.Series(result, index=index, dtype=object)
+
+    integer_part = np.trunc(abs_v)
+    text = np.char.add(np.where(v < 0, '-', ''), _thousands_strings(integer_part.astype(np.int64)))
+    if decimals > 0:
+        text = np.char.add(np.char.add(text, ','), _frac_digits(abs_v - integer_part, decimals))
+
+    result = _fill_result(result, valid, text, prefix, suffix)
+    return pd.Series(result, index=index, dtype=object)
+
+
+def format_br_int_series(values, prefix='', suffix=''):
+    """
+    Versão por coluna de f"{prefix}{format_br_int(x)}{suffix}": trunca para inteiro
+    e usa ponto como separador de milhares. Valores ausentes viram f"{prefix}{suffix}".
+    """
+    index = values.index if isinstance(values, pd.Series) else None
+    arr = _as_float_array(values)
+    result = np.full(arr.shape, prefix + suffix, dtype=object)
+
+    valid = ~np.isnan(arr)
+    if not valid.any():
+        return pd.Series(result, index=index, dtype=object)
+
+    v = arr[valid]
+    if not np.isfinite(v).all() or (np.abs(v) >= _MAX_EXACT_INTEGER).any():
+        result[valid] = [f"{prefix}{format_br_int(x)}{suffix}" for x in v.tolist()]
+        return pd.Series(result, index=index, dtype=object)
+
+    integers = np.trunc(v).astype(np.int64)
+    text = np.char.add(np.where(integers < 0, '-', ''), _thousands_strings(np.abs(integers)))
+    result = _fill_result(result, valid, text, prefix, suffix)
+    return pd.Series(result, index=index, dtype=object)
+
+
+def format_br_date_series(values):
+    """Datas como 'dd/mm/aaaa'; valores ausentes viram 'N/A'."""
+    index = values.index if isinstance(values, pd.Series) else None
+    dates = pd.to_datetime(pd.Series(values, index=index))
+    return dates.dt.strftime('%d/%m/%Y').fillna('N/A').astype(object)
@@ -0,0 +1,67 @@
+"""
+Configuração do gunicorn para o dashboard: gunicorn -c gunicorn.conf.py app:server
+
+Com preload (padrão), o app é importado uma única vez no master, que carrega o dataset,
+monta o índice de ranking e executa os callbacks mais usados (app.warm_up) antes de criar
+os workers. Os workers nascem por fork e herdam esses objetos: as páginas de memória
+ficam compartilhadas (copy-on-write) enquanto ninguém as altera, então o dataset ocupa
+memória uma vez, e não uma vez por worker. O snapshot colunar (snapshot.py), quando
+compilado, já é aberto com memory-map e também é compartilhado pelo page cache.
+
+Variáveis de ambiente:
+- PORT: porta (padrão 7860); MF_BIND sobrescreve o endereço completo.
+- WEB_CONCURRENCY: número de workers (padrão: um por CPU, entre 2 e 4).
+- MF_THREADS: threads por worker (padrão 4; os callbacks liberam o GIL no pandas/numpy e
+  esperam I/O do PIPELINE em disco).
+- MF_PRELOAD=0: desliga o preload; cada worker importa o app e se aquece sozinho.
+- MF_WARM_UP=0: pula o aquecimento.
+"""
+import gc
+import multiprocessing
+import os
+
+bind = os.environ.get('MF_BIND', f"0.0.0.0:{os.environ.get('PORT', '7860')}")
+
+# Callbacks com pandas são limitados por CPU: um worker por CPU; as threads cobrem as
+# requisições pequenas (assets, callbacks de interface) enquanto um cálculo está em andamento.
+workers = int(os.environ.get('WEB_CONCURRENCY', min(max(multiprocessing.cpu_count(), 2), 4)))
+threads = int(os.environ.get('MF_THREADS', 4))
+worker_class = 'gthread'
+timeout = 60
+graceful_timeout = 30
+keepalive = 5
+
+# Reinicia cada worker após um número de requisições para conter o crescimento de memória
+# (e.g., caches por worker); com preload o novo worker nasce do master já aquecido.
+max_requests = int(os.environ.get('MF_MAX_REQUESTS', 2000))
+max_requests_jitter = max_requests // 10
+
+preload_app = os.environ.get('MF_PRELOAD', '1').strip().lower() not in ('0', 'false', 'no', 'off')
+_warm_up_enabled = os.environ.get('MF_WARM_UP', '1').strip().lower() not in ('0', 'false', 'no', 'off')
+
+accesslog = os.environ.get('MF_ACCESS_LOG')
+errorlog = '-'
+
+
+def _warm_up(log):
+    import app
+    try:
+        seconds = app.warm_up()
+    except Exception as e:
+        log.warning("Falha no aquecimento do app: %s", e)
+        return
+    log.info("App aquecido em %.2fs (versão do dataset %s)", seconds, app.DATASET_CACHE.stats()['version'])
+
+
+def when_ready(server):
+    # Com preload, roda no master depois de importar o app e antes de criar os workers
+    if preload_app and _warm_up_enabled:
+        _warm_up(server.log)
+        # Objetos criados até aqui não mudam mais: tirá-los do coletor de lixo evita que a
+        # varredura do GC nos workers escreva nos objetos e desfaça o compartilhamento das páginas
+        gc.freeze()
+
+
+def post_worker_init(worker):
+    if not preload_app and _warm_up_enabled:
+        _warm_up(worker.log)
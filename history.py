@@ -0,0 +1,162 @@
+"""
+Histórico de snapshots diários, particionado por data.
+
+Cada exportação vira uma partição imutável `<raiz>/<AAAA-MM-DD>.snapshot/` no formato
+colunar de snapshot.py. O índice de datas disponíveis é só a listagem do diretório, e
+cada data é carregada (memory-map) apenas na primeira vez em que é pedida. Um LRU limita
+quantas datas ficam residentes por processo.
+
+Uso:
+    python history.py append fundamentus_data.csv [--root history] [--date 2025-09-01]
+    python history.py list [--root history]
+"""
+import argparse
+import collections
+import datetime
+import os
+import threading
+
+import pandas as pd
+
+from snapshot import SCHEMA_FILE, load_snapshot, read_fundamentus_csv, write_snapshot
+
+PARTITION_SUFFIX = '.snapshot'
+
+
+def _to_date(value):
+    if isinstance(value, datetime.datetime):
+        return value.date()
+    if isinstance(value, datetime.date):
+        return value
+    return pd.Timestamp(value).date()
+
+
+class SnapshotHistory:
+    """Repositório append-only de snapshots por data, com carga preguiçosa e LRU."""
+
+    def __init__(self, root, max_resident=8):
+        self.root = root
+        self.max_resident = max_resident
+        self._lock = threading.Lock()
+        self._resident = collections.OrderedDict()
+        self._dates_cache = (None, [])
+        self.loads = 0
+        self.evictions = 0
+
+    def _partition_path(self, date):
+        return os.path.join(self.root, f"{_to_date(date).isoformat()}{PARTITION_SUFFIX}")
+
+    def dates(self):
+        """Datas disponíveis, em ordem crescente. A listagem só é refeita se o diretório mudar."""
+        try:
+            mtime = os.stat(self.root).st_mtime_ns
+        except OSError:
+            return []
+        cached_mtime, cached_dates = self._dates_cache
+        if cached_mtime == mtime:
+            return cached_dates
+
+        dates = []
+        for name in os.listdir(self.root):
+            if not name.endswith(PARTITION_SUFFIX):
+                continue
+            if not os.path.exists(os.path.join(self.root, name, SCHEMA_FILE)):
+                continue
+            try:
+                dates.append(datetime.date.fromisoformat(name[:-len(PARTITION_SUFFIX)]))
+            except ValueError:
+                continue
+        dates.sort()
+        self._dates_cache = (mtime, dates)
+        return dates
+
+    def latest(self):
+        dates = self.dates()
+        return dates[-1] if dates else None
+
+    def __contains__(self, date):
+        try:
+            path = self._partition_path(date)
+        except (ValueError, TypeError):
+            return False
+        return os.path.exists(os.path.join(path, SCHEMA_FILE))
+
+    def _resident_entry(self, date):
+        date = _to_date(date)
+        with self._lock:
+            entry = self._resident.get(date)
+            if entry is not None:
+                self._resident.move_to_end(date)
+                return entry
+
+            path = self._partition_path(date)
+            if not os.path.exists(os.path.join(path, SCHEMA_FILE)):
+                raise KeyError(f"Snapshot de {date.isoformat()} não encontrado em {self.root}")
+            entry = {'df': load_snapshot(path), 'derived': {}}
+            self.loads += 1
+            self._resident[date] = entry
+            while len(self._resident) > self.max_resident:
+                self._resident.popitem(last=False)
+                self.evictions += 1
+            return entry
+
+    def load(self, date):
+        """DataFrame da data pedida (carregado na primeira vez; não alterar)."""
+        return self._resident_entry(date)['df']
+
+    def get_derived(self, date, name, builder):
+        """Estrutura derivada do snapshot da data (e.g., índices), construída uma vez enquanto residente."""
+        entry = self._resident_entry(date)
+        with self._lock:
+            if name not in entry['derived']:
+                entry['derived'][name] = builder(entry['df'])
+            return entry['derived'][name]
+
+    def append(self, df, date=None):
+        """
+        Grava uma nova partição. O histórico é append-only: uma data já gravada não é
+        sobrescrita (FileExistsError).
+        """
+        if date is None:
+            date = df['data_execucao'].dropna().iloc[0]
+        path = self._partition_path(date)
+        if os.path.exists(path):
+            raise FileExistsError(f"Já existe snapshot para {_to_date(date).isoformat()} em {self.root}")
+        write_snapshot(df, path)
+        return _to_date(date)
+
+    def stats(self):
+        return {
+            'dates': len(self.dates()),
+            'resident': len(self._resident),
+            'max_resident': self.max_resident,
+            'loads': self.loads,
+            'evictions': self.evictions,
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Histórico de snapshots diários do Fundamentus.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    append_parser = subparsers.add_parser('append', help="Adiciona um CSV exportado ao histórico")
+    append_parser.add_argument('csv_path')
+    append_parser.add_argument('--root', default='history')
+    append_parser.add_argument('--date', help="Data da partição (padrão: data_execucao do CSV)")
+
+    list_parser = subparsers.add_parser('list', help="Lista as datas disponíveis")
+    list_parser.add_argument('--root', default='history')
+
+    args = parser.parse_args()
+    history = SnapshotHistory(args.root)
+
+    if args.command == 'append':
+        date = history.append(read_fundamentus_csv(args.csv_path), args.date)
+        print(f"Snapshot de {date.isoformat()} adicionado a {args.root}.")
+    else:
+        for date in history.dates():
+            print(date.isoformat())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,219 @@
+"""
+Compressão e revalidação (ETag) das respostas do servidor Flask do Dash.
+
+- Compressão: respostas de texto (JSON dos callbacks, layout, JS/CSS dos componentes e de
+  assets/) acima de `min_size` bytes são comprimidas com brotli (se o pacote `brotli`
+  estiver instalado e o navegador aceitar) ou gzip. Corpos de recursos estáticos (com
+  ETag ou cache de longa duração) são comprimidos uma vez e reaproveitados.
+- Revalidação: respostas GET sem ETag recebem um ETag do conteúdo e `Cache-Control:
+  no-cache`; o navegador (ou um proxy) revalida com If-None-Match e recebe 304 sem corpo.
+  Os ETags são fracos (W/"..."): o mesmo ETag vale para os corpos gzip, brotli e sem
+  compressão, que são equivalentes mas não idênticos byte a byte (um ETag forte prometeria
+  corpos idênticos, e um cache compartilhado poderia entregar a codificação errada). ETags
+  fortes de recursos estáticos viram fracos quando o corpo é comprimido.
+  Rotas derivadas do dataset (exportação, API em api.py) usam `versioned()`, com o ETag
+  calculado a partir da versão do dataset (hash da assinatura dos arquivos) antes de montar
+  a resposta. Em um POST com If-None-Match que confere, a resposta é 412 (RFC 9110, 13.1.2),
+  e não 304, que vale só para GET/HEAD.
+
+Os callbacks do Dash são POST e não entram em cache HTTP: para eles vale só a compressão
+(o POST da API em lote usa `versioned()` explicitamente).
+`stats()` informa os bytes economizados (compressão e respostas 304).
+"""
+import collections
+import gzip
+import hashlib
+import os
+import threading
+from functools import wraps
+
+try:
+    import brotli
+except ImportError:  # brotli é opcional: sem ele, só gzip
+    brotli = None
+
+COMPRESSIBLE_MIMETYPES = (
+    'application/json', 'application/javascript', 'text/javascript', 'text/css', 'text/html',
+    'text/plain', 'text/csv', 'image/svg+xml',
+)
+
+
+def _env_flag(name, default):
+    return os.environ.get(name, default).strip().lower() in ('1', 'true', 'yes', 'on')
+
+
+class ResponseOptimizer:
+    """Hook after_request que aplica ETag/304 e compressão, com contadores de bytes."""
+
+    def __init__(self, enabled=True, min_size=500, gzip_level=6, brotli_quality=5,
+                 static_cache_entries=64, exclude_paths=('/metrics',)):
+        self.enabled = enabled
+        self.min_size = min_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+        self.exclude_paths = tuple(exclude_paths)
+        self._static_cache = collections.OrderedDict()
+        self._static_cache_entries = static_cache_entries
+        self._lock = threading.Lock()
+        self.compressed = collections.Counter()
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.not_modified = 0
+        self.not_modified_bytes = 0
+        self.precondition_failed = 0
+
+    def init_app(self, server):
+        if self.enabled:
+            server.after_request(self._after_request)
+
+    # --- ETag ---
+
+    def versioned(self, version_of):
+        """
+        Decorador para rotas derivadas do dataset: o ETag é a versão devolvida por
+        `version_of()` combinada com a URL (parâmetros inclusos) e, fora do GET, com o corpo
+        da requisição (e.g., o lote da API). Se o cliente já tem essa versão, responde sem
+        executar a rota: 304 no GET/HEAD e 412 (Precondition Failed) nos demais métodos.
+        Desligado (enabled=False), a rota responde sem ETag.
+        """
+        def decorator(view):
+            if not self.enabled:
+                return view
+
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                from flask import make_response, request
+                raw = f"{version_of()}|{request.full_path}".encode('utf-8')
+                if request.method not in ('GET', 'HEAD'):
+                    raw += b'|' + request.get_data()
+                etag = hashlib.sha1(raw).hexdigest()[:20]
+                # If-None-Match usa comparação fraca (RFC 7232, 3.2)
+                if request.if_none_match.contains_weak(etag):
+                    safe = request.method in ('GET', 'HEAD')
+                    response = make_response('', 304 if safe else 412)
+                    response.set_etag(etag, weak=True)
+                    with self._lock:
+                        if safe:
+                            self.not_modified += 1
+                        else:
+                            self.precondition_failed += 1
+                    return response
+                response = make_response(view(*args, **kwargs))
+                response.set_etag(etag, weak=True)
+                response.cache_control.no_cache = True
+                return response
+            return wrapper
+        return decorator
+
+    def _conditional(self, request, response):
+        # 304 a partir do conteúdo para GETs que ainda não tratam ETag (e.g., /_dash-layout)
+        if (request.method != 'GET' or response.status_code != 200 or response.is_streamed
+                or response.direct_passthrough or response.get_etag()[0] is not None):
+            return response
+        if response.cache_control.max_age is None:
+            response.cache_control.no_cache = True
+        response.add_etag(weak=True)
+        size = response.calculate_content_length() or 0
+        response.make_conditional(request)
+        if response.status_code == 304:
+            with self._lock:
+                self.not_modified += 1
+                self.not_modified_bytes += size
+        return response
+
+    # --- Compressão ---
+
+    def _encoding_for(self, request):
+        accepted = request.accept_encodings
+        if brotli is not None and accepted['br']:
+            return 'br'
+        if accepted['gzip']:
+            return 'gzip'
+        return None
+
+    def _compress(self, data, encoding):
+        if encoding == 'br':
+            return brotli.compress(data, quality=self.brotli_quality)
+        return gzip.compress(data, compresslevel=self.gzip_level, mtime=0)
+
+    def _static_key(self, request, response, encoding):
+        # Recursos estáticos: o mesmo corpo volta a cada visita, vale guardar a versão comprimida
+        etag = response.get_etag()[0]
+        if etag is not None:
+            return (request.path, etag, encoding)
+        if response.cache_control.max_age:
+            return (request.path, None, encoding)
+        return None
+
+    def _after_request(self, response):
+        from flask import request
+        if request.path in self.exclude_paths:
+            return response
+        response = self._conditional(request, response)
+
+        # Arquivos de assets/ chegam como direct_passthrough (lidos aqui); streams de verdade ficam como estão
+        streamed = response.is_streamed and not response.direct_passthrough
+        if (response.status_code != 200 or streamed or 'Content-Encoding' in response.headers
+                or response.mimetype not in COMPRESSIBLE_MIMETYPES):
+            return response
+        response.vary.add('Accept-Encoding')
+        encoding = self._encoding_for(request)
+        if encoding is None:
+            return response
+
+        response.direct_passthrough = False
+        data = response.get_data()
+        if len(data) < self.min_size:
+            return response
+
+        key = self._static_key(request, response, encoding)
+        with self._lock:
+            body = self._static_cache.get(key) if key is not None else None
+        if body is None:
+            body = self._compress(data, encoding)
+            if key is not None:
+                with self._lock:
+                    self._static_cache[key] = body
+                    while len(self._static_cache) > self._static_cache_entries:
+                        self._static_cache.popitem(last=False)
+        if len(body) >= len(data):
+            return response
+
+        response.set_data(body)
+        response.headers['Content-Encoding'] = encoding
+        etag, weak = response.get_etag()
+        if etag is not None and not weak:
+            response.set_etag(etag, weak=True)
+        with self._lock:
+            self.compressed[encoding] += 1
+            self.bytes_in += len(data)
+            self.bytes_out += len(body)
+        return response
+
+    def stats(self):
+        stats = {
+            'enabled': self.enabled,
+            'brotli_available': brotli is not None,
+            'compressed_responses': sum(self.compressed.values()),
+            'bytes_in': self.bytes_in,
+            'bytes_out': self.bytes_out,
+            'bytes_saved': self.bytes_in - self.bytes_out + self.not_modified_bytes,
+            'ratio': self.bytes_out / self.bytes_in if self.bytes_in else 1.0,
+            'not_modified': self.not_modified,
+            'precondition_failed': self.precondition_failed,
+        }
+        for encoding, count in sorted(self.compressed.items()):
+            stats[f'{encoding}_responses'] = count
+        return stats
+
+
+def create_response_optimizer_from_env():
+    """
+    Cria o ResponseOptimizer a partir de MF_COMPRESSION (padrão ligado; 0 desliga compressão
+    e ETag), MF_COMPRESSION_MIN_BYTES e MF_GZIP_LEVEL.
+    """
+    return ResponseOptimizer(
+        enabled=_env_flag('MF_COMPRESSION', '1'),
+        min_size=int(os.environ.get('MF_COMPRESSION_MIN_BYTES', 500)),
+        gzip_level=int(os.environ.get('MF_GZIP_LEVEL', 6)),
+    )
@@ -0,0 +1,401 @@
+"""
+Ingestão dos dados do Fundamentus e cálculo da Fórmula Mágica (gera o fundamentus_data.csv).
+
+Baixa a tabela de resultado.php (todas as ações, uma única página) e, para as empresas que
+entram no ranking, as páginas detalhes.php?papel=X (empresa, setor, subsetor, LPA e
+oscilações). As páginas de detalhe são baixadas concorrentemente: um laço asyncio dispara
+as requisições em um ThreadPoolExecutor próprio, com uma thread por conexão (o executor
+padrão do asyncio tem no máximo min(32, CPUs + 4) threads e limitaria `--concurrency`),
+sobre uma requests.Session com pool de conexões limitado (keep-alive), com um semáforo para
+a concorrência, limite de requisições por segundo e novas tentativas com backoff exponencial.
+
+Os números no padrão BR são convertidos por coluna (formatting.parse_br_series) e os
+rankings são calculados de forma vetorizada. O CSV é gravado de forma atômica (arquivo
+temporário + os.replace) e, em seguida, o snapshot colunar é recompilado (snapshot.py).
+
+A URL base é configurável para rodar contra um servidor local de fixtures (MF_FUNDAMENTUS_URL
+ou --base-url; tests/test_ingest.py serve as páginas de tests/fixtures/fundamentus).
+
+Uso:
+    python ingest.py [--output fundamentus_data.csv] [--base-url https://www.fundamentus.com.br]
+                     [--concurrency 16] [--rate 30] [--retries 3] [--history history]
+"""
+import argparse
+import asyncio
+import datetime
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from html.parser import HTMLParser
+
+import numpy as np
+import pandas as pd
+import requests
+from requests.adapters import HTTPAdapter
+
+from formatting import parse_br_series
+
+BASE_URL = 'https://www.fundamentus.com.br'
+RESULTADO_PATH = '/resultado.php'
+DETALHES_PATH = '/detalhes.php'
+HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0 Safari/537.36',
+    'Accept': 'text/html,application/xhtml+xml',
+}
+PAGE_ENCODING = 'ISO-8859-1'
+
+# Cabeçalhos da tabela de resultado.php -> colunas internas
+RESULTADO_COLUMNS = {
+    'Papel': 'ticker',
+    'Cotação': 'cotacao',
+    'P/L': 'pl',
+    'P/VP': 'pvp',
+    'Div.Yield': 'div_yield',
+    'EV/EBIT': 'ev_ebit',
+    'Mrg. Líq.': 'marg_liquida',
+    'ROIC': 'roic',
+    'Liq.2meses': 'vol_med_2m',
+}
+PERCENT_COLUMNS = ['div_yield', 'marg_liquida', 'roic']
+
+# Rótulos das páginas de detalhe -> colunas internas
+DETALHES_LABELS = {
+    'Empresa': 'empresa',
+    'Setor': 'setor',
+    'Subsetor': 'subsetor',
+    'LPA': 'lpa',
+    '30 dias': '30_dias',
+    '12 meses': '12_meses',
+}
+DETALHES_NUMERIC = ['lpa', '30_dias', '12_meses']
+
+OUTPUT_COLUMNS = [
+    'ticker', 'empresa', 'setor', 'subsetor', 'roic_clean', 'earnings_yield_clean',
+    'rank_roic', 'rank_ey', 'magic_formula_rank', 'cotacao', 'vol_med_2m', 'pl', 'pvp',
+    'div_yield', 'lpa', '30_dias', '12_meses', 'marg_liquida', 'data_execucao',
+]
+
+
+# --- Parse do HTML ---
+
+class _ResultadoParser(HTMLParser):
+    """Extrai cabeçalho e linhas (texto das células) da tabela id="resultado"."""
+
+    def __init__(self):
+        super().__init__()
+        self.header = []
+        self.rows = []
+        self._in_table = False
+        self._row = None
+        self._cell = None
+
+    def handle_starttag(self, tag, attrs):
+        if tag == 'table' and dict(attrs).get('id') == 'resultado':
+            self._in_table = True
+        elif self._in_table and tag == 'tr':
+            self._row = []
+        elif self._in_table and tag in ('td', 'th') and self._row is not None:
+            self._cell = []
+
+    def handle_endtag(self, tag):
+        if not self._in_table:
+            return
+        if tag in ('td', 'th') and self._cell is not None:
+            self._row.append(''.join(self._cell).strip())
+            self._cell = None
+        elif tag == 'tr' and self._row is not None:
+            if self._row:
+                if not self.header:
+                    self.header = self._row
+                else:
+                    self.rows.append(self._row)
+            self._row = None
+        elif tag == 'table':
+            self._in_table = False
+
+    def handle_data(self, data):
+        if self._cell is not None:
+            self._cell.append(data)
+
+
+class _DetalhesParser(HTMLParser):
+    """
+    Extrai os pares rótulo/valor das páginas de detalhe. Cada rótulo está em uma célula
+    class="label" (o texto fica no <span class="txt">, ao lado do ícone de ajuda) e o valor
+    na célula class="data" seguinte.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.values = {}
+        self._cell_kind = None
+        self._cell = []
+        self._span_depth = 0
+        self._txt_depth = None
+        self._label = None
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        if tag == 'td':
+            classes = (attrs.get('class') or '').split()
+            self._cell_kind = 'label' if 'label' in classes else 'data' if 'data' in classes else None
+            self._cell = []
+            self._span_depth = 0
+            self._txt_depth = None
+        elif tag == 'span' and self._cell_kind is not None:
+            self._span_depth += 1
+            if self._txt_depth is None and 'txt' in (attrs.get('class') or '').split():
+                self._txt_depth = self._span_depth
+
+    def handle_endtag(self, tag):
+        if tag == 'span' and self._cell_kind is not None:
+            if self._txt_depth == self._span_depth:
+                self._txt_depth = -1
+            self._span_depth -= 1
+        elif tag == 'td' and self._cell_kind is not None:
+            text = ''.join(self._cell).strip()
+            if self._cell_kind == 'label':
+                self._label = text
+            elif self._label is not None:
+                self.values.setdefault(self._label, text)
+                self._label = None
+            self._cell_kind = None
+
+    def handle_data(self, data):
+        if self._cell_kind == 'data' or (self._cell_kind == 'label' and self._txt_depth not in (None, -1)):
+            self._cell.append(data)
+
+
+def parse_resultado(html):
+    """Tabela de resultado.php como DataFrame de strings, com as colunas internas."""
+    parser = _ResultadoParser()
+    parser.feed(html)
+    header = [RESULTADO_COLUMNS.get(name, name) for name in parser.header]
+    width = len(header)
+    rows = [row for row in parser.rows if len(row) == width]
+    return pd.DataFrame(rows, columns=header)
+
+
+def parse_detalhes(html):
+    """Campos de interesse de uma página de detalhe ({coluna interna: texto})."""
+    parser = _DetalhesParser()
+    parser.feed(html)
+    return {column: parser.values.get(label) for label, column in DETALHES_LABELS.items()}
+
+
+# --- Cálculo da Fórmula Mágica ---
+
+def compute_magic_formula(resultado, detalhes=None, data_execucao=None):
+    """
+    Monta o dataset final a partir da tabela de resultado (strings) e dos detalhes
+    (DataFrame de strings indexado por ticker). Só entram empresas com ROIC > 0 e
+    EV/EBIT > 0; earnings yield = 100 / (EV/EBIT). Os ranks usam o menor posto em caso de
+    empate (rank 1 = melhor) e magic_formula_rank é a soma dos dois.
+    """
+    df = pd.DataFrame({'ticker': resultado['ticker'].astype(str).str.strip()})
+    for column in ['cotacao', 'vol_med_2m', 'pl', 'pvp', 'div_yield', 'ev_ebit', 'marg_liquida', 'roic']:
+        df[column] = parse_br_series(resultado[column], default=np.nan, percent=column in PERCENT_COLUMNS).to_numpy()
+
+    df = df[(df['roic'] > 0) & (df['ev_ebit'] > 0)].copy()
+    df['roic_clean'] = df['roic']
+    df['earnings_yield_clean'] = 100.0 / df['ev_ebit']
+    df['rank_roic'] = df['roic_clean'].rank(ascending=False, method='min').astype(int)
+    df['rank_ey'] = df['earnings_yield_clean'].rank(ascending=False, method='min').astype(int)
+    df['magic_formula_rank'] = df['rank_roic'] + df['rank_ey']
+    df['vol_med_2m'] = df['vol_med_2m'].fillna(0.0)
+
+    if detalhes is None:
+        detalhes = pd.DataFrame(columns=list(DETALHES_LABELS.values()))
+    detalhes = detalhes.reindex(df['ticker'])
+    for column in ['empresa', 'setor', 'subsetor']:
+        df[column] = detalhes[column].to_numpy()
+    for column in DETALHES_NUMERIC:
+        df[column] = parse_br_series(detalhes[column], default=np.nan, percent=True).to_numpy()
+
+    df['data_execucao'] = (data_execucao or datetime.date.today()).isoformat()
+    df = df.sort_values('magic_formula_rank', kind='stable')
+    return df[OUTPUT_COLUMNS].reset_index(drop=True)
+
+
+def write_csv_atomic(df, path):
+    """Grava o CSV em um arquivo temporário no mesmo diretório e troca com os.replace."""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix='.ingest-', suffix='.csv', dir=directory)
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8', newline='') as f:
+            df.to_csv(f, index=False)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return path
+
+
+# --- Download concorrente ---
+
+class _RateLimiter:
+    """Espaça o início das requisições para no máximo `rate` por segundo (0 = sem limite)."""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate else 0.0
+        self._next = 0.0
+        self._lock = asyncio.Lock()
+
+    async def wait(self):
+        if not self.interval:
+            return
+        async with self._lock:
+            now = time.monotonic()
+            delay = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+class FundamentusClient:
+    """Cliente HTTP do Fundamentus: pool de conexões, concorrência limitada, rate limit e retries."""
+
+    RETRY_STATUS = {429, 500, 502, 503, 504}
+
+    def __init__(self, base_url=BASE_URL, concurrency=16, rate=30.0, retries=3, timeout=15.0, backoff=0.5):
+        self.base_url = base_url.rstrip('/')
+        self.concurrency = concurrency
+        self.rate = rate
+        self.retries = retries
+        self.timeout = timeout
+        self.backoff = backoff
+        self.requests = 0
+        self.failures = 0
+
+        self.session = requests.Session()
+        self.session.headers.update(HEADERS)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=concurrency)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='fundamentus')
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+        self.session.close()
+
+    async def _get_in_thread(self, path, params):
+        # Contado aqui, na thread do event loop: _get roda em várias threads do executor
+        self.requests += 1
+        return await asyncio.get_running_loop().run_in_executor(self.executor, self._get, path, params)
+
+    def _get(self, path, params=None):
+        response = self.session.get(self.base_url + path, params=params, timeout=self.timeout)
+        if response.status_code in self.RETRY_STATUS:
+            raise requests.HTTPError(f"HTTP {response.status_code}", response=response)
+        response.raise_for_status()
+        response.encoding = response.encoding or PAGE_ENCODING
+        return response.text
+
+    async def fetch(self, path, params=None, semaphore=None, limiter=None):
+        """Baixa uma página com novas tentativas (backoff exponencial) em erros transitórios."""
+        for attempt in range(self.retries + 1):
+            try:
+                if limiter is not None:
+                    await limiter.wait()
+                if semaphore is None:
+                    return await self._get_in_thread(path, params)
+                async with semaphore:
+                    return await self._get_in_thread(path, params)
+            except (requests.ConnectionError, requests.Timeout, requests.HTTPError) as exc:
+                response = getattr(exc, 'response', None)
+                transient = response is None or response.status_code in self.RETRY_STATUS
+                if not transient or attempt == self.retries:
+                    self.failures += 1
+                    raise
+                await asyncio.sleep(self.backoff * 2 ** attempt)
+
+    async def fetch_detalhes(self, tickers):
+        """Detalhes de todos os tickers, em paralelo. Tickers que falham ficam de fora."""
+        semaphore = asyncio.Semaphore(self.concurrency)
+        limiter = _RateLimiter(self.rate)
+
+        async def one(ticker):
+            try:
+                html = await self.fetch(DETALHES_PATH, {'papel': ticker}, semaphore, limiter)
+            except requests.RequestException as exc:
+                print(f"Aviso: detalhes de {ticker} indisponíveis ({exc}).")
+                return None
+            return ticker, parse_detalhes(html)
+
+        results = await asyncio.gather(*(one(ticker) for ticker in tickers))
+        records = {ticker: values for ticker, values in filter(None, results)}
+        return pd.DataFrame.from_dict(records, orient='index', columns=list(DETALHES_LABELS.values()))
+
+
+async def fetch_dataset(client, data_execucao=None, with_detalhes=True):
+    """Baixa resultado.php, calcula o ranking e completa com os detalhes das empresas ranqueadas."""
+    resultado = parse_resultado(await client.fetch(RESULTADO_PATH))
+    if resultado.empty:
+        raise ValueError("Tabela de resultado.php vazia ou em formato inesperado.")
+
+    ranked = compute_magic_formula(resultado, data_execucao=data_execucao)
+    detalhes = None
+    if with_detalhes:
+        detalhes = await client.fetch_detalhes(ranked['ticker'].unique().tolist())
+    return compute_magic_formula(resultado, detalhes, data_execucao)
+
+
+def ingest(output=None, base_url=BASE_URL, concurrency=16, rate=30.0, retries=3,
+           with_detalhes=True, compile=True, history_root=None, data_execucao=None):
+    """Executa a ingestão completa e grava o CSV (e o snapshot/histórico, se pedido)."""
+    output = output or 'fundamentus_data.csv'
+    client = FundamentusClient(base_url, concurrency=concurrency, rate=rate, retries=retries)
+    try:
+        df = asyncio.run(fetch_dataset(client, data_execucao, with_detalhes))
+    finally:
+        client.close()
+
+    write_csv_atomic(df, output)
+    if compile:
+        from snapshot import compile_snapshot
+        compile_snapshot(output)
+    if history_root:
+        from history import SnapshotHistory
+        from snapshot import read_fundamentus_csv
+        try:
+            SnapshotHistory(history_root).append(read_fundamentus_csv(output))
+        except FileExistsError as exc:
+            print(f"Aviso: {exc}")
+    return df, client
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Baixa os dados do Fundamentus e gera o CSV da Fórmula Mágica.")
+    parser.add_argument('--output', default='fundamentus_data.csv')
+    parser.add_argument('--base-url', default=os.environ.get('MF_FUNDAMENTUS_URL', BASE_URL),
+                        help="URL base do Fundamentus (ou de um servidor local de fixtures)")
+    parser.add_argument('--concurrency', type=int, default=16, help="Conexões simultâneas")
+    parser.add_argument('--rate', type=float, default=30.0, help="Máximo de requisições por segundo (0 = sem limite)")
+    parser.add_argument('--retries', type=int, default=3)
+    parser.add_argument('--no-details', action='store_true', help="Não baixa as páginas de detalhe")
+    parser.add_argument('--no-snapshot', action='store_true', help="Não recompila o snapshot colunar")
+    parser.add_argument('--history', help="Também adiciona a execução ao histórico neste diretório")
+    parser.add_argument('--date', help="Data de execução (padrão: hoje)")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    df, client = ingest(
+        output=args.output,
+        base_url=args.base_url,
+        concurrency=args.concurrency,
+        rate=args.rate,
+        retries=args.retries,
+        with_detalhes=not args.no_details,
+        compile=not args.no_snapshot,
+        history_root=args.history,
+        data_execucao=datetime.date.fromisoformat(args.date) if args.date else None,
+    )
+    elapsed = time.perf_counter() - start
+    print(f"{len(df)} empresas ranqueadas ({client.requests} requisições, {client.failures} falhas) "
+          f"em {elapsed:.1f}s -> {args.output}")
+
+
+if __name__ == '__main__':
+    main()
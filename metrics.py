@@ -0,0 +1,256 @@
+"""
+Instrumentação dos callbacks do Dash, exposta no formato texto do Prometheus.
+
+Para cada callback, registra:
+- o tempo total da requisição /_dash-update-component e o tempo dentro da função do
+  callback; a diferença é o tempo do Dash para desserializar a entrada e serializar a
+  saída ('serialization');
+- dentro da função, as etapas marcadas com `stage()`: leitura do dataset e das etapas do PIPELINE ('load'),
+  cálculo com pandas ('compute') e formatação da tabela ('format');
+- os bytes do corpo da requisição e da resposta.
+
+Os contadores de cache (hit rate do dataset, do PIPELINE etc.) são lidos na hora
+da coleta, a partir das funções registradas com `register_collector()`.
+
+Ativado com MF_METRICS=1. Desativado, `instrument()` devolve a própria função e
+`stage()` um contexto vazio compartilhado, sem custo mensurável. Com
+MF_SLOW_CALLBACK_MS, callbacks acima do limite são registrados no log com o detalhamento.
+"""
+import bisect
+import contextlib
+import os
+import threading
+import time
+from functools import wraps
+
+DASH_UPDATE_PATH = '/_dash-update-component'
+
+# Limites (segundos) dos buckets do histograma de duração
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_NULL_STAGE = contextlib.nullcontext()
+
+
+def _env_flag(name):
+    return os.environ.get(name, '').strip().lower() in ('1', 'true', 'yes', 'on')
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(**labels):
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in labels.items()) + '}'
+
+
+class _CallbackStats:
+    __slots__ = ('count', 'duration_sum', 'buckets', 'stages', 'request_bytes', 'response_bytes', 'errors')
+
+    def __init__(self):
+        self.count = 0
+        self.duration_sum = 0.0
+        self.buckets = [0] * (len(DURATION_BUCKETS) + 1)
+        self.stages = {}
+        self.request_bytes = 0
+        self.response_bytes = 0
+        self.errors = 0
+
+
+class Metrics:
+    """Registro de métricas do processo (um por worker)."""
+
+    def __init__(self, enabled=False, slow_callback_ms=0):
+        self.enabled = enabled
+        self.slow_callback_ms = slow_callback_ms
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._callbacks = {}
+        self._collectors = []
+
+    # --- Coleta dentro dos callbacks ---
+
+    def instrument(self, name=None):
+        """Decorador para a função de um callback (aplicado abaixo de @app.callback)."""
+        def decorator(func):
+            if not self.enabled:
+                return func
+            callback_name = name or func.__name__
+
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                local = self._local
+                local.callback = callback_name
+                local.stages = {}
+                start = time.perf_counter()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    local.callback_seconds = time.perf_counter() - start
+            return wrapper
+        return decorator
+
+    def stage(self, name):
+        """Contexto que acumula o tempo de uma etapa no callback em execução."""
+        if not self.enabled:
+            return _NULL_STAGE
+        return self._timed_stage(name)
+
+    @contextlib.contextmanager
+    def _timed_stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            stages = getattr(self._local, 'stages', None)
+            if stages is not None:
+                stages[name] = stages.get(name, 0.0) + time.perf_counter() - start
+
+    # --- Integração com o Flask ---
+
+    def init_app(self, server, route='/metrics'):
+        """Registra a rota Prometheus e, se ativado, os hooks que medem cada requisição de callback."""
+        server.add_url_rule(route, 'metrics', self._metrics_view)
+        if self.enabled:
+            server.before_request(self._before_request)
+            server.after_request(self._after_request)
+
+    def _before_request(self):
+        from flask import request
+        local = self._local
+        local.callback = None
+        local.stages = None
+        local.callback_seconds = None
+        local.request_start = time.perf_counter() if request.path.endswith(DASH_UPDATE_PATH) else None
+
+    def _after_request(self, response):
+        local = self._local
+        start = getattr(local, 'request_start', None)
+        if start is None:
+            return response
+        local.request_start = None
+
+        from flask import request
+        total = time.perf_counter() - start
+        name = local.callback or 'unknown'
+        stages = dict(local.stages or {})
+        callback_seconds = local.callback_seconds
+        if callback_seconds is not None:
+            stages['serialization'] = max(total - callback_seconds, 0.0)
+            stages['other'] = max(callback_seconds - sum(v for k, v in stages.items() if k != 'serialization'), 0.0)
+        response_bytes = response.calculate_content_length()
+        if response_bytes is None and not response.is_streamed:
+            response_bytes = len(response.get_data())
+
+        self.observe(name, total, stages, request.content_length or 0, response_bytes or 0,
+                     error=response.status_code >= 500)
+        return response
+
+    def observe(self, name, seconds, stages=None, request_bytes=0, response_bytes=0, error=False):
+        """Registra uma execução de callback."""
+        with self._lock:
+            stats = self._callbacks.get(name)
+            if stats is None:
+                stats = self._callbacks[name] = _CallbackStats()
+            stats.count += 1
+            stats.duration_sum += seconds
+            stats.buckets[bisect.bisect_left(DURATION_BUCKETS, seconds)] += 1
+            for stage, value in (stages or {}).items():
+                stats.stages[stage] = stats.stages.get(stage, 0.0) + value
+            stats.request_bytes += request_bytes
+            stats.response_bytes += response_bytes
+            stats.errors += int(error)
+
+        if self.slow_callback_ms and seconds * 1000 >= self.slow_callback_ms:
+            detail = ', '.join(f"{stage}={value * 1000:.1f}ms" for stage, value in sorted((stages or {}).items()))
+            print(f"Callback lento: {name} levou {seconds * 1000:.1f}ms ({detail}); "
+                  f"requisição {request_bytes} B, resposta {response_bytes} B", flush=True)
+
+    # --- Exposição ---
+
+    def register_collector(self, prefix, collector):
+        """
+        Registra uma função que devolve um dict de estatísticas (e.g., DATASET_CACHE.stats).
+        Os valores numéricos viram gauges `mf_<prefix>_<chave>`.
+        """
+        self._collectors.append((prefix, collector))
+
+    def snapshot(self):
+        """Cópia das estatísticas por callback ({nome: dict})."""
+        with self._lock:
+            return {
+                name: {
+                    'count': stats.count,
+                    'duration_sum': stats.duration_sum,
+                    'buckets': list(stats.buckets),
+                    'stages': dict(stats.stages),
+                    'request_bytes': stats.request_bytes,
+                    'response_bytes': stats.response_bytes,
+                    'errors': stats.errors,
+                }
+                for name, stats in self._callbacks.items()
+            }
+
+    def render(self):
+        """Métricas no formato texto do Prometheus."""
+        lines = [
+            '# HELP mf_metrics_enabled Instrumentação de callbacks ativa (MF_METRICS).',
+            '# TYPE mf_metrics_enabled gauge',
+            f'mf_metrics_enabled {int(self.enabled)}',
+        ]
+        callbacks = self.snapshot()
+        if callbacks:
+            lines += [
+                '# HELP mf_callback_duration_seconds Tempo total da requisição de cada callback.',
+                '# TYPE mf_callback_duration_seconds histogram',
+            ]
+            for name, stats in sorted(callbacks.items()):
+                cumulative = 0
+                for bound, count in zip(DURATION_BUCKETS + (float('inf'),), stats['buckets']):
+                    cumulative += count
+                    le = '+Inf' if bound == float('inf') else repr(bound)
+                    lines.append(f"mf_callback_duration_seconds_bucket{_labels(callback=name, le=le)} {cumulative}")
+                lines.append(f"mf_callback_duration_seconds_sum{_labels(callback=name)} {stats['duration_sum']:.6f}")
+                lines.append(f"mf_callback_duration_seconds_count{_labels(callback=name)} {stats['count']}")
+
+            lines += [
+                '# HELP mf_callback_stage_seconds_total Tempo acumulado por etapa do callback.',
+                '# TYPE mf_callback_stage_seconds_total counter',
+            ]
+            for name, stats in sorted(callbacks.items()):
+                for stage, value in sorted(stats['stages'].items()):
+                    lines.append(f"mf_callback_stage_seconds_total{_labels(callback=name, stage=stage)} {value:.6f}")
+
+            for metric, key, help_text in (
+                ('mf_callback_request_bytes_total', 'request_bytes', 'Bytes recebidos nas requisições do callback.'),
+                ('mf_callback_response_bytes_total', 'response_bytes', 'Bytes enviados nas respostas do callback.'),
+                ('mf_callback_errors_total', 'errors', 'Respostas com erro (5xx) do callback.'),
+            ):
+                lines += [f'# HELP {metric} {help_text}', f'# TYPE {metric} counter']
+                for name, stats in sorted(callbacks.items()):
+                    lines.append(f"{metric}{_labels(callback=name)} {stats[key]}")
+
+        for prefix, collector in self._collectors:
+            try:
+                values = collector()
+            except Exception as e:
+                print(f"Erro ao coletar métricas de {prefix}: {e}")
+                continue
+            for key, value in values.items():
+                if isinstance(value, bool):
+                    value = int(value)
+                if isinstance(value, (int, float)):
+                    metric = f"mf_{prefix}_{key}"
+                    lines += [f'# TYPE {metric} gauge', f'{metric} {value}']
+        return '\n'.join(lines) + '\n'
+
+    def _metrics_view(self):
+        from flask import Response
+        return Response(self.render(), mimetype='text/plain; version=0.0.4')
+
+
+def create_metrics_from_env():
+    """Cria o registro a partir de MF_METRICS (liga/desliga) e MF_SLOW_CALLBACK_MS (limite do log)."""
+    return Metrics(
+        enabled=_env_flag('MF_METRICS'),
+        slow_callback_ms=float(os.environ.get('MF_SLOW_CALLBACK_MS', 0)),
+    )
@@ -0,0 +1,129 @@
+"""
+Pipeline de cálculo em etapas memoizadas, compartilhado por todas as sessões.
+
+Cada etapa do dashboard (universo filtrado, resultado da alocação, página formatada da
+tabela) é guardada pela chave "etapa:versão do dataset:hash dos parâmetros". Sessões com
+as mesmas entradas (e.g., os valores padrão: 20 empresas, volume mínimo de 20.000.000,
+colunas padrão) reaproveitam o resultado em vez de recalcular filtro, alocação e
+formatação. A chave depende só do conteúdo das entradas, então qualquer worker que
+calcule a mesma etapa chega à mesma chave.
+
+Os resultados ficam em um backend de session_store: MemoryBackend (LRU por worker) ou
+DiskBackend (diretório local compartilhado pelos workers). Os valores são devolvidos por
+referência: quem lê não deve alterá-los.
+
+`invalidate(versions)` descarta as etapas das versões indicadas; o app o liga a
+DatasetCache.on_reload, para que versões que saíram do cache não ocupem espaço. Para isso,
+o pipeline guarda as chaves que gravou por versão; chaves que o próprio backend já
+descartou (LRU/TTL) saem desse índice periodicamente, então ele fica limitado ao tamanho
+do backend, e não cresce com cada seleção, valor ou página distintos.
+"""
+import collections
+import hashlib
+import os
+import tempfile
+import threading
+
+from session_store import DiskBackend, MemoryBackend
+
+
+class StagedPipeline:
+    """Memoização das etapas de cálculo por (etapa, versão do dataset, parâmetros)."""
+
+    def __init__(self, backend):
+        self.backend = backend
+        self._lock = threading.Lock()
+        self._keys_by_version = collections.defaultdict(set)
+        self._indexed = 0
+        self._counters = collections.defaultdict(lambda: [0, 0])
+        self.invalidated = 0
+
+    @staticmethod
+    def make_key(stage, version, params):
+        # repr é estável para os parâmetros usados (números, textos, listas, dicts e tuplas)
+        digest = hashlib.sha1(repr(params).encode('utf-8')).hexdigest()[:20]
+        return f"{stage}:{version}:{digest}"
+
+    def run(self, stage, version, params, builder):
+        """
+        Resultado da etapa para a versão e os parâmetros dados, calculado com `builder()`
+        só na primeira vez (ou após descarte). Retorna (valor, chave).
+        """
+        key = self.make_key(stage, version, params)
+        value = self.backend.get(key)
+        counters = self._counters[stage]
+        if value is not None:
+            counters[0] += 1
+            return value, key
+
+        counters[1] += 1
+        value = builder()
+        self.backend.set(key, value)
+        with self._lock:
+            keys = self._keys_by_version[version]
+            if key not in keys:
+                keys.add(key)
+                self._indexed += 1
+            if self._indexed > 2 * self.backend.max_entries:
+                self._prune()
+        return value, key
+
+    def _prune(self):
+        # Com self._lock: mantém no índice só as chaves que o backend ainda tem
+        for version in list(self._keys_by_version):
+            keys = {key for key in self._keys_by_version[version] if key in self.backend}
+            if keys:
+                self._keys_by_version[version] = keys
+            else:
+                del self._keys_by_version[version]
+        self._indexed = sum(len(keys) for keys in self._keys_by_version.values())
+
+    def invalidate(self, versions=None):
+        """
+        Descarta as etapas calculadas neste processo para as `versions` (todas, se None).
+        No DiskBackend, entradas gravadas por outros workers saem pelo LRU/TTL ou quando o
+        próprio worker que as gravou recebe a invalidação.
+        """
+        with self._lock:
+            if versions is None:
+                versions = list(self._keys_by_version)
+            keys = [key for version in versions for key in self._keys_by_version.pop(version, ())]
+            self._indexed -= len(keys)
+        for key in keys:
+            self.backend.delete(key)
+        self.invalidated += len(keys)
+
+    def stats(self):
+        hits = sum(counter[0] for counter in self._counters.values())
+        misses = sum(counter[1] for counter in self._counters.values())
+        stats = {
+            'backend': type(self.backend).__name__,
+            'entries': len(self.backend),
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': hits / (hits + misses) if hits + misses else 0.0,
+            'invalidated': self.invalidated,
+            'indexed_keys': self._indexed,
+        }
+        for stage, (stage_hits, stage_misses) in sorted(self._counters.items()):
+            stats[f'{stage}_hits'] = stage_hits
+            stats[f'{stage}_misses'] = stage_misses
+        return stats
+
+
+def create_pipeline_from_env():
+    """
+    Cria o StagedPipeline a partir de MF_PIPELINE_BACKEND ('memory' ou 'disk'),
+    MF_PIPELINE_DIR, MF_PIPELINE_MAX_ENTRIES e MF_PIPELINE_TTL (segundos).
+    Com vários workers do gunicorn, 'disk' faz um worker aproveitar o que outro calculou.
+    """
+    backend_name = os.environ.get('MF_PIPELINE_BACKEND', 'memory').lower()
+    ttl = int(os.environ.get('MF_PIPELINE_TTL', 3600))
+    max_entries = os.environ.get('MF_PIPELINE_MAX_ENTRIES')
+
+    if backend_name == 'disk':
+        directory = os.environ.get('MF_PIPELINE_DIR', os.path.join(tempfile.gettempdir(), 'mf_pipeline'))
+        backend = DiskBackend(directory, max_entries=int(max_entries or 1024), ttl=ttl)
+    else:
+        backend = MemoryBackend(max_entries=int(max_entries or 256), ttl=ttl)
+    return StagedPipeline(backend)
@@ -0,0 +1,206 @@
+import numpy as np
+import pandas as pd
+
+
+class RankVolumeIndex:
+    """
+    Índice pré-computado para responder "as N melhores pelo magic_formula_rank com
+    vol_med_2m >= X" sem filtrar e ordenar o universo inteiro a cada interação.
+
+    Guarda duas visões do dataset, montadas uma única vez na carga:
+    - as linhas na ordem do ranking (ordenação estável: empates mantêm a ordem do arquivo);
+    - os volumes em ordem crescente, com a posição no ranking de cada um, para contar
+      por bisseção quantas empresas passam no filtro de liquidez.
+
+    Com a contagem em mãos, a consulta usa o caminho mais barato: se poucas empresas
+    passam no filtro, ordena só elas pela posição no ranking; caso contrário, percorre
+    o ranking em blocos e para assim que encontra as N primeiras.
+    """
+
+    # Colunas usadas na construção: se não mudarem numa recarga, o índice continua válido
+    COLUMNS = ('magic_formula_rank', 'vol_med_2m')
+
+    # Abaixo deste número de empresas elegíveis, ordenar o subconjunto é mais barato que varrer
+    _SMALL_SUBSET = 1024
+
+    def __init__(self, df):
+        rank = df['magic_formula_rank'].to_numpy(dtype=float)
+        volume = df['vol_med_2m'].to_numpy(dtype=float)
+
+        self.size = len(df)
+        self.order_by_rank = np.argsort(rank, kind='stable')
+        self.volume_by_rank = volume[self.order_by_rank]
+
+        valid = np.flatnonzero(~np.isnan(self.volume_by_rank))
+        by_volume = valid[np.argsort(self.volume_by_rank[valid], kind='stable')]
+        self.sorted_volumes = self.volume_by_rank[by_volume]
+        self.rank_position_by_volume = by_volume
+
+    def count_at_least(self, min_volume):
+        """Número de empresas com vol_med_2m >= min_volume (bisseção)."""
+        start = np.searchsorted(self.sorted_volumes, min_volume, side='left')
+        return len(self.sorted_volumes) - start
+
+    def top_n(self, num_empresas, min_volume):
+        """
+        Posições (para df.iloc) das `num_empresas` melhores pelo ranking entre as que
+        têm vol_med_2m >= min_volume, já na ordem do ranking.
+        """
+        num_empresas = max(int(num_empresas or 0), 0)
+        eligible = self.count_at_least(min_volume)
+        if num_empresas == 0 or eligible == 0:
+            return np.empty(0, dtype=np.int64)
+
+        if eligible <= max(self._SMALL_SUBSET, 4 * num_empresas):
+            start = len(self.sorted_volumes) - eligible
+            rank_positions = np.sort(self.rank_position_by_volume[start:])[:num_empresas]
+        else:
+            rank_positions = self._scan(num_empresas, min_volume, eligible)
+        return self.order_by_rank[rank_positions]
+
+    def top_n_masked(self, num_empresas, mask):
+        """Posições das `num_empresas` melhores pelo ranking entre as marcadas em `mask` (n,)."""
+        order = self.order_by_rank
+        return order[mask[order]][:max(int(num_empresas or 0), 0)]
+
+    def _scan(self, num_empresas, min_volume, eligible):
+        # Tamanho do bloco pela densidade esperada de empresas elegíveis no ranking
+        block = max(256, int(2 * num_empresas * self.size / eligible))
+        found = []
+        total = 0
+        for start in range(0, self.size, block):
+            hits = np.flatnonzero(self.volume_by_rank[start:start + block] >= min_volume) + start
+            found.append(hits)
+            total += len(hits)
+            if total >= num_empresas:
+                break
+        return np.concatenate(found)[:num_empresas]
+
+
+class _MetricOrder:
+    """Ordem decrescente de uma métrica (ROIC ou EY), com os grupos de empates pré-computados."""
+
+    def __init__(self, values):
+        valid = np.flatnonzero(~np.isnan(values))
+        self.order = valid[np.argsort(-values[valid], kind='stable')]
+        sorted_values = values[self.order]
+        starts = np.ones(len(sorted_values), dtype=bool)
+        starts[1:] = sorted_values[1:] != sorted_values[:-1]
+        self.has_ties = not starts.all()
+        self.group_of = np.cumsum(starts, dtype=np.int32)
+
+    def ranks(self, mask):
+        """
+        Posições (no DataFrame) das empresas elegíveis (`mask`, forma (n,)) nesta ordem e o
+        rank de cada uma entre as elegíveis: 1 = melhor; empates com o menor posto, como em
+        ingest.compute_magic_formula.
+        """
+        hits = np.flatnonzero(mask[self.order])
+        if not self.has_ties or not len(hits):
+            return self.order[hits], np.arange(1, len(hits) + 1, dtype=np.int32)
+        # Em cada grupo de empate, todos recebem o rank do primeiro elegível do grupo
+        groups = self.group_of[hits]
+        first = np.empty(len(hits), dtype=bool)
+        first[0] = True
+        np.not_equal(groups[1:], groups[:-1], out=first[1:])
+        starts = np.flatnonzero(first)
+        ranks = np.repeat((starts + 1).astype(np.int32), np.diff(starts, append=len(hits)))
+        return self.order[hits], ranks
+
+
+class ReRankIndex:
+    """
+    Ranking da Fórmula Mágica recalculado sobre o universo filtrado.
+
+    O magic_formula_rank do CSV é calculado sobre o universo inteiro: depois do filtro de
+    liquidez (ou de excluir setores), os ranks de ROIC e EY das empresas que sobram deixam
+    de ser consecutivos e a soma deixa de ser a do universo filtrado. Aqui, as ordens
+    decrescentes de ROIC e de EY são montadas uma única vez; a cada filtro, o rank de cada
+    empresa elegível é a contagem acumulada de elegíveis nessa ordem (O(n), sem reordenar).
+    A soma dos ranks é o novo magic_formula_rank, e as N melhores saem por argpartition.
+
+    Filtros: volume mínimo, setores e subsetores excluídos, ROIC e EY mínimos (em %).
+    Empresas sem ROIC ou EY nunca são elegíveis.
+    """
+
+    COLUMNS = ('roic_clean', 'earnings_yield_clean', 'vol_med_2m', 'setor', 'subsetor')
+
+    def __init__(self, df):
+        self.size = len(df)
+        # Métricas em float32 (dataset_schema) continuam em float32: o ROIC/EY mínimo digitado é
+        # arredondado como os valores, e 'ROIC >= 12,3' inclui a empresa com ROIC 12,3
+        self.roic = self._metric(df, 'roic_clean')
+        self.ey = self._metric(df, 'earnings_yield_clean')
+        self.volume = df['vol_med_2m'].to_numpy(dtype=float)
+        self.valid = ~np.isnan(self.roic) & ~np.isnan(self.ey)
+        self.by_roic = _MetricOrder(np.where(self.valid, self.roic, np.nan))
+        self.by_ey = _MetricOrder(np.where(self.valid, self.ey, np.nan))
+
+        # Setor/subsetor como códigos: a exclusão é uma consulta em tabela (código -1 = vazio)
+        self.setor_codes, self.setores = self._codes(df, 'setor')
+        self.subsetor_codes, self.subsetores = self._codes(df, 'subsetor')
+
+    @staticmethod
+    def _metric(df, column):
+        values = df[column].to_numpy()
+        return values if values.dtype == np.float32 else values.astype(float)
+
+    @staticmethod
+    def _codes(df, column):
+        if column not in df.columns:
+            return np.full(len(df), -1, dtype=np.int32), []
+        if isinstance(df[column].dtype, pd.CategoricalDtype):
+            # Coluna category (dataset_schema): os códigos já estão prontos
+            return df[column].cat.codes.to_numpy().astype(np.int32), [str(c) for c in df[column].cat.categories]
+        codes, labels = pd.factorize(df[column])
+        return codes.astype(np.int32), [str(label) for label in labels]
+
+    @staticmethod
+    def _excluded(codes, labels, excluded):
+        lookup = np.zeros(len(labels) + 1, dtype=bool)  # última posição: código -1
+        positions = {label: i for i, label in enumerate(labels)}
+        for label in excluded or ():
+            if label in positions:
+                lookup[positions[label]] = True
+        return lookup[codes]
+
+    def eligible(self, min_volume=0.0, excluded_setores=(), excluded_subsetores=(), min_roic=None, min_ey=None):
+        """Máscara (n,) das empresas que passam em todos os filtros."""
+        mask = self.valid & (self.volume >= min_volume)
+        if excluded_setores:
+            mask &= ~self._excluded(self.setor_codes, self.setores, excluded_setores)
+        if excluded_subsetores:
+            mask &= ~self._excluded(self.subsetor_codes, self.subsetores, excluded_subsetores)
+        if min_roic is not None:
+            mask &= self.roic >= min_roic
+        if min_ey is not None:
+            mask &= self.ey >= min_ey
+        return mask
+
+    def top_n(self, num_empresas, min_volume=0.0, excluded_setores=(), excluded_subsetores=(),
+              min_roic=None, min_ey=None):
+        """
+        As `num_empresas` melhores pelo ranking recalculado entre as elegíveis.
+        Retorna (posições para df.iloc, rank_roic, rank_ey, magic_formula_rank), na ordem do
+        novo ranking; empates na soma mantêm a ordem do arquivo.
+        """
+        mask = self.eligible(min_volume, excluded_setores, excluded_subsetores, min_roic, min_ey)
+        num_empresas = max(int(num_empresas or 0), 0)
+
+        # Só as elegíveis são visitadas depois da máscara: o custo de cada filtro é O(n)
+        # para a máscara e O(elegíveis) para os ranks, sem nenhuma ordenação do universo
+        roic_positions, roic_ranks = self.by_roic.ranks(mask)
+        rank_roic = np.empty(self.size, dtype=np.int32)
+        rank_roic[roic_positions] = roic_ranks
+        positions, ranks_ey = self.by_ey.ranks(mask)
+        ranks_roic = rank_roic[positions]
+        total = ranks_roic + ranks_ey
+
+        # Chave única (soma, posição no arquivo): argpartition + ordenação só das N escolhidas
+        key = total.astype(np.int64) * self.size + positions
+        if num_empresas < len(key):
+            chosen = np.argpartition(key, num_empresas - 1)[:num_empresas] if num_empresas else np.empty(0, dtype=np.int64)
+        else:
+            chosen = np.arange(len(key))
+        chosen = chosen[np.argsort(key[chosen])]
+        return positions[chosen], ranks_roic[chosen], ranks_ey[chosen], total[chosen]
@@ -0,0 +1,218 @@
+"""
+Rebalanceamento de carteiras existentes para a seleção da Fórmula Mágica.
+
+A partir das posições atuais (ticker -> quantidade) e da seleção alvo (as N empresas do
+ranking), calcula as ordens de compra e venda que levam cada carteira a pesos iguais,
+respeitando o lote de 'tipo-compra-radio' (ver allocation.rebalance_batch). Empresas que
+saíram da seleção são vendidas integralmente; posições em tickers ausentes do snapshot
+também (sem cotação, o valor da venda não entra no caixa).
+
+Várias carteiras são rebalanceadas de uma vez contra o mesmo snapshot: as posições viram
+uma matriz (carteiras x tickers) e o cálculo é um único conjunto de operações vetorizadas.
+
+Uso (posições de várias carteiras em CSV com as colunas carteira, ticker e qtd):
+    python rebalance.py carteiras.csv --n 20 --min-volume 20.000.000 --lote padrao \\
+        --aporte 0 --aportes aportes.csv --output ordens.csv
+"""
+import argparse
+import base64
+import re
+import time
+
+import numpy as np
+import pandas as pd
+
+from allocation import TIPO_COMPRA_FRACIONARIO, TIPO_COMPRA_PADRAO, lot_size_for, rebalance_batch
+from formatting import parse_br_number, parse_number_text
+
+ORDER_COLUMNS = ['carteira', 'ticker', 'operacao', 'qtd_atual', 'qtd_acoes', 'ordem_qtd', 'cotacao', 'valor_ordem']
+OPERACAO_VENDA = 'Venda'
+OPERACAO_COMPRA = 'Compra'
+OPERACAO_MANTER = 'Manter'
+
+_HOLDING_LINE = re.compile(r'^\s*([A-Za-z0-9]+)\s*[;,\t ]+\s*([\d.,]+)\s*$')
+
+
+def normalize_ticker(ticker):
+    """Ticker em maiúsculas, sem o sufixo 'F' do mercado fracionário (PETR4F -> PETR4)."""
+    ticker = ticker.strip().upper()
+    if len(ticker) >= 6 and ticker.endswith('F') and ticker[-2].isdigit():
+        ticker = ticker[:-1]
+    return ticker
+
+
+def parse_holdings(text):
+    """
+    Lê posições coladas ou de um CSV: uma por linha, "TICKER;QTD" (também com ',', tab ou
+    espaço; quantidades no padrão BR, e.g. 1.000). Linhas vazias, comentários (#) e um
+    cabeçalho sem números são ignorados; tickers repetidos são somados. Quantidades que não
+    são números inteiros (e.g. 10.5 ou 1,2,3) vão para as linhas inválidas.
+    Retorna ({ticker: qtd}, linhas inválidas).
+    """
+    holdings = {}
+    invalid = []
+    for number, line in enumerate((text or '').splitlines()):
+        if not line.strip() or line.lstrip().startswith('#'):
+            continue
+        match = _HOLDING_LINE.match(line)
+        try:
+            quantity = parse_number_text(match.group(2)) if match else None
+        except ValueError:
+            quantity = None
+        if quantity is None or quantity < 0 or quantity != int(quantity):
+            if not (number == 0 and not any(char.isdigit() for char in line)):
+                invalid.append(line.strip())
+            continue
+        ticker = normalize_ticker(match.group(1))
+        holdings[ticker] = holdings.get(ticker, 0) + int(quantity)
+    return {ticker: qtd for ticker, qtd in holdings.items() if qtd > 0}, invalid
+
+
+def decode_upload(contents):
+    """Texto de um arquivo enviado pelo dcc.Upload ('data:<tipo>;base64,<conteúdo>')."""
+    data = base64.b64decode(contents.split(',', 1)[-1])
+    try:
+        return data.decode('utf-8-sig')
+    except UnicodeDecodeError:
+        return data.decode('latin-1')
+
+
+def holdings_matrix(portfolios, tickers):
+    """
+    Matriz (carteiras x tickers) com as quantidades de cada carteira (lista de dicts
+    {ticker: qtd}). Tickers das carteiras que não estão em `tickers` são acrescentados ao
+    final, na ordem em que aparecem. Retorna (matriz, lista de tickers estendida).
+    """
+    # Ticker repetido no universo: a posição fica na primeira linha
+    columns = {}
+    for position, ticker in enumerate(tickers):
+        columns.setdefault(ticker, position)
+    extra = []
+    for holdings in portfolios:
+        for ticker in holdings:
+            if ticker not in columns:
+                columns[ticker] = len(tickers) + len(extra)
+                extra.append(ticker)
+
+    matrix = np.zeros((len(portfolios), len(tickers) + len(extra)))
+    for row, holdings in enumerate(portfolios):
+        if holdings:
+            matrix[row, [columns[ticker] for ticker in holdings]] = list(holdings.values())
+    return matrix, list(tickers) + extra
+
+
+def rebalance_universe(df_universe, target_mask, portfolios, tipo_compra, cash=0.0, df_reference=None):
+    """
+    Rebalanceia as carteiras (lista de dicts {ticker: qtd}) contra o universo `df_universe`
+    (DataFrame com 'ticker' e 'cotacao'), com a seleção alvo `target_mask` (n,) e o aporte
+    `cash` (escalar ou um valor por carteira).
+
+    Tickers das carteiras fora do universo ganham uma linha no final: com os dados de
+    `df_reference` (e.g., o snapshot inteiro, quando o universo são só as N filtradas) ou só
+    com o ticker, sem cotação. Retorna (universo estendido, qtd_atual, qtd_alvo, ordem,
+    caixa_final), as matrizes com forma (carteiras, linhas do universo estendido).
+    """
+    tickers = df_universe['ticker'].tolist()
+    qtd_atual, all_tickers = holdings_matrix(portfolios, tickers)
+
+    universe = df_universe
+    if len(all_tickers) > len(tickers):
+        extra = pd.DataFrame({'ticker': all_tickers[len(tickers):]})
+        if df_reference is not None:
+            reference = df_reference.drop_duplicates('ticker')
+            extra = extra.merge(reference, on='ticker', how='left')
+        universe = pd.concat([df_universe, extra], ignore_index=True)
+
+    cotacao = pd.to_numeric(universe['cotacao'], errors='coerce').to_numpy(dtype=float)
+    mask = np.zeros(len(universe), dtype=bool)
+    mask[:len(df_universe)] = np.asarray(target_mask, dtype=bool)
+    qtd_alvo, ordem, caixa_final = rebalance_batch(cotacao, mask, qtd_atual, cash, lot_size_for(tipo_compra))
+    return universe, qtd_atual, qtd_alvo, ordem, caixa_final
+
+
+def orders_frame(universe, qtd_atual, qtd_alvo, ordem, labels=None):
+    """
+    Ordens em formato longo (ORDER_COLUMNS): uma linha por carteira e ticker com posição
+    atual ou alvo. Em cada carteira, as vendas vêm antes das compras (financiam as compras).
+    """
+    k = qtd_atual.shape[0]
+    rows, cols = np.nonzero((qtd_atual > 0) | (qtd_alvo > 0))
+    cotacao = pd.to_numeric(universe['cotacao'], errors='coerce').to_numpy(dtype=float)
+    quantidade = ordem[rows, cols]
+    operacao = np.select([quantidade < 0, quantidade > 0], [OPERACAO_VENDA, OPERACAO_COMPRA], OPERACAO_MANTER)
+    labels = np.asarray(labels if labels is not None else range(k), dtype=object)
+
+    orders = pd.DataFrame({
+        'carteira': labels[rows],
+        'ticker': universe['ticker'].to_numpy(dtype=object)[cols],
+        'operacao': operacao,
+        'qtd_atual': qtd_atual[rows, cols],
+        'qtd_acoes': qtd_alvo[rows, cols],
+        'ordem_qtd': quantidade,
+        'cotacao': cotacao[cols],
+        'valor_ordem': quantidade * cotacao[cols],
+    })
+    order_rank = np.select([quantidade < 0, quantidade > 0], [0, 1], 2)
+    sort_index = np.lexsort((cols, order_rank, rows))
+    return orders.iloc[sort_index].reset_index(drop=True)
+
+
+def read_portfolios(path):
+    """
+    Carteiras de um CSV com as colunas carteira, ticker e qtd (separador detectado).
+    Retorna (rótulos, lista de dicts {ticker: qtd}).
+    """
+    df = pd.read_csv(path, sep=None, engine='python', dtype=str)
+    df.columns = [col.strip().lower() for col in df.columns]
+    df['ticker'] = df['ticker'].map(normalize_ticker)
+    df['qtd'] = df['qtd'].map(parse_br_number)
+    grouped = df.groupby('carteira', sort=False)
+    labels = list(grouped.groups)
+    portfolios = [grouped.get_group(label).groupby('ticker', sort=False)['qtd'].sum().to_dict() for label in labels]
+    return labels, portfolios
+
+
+def _read_aportes(path, labels, default):
+    if not path:
+        return default
+    df = pd.read_csv(path, sep=None, engine='python', dtype=str)
+    df.columns = [col.strip().lower() for col in df.columns]
+    aportes = dict(zip(df['carteira'], df['aporte'].map(parse_br_number)))
+    return np.array([aportes.get(label, default) for label in labels], dtype=float)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebalanceamento de várias carteiras para a seleção da Fórmula Mágica.")
+    parser.add_argument('carteiras', help="CSV com as colunas carteira, ticker e qtd")
+    parser.add_argument('--n', type=int, default=20, help="Número de empresas da seleção alvo")
+    parser.add_argument('--min-volume', default='20.000.000', help="Volume mínimo (R$)")
+    parser.add_argument('--lote', choices=['fracionario', 'padrao'], default='fracionario')
+    parser.add_argument('--aporte', default='0', help="Aporte de cada carteira (R$)")
+    parser.add_argument('--aportes', help="CSV com as colunas carteira e aporte (sobrescreve --aporte)")
+    parser.add_argument('--data-file', default='fundamentus_data.csv')
+    parser.add_argument('--output', default='ordens.csv')
+    args = parser.parse_args()
+
+    from rank_index import RankVolumeIndex
+    from snapshot import load_dataset
+
+    df = load_dataset(args.data_file)
+    target_mask = np.zeros(len(df), dtype=bool)
+    target_mask[RankVolumeIndex(df).top_n(args.n, parse_br_number(args.min_volume))] = True
+    labels, portfolios = read_portfolios(args.carteiras)
+    cash = _read_aportes(args.aportes, labels, parse_br_number(args.aporte))
+    tipo_compra = {'fracionario': TIPO_COMPRA_FRACIONARIO, 'padrao': TIPO_COMPRA_PADRAO}[args.lote]
+
+    start = time.perf_counter()
+    universe, qtd_atual, qtd_alvo, ordem, caixa_final = rebalance_universe(df, target_mask, portfolios, tipo_compra, cash)
+    orders = orders_frame(universe, qtd_atual, qtd_alvo, ordem, labels)
+    elapsed = time.perf_counter() - start
+
+    orders[ORDER_COLUMNS].to_csv(args.output, index=False)
+    with_orders = orders[orders['operacao'] != OPERACAO_MANTER]
+    print(f"{len(labels)} carteiras, {len(with_orders)} ordens em {elapsed:.2f}s -> {args.output}")
+    print(f"Caixa restante: total R$ {caixa_final.sum():.2f}, máximo R$ {caixa_final.max(initial=0.0):.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,180 @@
+"""
+Snapshot colunar compilado a partir do fundamentus_data.csv.
+
+O snapshot é um diretório com um arquivo .npy por coluna e um schema.json descrevendo
+nomes, tipos e o CSV de origem. Colunas numéricas e de data são abertas com
+np.load(mmap_mode='r'): o DataFrame aponta direto para as páginas do arquivo (sem cópia
+nem parse), e todos os processos da máquina compartilham a mesma cópia no page cache.
+Colunas de texto são guardadas como códigos int32 + lista de valores distintos; colunas
+category (setor, subsetor: ver dataset_schema.py) voltam como category, direto dos códigos.
+
+Uso: python snapshot.py fundamentus_data.csv [--output fundamentus_data.snapshot]
+"""
+import argparse
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from dataset_schema import apply_schema
+
+SCHEMA_FILE = 'schema.json'
+SCHEMA_VERSION = 1
+
+
+def read_fundamentus_csv(path, typed=True):
+    """
+    Lê o CSV exportado e aplica as conversões de tipo esperadas pelo dashboard: com `typed`,
+    o schema de dataset_schema.py (nomes normalizados, tipos compactos e índice de tickers).
+    """
+    df = pd.read_csv(path)
+
+    if 'data_execucao' in df.columns:
+        df['data_execucao'] = pd.to_datetime(df['data_execucao'], errors='coerce')
+
+    for alloc_col in ['valor_alocado', 'qtd_acoes', 'peso_carteira']:
+        if alloc_col not in df.columns:
+            df[alloc_col] = 0.0
+
+    return apply_schema(df) if typed else df
+
+
+def snapshot_path_for(csv_path):
+    """Caminho padrão do snapshot de um CSV: 'dados.csv' -> 'dados.snapshot'."""
+    return os.path.splitext(csv_path)[0] + '.snapshot'
+
+
+def _source_signature(csv_path):
+    st = os.stat(csv_path)
+    return {'path': os.path.basename(csv_path), 'mtime_ns': st.st_mtime_ns, 'size': st.st_size}
+
+
+def _write_column(directory, position, series):
+    name = f"col_{position:03d}.npy"
+    column = {'name': series.name, 'file': name}
+
+    if pd.api.types.is_datetime64_any_dtype(series):
+        values = series.to_numpy()
+        column['dtype'] = f"datetime64[{np.datetime_data(values.dtype)[0]}]"
+        np.save(os.path.join(directory, name), values.view(np.int64))
+    elif pd.api.types.is_bool_dtype(series) or pd.api.types.is_numeric_dtype(series):
+        values = series.to_numpy()
+        column['dtype'] = values.dtype.str
+        np.save(os.path.join(directory, name), np.ascontiguousarray(values))
+    elif isinstance(series.dtype, pd.CategoricalDtype):
+        # Os códigos já existem: gravados como estão, com as categorias na mesma ordem
+        column['dtype'] = 'category'
+        column['categories'] = [str(c) for c in series.cat.categories]
+        np.save(os.path.join(directory, name), series.cat.codes.to_numpy().astype(np.int32))
+    else:
+        codes, categories = pd.factorize(series, use_na_sentinel=True)
+        column['dtype'] = 'text'
+        column['pandas_dtype'] = str(series.dtype)
+        column['categories'] = [str(c) for c in categories]
+        np.save(os.path.join(directory, name), codes.astype(np.int32))
+    return column
+
+
+def write_snapshot(df, output_path, source=None):
+    """
+    Grava o DataFrame como snapshot colunar. A escrita é atômica: o diretório é montado
+    em um caminho temporário e só então trocado pelo anterior.
+    """
+    parent = os.path.dirname(os.path.abspath(output_path))
+    os.makedirs(parent, exist_ok=True)
+    tmp_dir = tempfile.mkdtemp(prefix='.snapshot-', dir=parent)
+    try:
+        columns = [_write_column(tmp_dir, i, df[col]) for i, col in enumerate(df.columns)]
+        schema = {'schema_version': SCHEMA_VERSION, 'rows': len(df), 'source': source, 'columns': columns}
+        with open(os.path.join(tmp_dir, SCHEMA_FILE), 'w', encoding='utf-8') as f:
+            json.dump(schema, f, ensure_ascii=False, indent=1)
+
+        old_dir = None
+        if os.path.exists(output_path):
+            old_dir = tempfile.mkdtemp(prefix='.snapshot-old-', dir=parent)
+            os.rmdir(old_dir)
+            os.rename(output_path, old_dir)
+        os.rename(tmp_dir, output_path)
+        if old_dir is not None:
+            # Processos que já mapearam os arquivos antigos continuam lendo normalmente
+            shutil.rmtree(old_dir, ignore_errors=True)
+    except BaseException:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+    return output_path
+
+
+def compile_snapshot(csv_path, output_path=None):
+    """Converte o CSV em snapshot colunar, registrando mtime/tamanho do CSV de origem."""
+    output_path = output_path or snapshot_path_for(csv_path)
+    source = _source_signature(csv_path)
+    return write_snapshot(read_fundamentus_csv(csv_path), output_path, source)
+
+
+def read_schema(snapshot_path):
+    with open(os.path.join(snapshot_path, SCHEMA_FILE), encoding='utf-8') as f:
+        return json.load(f)
+
+
+def load_snapshot(snapshot_path):
+    """Abre o snapshot como DataFrame; colunas numéricas e datas ficam mapeadas em memória."""
+    schema = read_schema(snapshot_path)
+    data = {}
+    for column in schema['columns']:
+        # view(np.ndarray): continua apontando para o arquivo mapeado, mas sem a subclasse memmap
+        values = np.load(os.path.join(snapshot_path, column['file']), mmap_mode='r').view(np.ndarray)
+        if column['dtype'] == 'category':
+            data[column['name']] = pd.Categorical.from_codes(np.asarray(values), categories=column['categories'])
+        elif column['dtype'] == 'text':
+            categories = np.asarray(column['categories'] + [np.nan], dtype=object)
+            text = pd.Series(categories[np.asarray(values)], name=column['name'])
+            if column.get('pandas_dtype', 'object') != 'object':
+                text = text.astype(column['pandas_dtype'])
+            data[column['name']] = text
+        elif column['dtype'].startswith('datetime64'):
+            data[column['name']] = values.view(column['dtype'])
+        else:
+            data[column['name']] = values
+    # Snapshots compilados antes do schema são convertidos aqui (os já tipados não são copiados)
+    return apply_schema(pd.DataFrame(data, copy=False))
+
+
+def is_snapshot_fresh(csv_path, snapshot_path):
+    """O snapshot existe e foi compilado a partir da versão atual do CSV (ou o CSV não existe)."""
+    if not os.path.exists(os.path.join(snapshot_path, SCHEMA_FILE)):
+        return False
+    if not os.path.exists(csv_path):
+        return True
+    try:
+        source = read_schema(snapshot_path)['source']
+        current = _source_signature(csv_path)
+    except (OSError, ValueError, KeyError):
+        return False
+    if not source:
+        return False
+    return source['mtime_ns'] == current['mtime_ns'] and source['size'] == current['size']
+
+
+def load_dataset(csv_path, snapshot_path=None):
+    """Carrega o snapshot compilado quando ele está atualizado; caso contrário, lê o CSV."""
+    snapshot_path = snapshot_path or snapshot_path_for(csv_path)
+    if is_snapshot_fresh(csv_path, snapshot_path):
+        return load_snapshot(snapshot_path)
+    return read_fundamentus_csv(csv_path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compila o CSV do Fundamentus em um snapshot colunar (.npy).")
+    parser.add_argument('csv_path', nargs='?', default='fundamentus_data.csv')
+    parser.add_argument('--output', help="Diretório do snapshot (padrão: <csv>.snapshot)")
+    args = parser.parse_args()
+
+    output_path = compile_snapshot(args.csv_path, args.output)
+    print(f"Snapshot gravado em {output_path} ({read_schema(output_path)['rows']} linhas).")
+
+
+if __name__ == '__main__':
+    main()
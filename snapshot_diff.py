@@ -0,0 +1,130 @@
+"""
+Diferença entre duas versões do dataset, casando as linhas pelo ticker.
+
+Usada na recarga do dataset (data_cache.DatasetCache) para saber o que mudou entre a
+versão residente e a nova: tickers adicionados, removidos e alterados, e quais colunas
+mudaram. Com isso, estruturas derivadas que só dependem de colunas inalteradas (e.g., o
+índice de ranking quando apenas as cotações mudaram) são reaproveitadas.
+
+Uso: python snapshot_diff.py antigo.csv novo.csv
+"""
+import argparse
+
+import numpy as np
+import pandas as pd
+
+
+def _keyed_index(df, key):
+    # Tickers podem se repetir no CSV; a ordem de ocorrência desempata
+    keys = df[key].astype(str).to_numpy()
+    occurrence = df.groupby(key, sort=False).cumcount().to_numpy()
+    return pd.MultiIndex.from_arrays([keys, occurrence])
+
+
+def _changed_rows(old_values, new_values):
+    """Máscara das posições em que os valores diferem (NaN == NaN)."""
+    # Categoricals só se comparam com as mesmas categorias: compara os valores
+    if isinstance(old_values.dtype, pd.CategoricalDtype) or isinstance(new_values.dtype, pd.CategoricalDtype):
+        old_values, new_values = old_values.astype(object), new_values.astype(object)
+    equal = old_values.eq(new_values).fillna(False).to_numpy(dtype=bool)
+    both_missing = old_values.isna().to_numpy() & new_values.isna().to_numpy()
+    return ~(equal | both_missing)
+
+
+class SnapshotDiff:
+    """Resultado de diff_frames: tickers adicionados/removidos/alterados e colunas alteradas."""
+
+    def __init__(self, added, removed, changed, changed_columns, same_layout, rows_old, rows_new):
+        self.added = added
+        self.removed = removed
+        self.changed = changed
+        self.changed_columns = changed_columns
+        self.same_layout = same_layout
+        self.rows_old = rows_old
+        self.rows_new = rows_new
+
+    def __bool__(self):
+        return bool(self.added or self.removed or self.changed or not self.same_layout)
+
+    def unchanged(self, columns):
+        """
+        True se as linhas estão nas mesmas posições e nenhuma das `columns` mudou, ou seja,
+        uma estrutura derivada só dessas colunas (com posições para df.iloc) continua válida.
+        """
+        return self.same_layout and not any(column in self.changed_columns for column in columns)
+
+    def summary(self):
+        return {
+            'rows_old': self.rows_old,
+            'rows_new': self.rows_new,
+            'added': len(self.added),
+            'removed': len(self.removed),
+            'changed': len(self.changed),
+            'changed_columns': dict(self.changed_columns),
+            'same_layout': self.same_layout,
+        }
+
+
+def diff_frames(old, new, key='ticker', columns=None):
+    """
+    Compara dois DataFrames linha a linha pelo `key`. `columns` limita as colunas
+    comparadas (padrão: todas, exceto a chave). Colunas que só existem em um dos lados
+    contam como alteradas em todas as linhas.
+    """
+    if columns is None:
+        columns = [c for c in dict.fromkeys(list(old.columns) + list(new.columns)) if c != key]
+
+    old_index = _keyed_index(old, key)
+    new_index = _keyed_index(new, key)
+    same_rows = old_index.equals(new_index)
+    if same_rows:
+        old_positions = new_positions = np.arange(len(new))
+        added = removed = []
+    else:
+        old_positions = old_index.get_indexer(new_index)
+        matched = old_positions >= 0
+        new_positions = np.flatnonzero(matched)
+        old_positions = old_positions[matched]
+        added = new_index[~matched].get_level_values(0).tolist()
+        removed_mask = np.ones(len(old_index), dtype=bool)
+        removed_mask[old_positions] = False
+        removed = old_index[removed_mask].get_level_values(0).tolist()
+
+    changed_mask = np.zeros(len(new_positions), dtype=bool)
+    changed_columns = {}
+    for column in columns:
+        if column not in old.columns or column not in new.columns:
+            changed_columns[column] = len(new_positions)
+            changed_mask[:] = True
+            continue
+        old_values = old[column].iloc[old_positions].reset_index(drop=True)
+        new_values = new[column].iloc[new_positions].reset_index(drop=True)
+        column_changed = _changed_rows(old_values, new_values)
+        count = int(column_changed.sum())
+        if count:
+            changed_columns[column] = count
+            changed_mask |= column_changed
+
+    changed = new[key].iloc[new_positions[changed_mask]].astype(str).tolist()
+    same_layout = same_rows and list(old.columns) == list(new.columns)
+    return SnapshotDiff(added, removed, changed, changed_columns, same_layout, len(old), len(new))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mostra o que mudou entre duas exportações do Fundamentus.")
+    parser.add_argument('old_csv')
+    parser.add_argument('new_csv')
+    args = parser.parse_args()
+
+    from snapshot import load_dataset
+    diff = diff_frames(load_dataset(args.old_csv), load_dataset(args.new_csv))
+    for name, value in diff.summary().items():
+        print(f"{name}: {value}")
+    if diff.added:
+        print("Adicionados:", ', '.join(diff.added))
+    if diff.removed:
+        print("Removidos:", ', '.join(diff.removed))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,200 @@
+"""
+Varredura de parâmetros do ranking/alocação em paralelo.
+
+Avalia uma grade de (número de empresas, volume mínimo, tipo de lote, valor a investir)
+sobre um ou vários snapshots. Os arrays usados no cálculo (cotação e volume na ordem do
+ranking de cada snapshot) são publicados uma única vez em um bloco de memória
+compartilhada; os processos do pool apenas se conectam a ele, sem receber o DataFrame
+por pickle. Cada tarefa avalia um lote de combinações da grade de forma vetorizada
+(seleção das N melhores por soma acumulada + allocation.rebalance_batch a partir de uma
+carteira vazia). A alocação nunca passa do valor a investir: quando o arredondamento para o
+lote mais próximo passaria, a combinação usa o arredondamento para baixo, como o backtest.
+
+Uso:
+    python sweep.py --n 10 20 30 --min-volume 0 1.000.000 20.000.000 \\
+        --lote fracionario padrao --invest 10.000 100.000 --dates latest --output sweep.csv
+"""
+import argparse
+import concurrent.futures
+import itertools
+import os
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+from allocation import TIPO_COMPRA_FRACIONARIO, TIPO_COMPRA_PADRAO, lot_size_for, rebalance_batch
+from formatting import parse_br_number
+
+RESULT_COLUMNS = [
+    'snapshot', 'num_empresas', 'min_volume', 'tipo_compra', 'total_investimento',
+    'num_selecionadas', 'total_alocado', 'nao_alocado', 'pct_alocado', 'peso_max', 'peso_min',
+]
+
+# Arrays do processo atual: (cotacao_por_rank, volume_por_rank) de cada snapshot
+_WORKER_ARRAYS = None
+_WORKER_SHM = None
+
+
+def _rank_ordered_arrays(df):
+    order = np.argsort(df['magic_formula_rank'].to_numpy(dtype=float), kind='stable')
+    cotacao = pd.to_numeric(df['cotacao'], errors='coerce').to_numpy(dtype=float)[order]
+    volume = df['vol_med_2m'].to_numpy(dtype=float)[order]
+    return cotacao, volume
+
+
+def _views(buffer, layout):
+    arrays = []
+    for offset, length in layout:
+        block = np.ndarray((2, length), dtype=np.float64, buffer=buffer, offset=offset * 8)
+        arrays.append((block[0], block[1]))
+    return arrays
+
+
+def _attach_shared_memory(name, layout):
+    """Inicializador do pool: conecta ao bloco compartilhado e monta views (sem cópia)."""
+    global _WORKER_ARRAYS, _WORKER_SHM
+    _WORKER_SHM = shared_memory.SharedMemory(name=name)
+    _WORKER_ARRAYS = _views(_WORKER_SHM.buf, layout)
+
+
+def evaluate_grid(cotacao, volume, grid):
+    """
+    Avalia combinações da grade para um snapshot (arrays na ordem do ranking).
+    `grid` é um DataFrame com num_empresas, min_volume, tipo_compra e total_investimento.
+    O valor de cada combinação é dividido igualmente entre as selecionadas com cotação, e
+    nao_alocado nunca é negativo.
+    """
+    num_empresas = grid['num_empresas'].to_numpy(dtype=np.int64)
+    min_volume = grid['min_volume'].to_numpy(dtype=float)
+    total_invest = grid['total_investimento'].to_numpy(dtype=float)
+    lot_sizes = np.array([lot_size_for(t) for t in grid['tipo_compra']], dtype=float)
+
+    # As N primeiras do ranking entre as que passam no filtro de liquidez, para cada combinação.
+    # Só o início do ranking importa: o prefixo examinado dobra até cobrir as N de todas as linhas.
+    prefix = min(len(volume), 1024)
+    while True:
+        eligible = volume[np.newaxis, :prefix] >= min_volume[:, np.newaxis]
+        counts = np.cumsum(eligible, axis=1)
+        if prefix == len(volume) or (counts[:, -1] >= num_empresas).all():
+            break
+        prefix = min(len(volume), prefix * 2)
+    masks = eligible & (counts <= num_empresas[:, np.newaxis])
+
+    # Sem posições atuais, o rebalanceamento é a alocação inicial (sem passar do valor)
+    qtd, _, _ = rebalance_batch(cotacao[:prefix], masks, np.zeros(masks.shape), total_invest, lot_sizes)
+    valor = qtd * np.nan_to_num(cotacao[:prefix])
+    total_alocado = valor.sum(axis=1)
+    peso = np.divide(valor * 100, total_alocado[:, np.newaxis], out=np.zeros_like(valor),
+                     where=total_alocado[:, np.newaxis] > 0)
+    has_selection = masks.any(axis=1)
+    return pd.DataFrame({
+        'num_selecionadas': masks.sum(axis=1),
+        'total_alocado': total_alocado,
+        'nao_alocado': total_invest - total_alocado,
+        'pct_alocado': np.divide(total_alocado * 100, total_invest, out=np.zeros(len(grid)), where=total_invest > 0),
+        'peso_max': np.where(has_selection, np.where(masks, peso, -np.inf).max(axis=1), np.nan),
+        'peso_min': np.where(has_selection, np.where(masks, peso, np.inf).min(axis=1), np.nan),
+    }, index=grid.index)
+
+
+def _run_task(snapshot_position, grid):
+    cotacao, volume = _WORKER_ARRAYS[snapshot_position]
+    return evaluate_grid(cotacao, volume, grid)
+
+
+def build_grid(num_empresas, min_volumes, tipos_compra, total_invests):
+    rows = itertools.product(num_empresas, min_volumes, tipos_compra, total_invests)
+    return pd.DataFrame(list(rows), columns=['num_empresas', 'min_volume', 'tipo_compra', 'total_investimento'])
+
+
+def run_sweep(snapshots, grid, workers=None, chunk_size=256):
+    """
+    Avalia `grid` em todos os `snapshots` ({rótulo: DataFrame}) e retorna a tabela de resultados.
+    Com workers > 1, os snapshots vão para memória compartilhada e as tarefas para um pool
+    de processos; com workers=1, tudo roda no processo atual.
+    """
+    workers = workers or os.cpu_count() or 1
+    labels = list(snapshots)
+    arrays = [_rank_ordered_arrays(snapshots[label]) for label in labels]
+    chunks = [grid.iloc[i:i + chunk_size] for i in range(0, len(grid), chunk_size)]
+    tasks = [(position, chunk) for position in range(len(labels)) for chunk in chunks]
+
+    if workers == 1:
+        results = [evaluate_grid(*arrays[position], chunk) for position, chunk in tasks]
+    else:
+        layout = []
+        offset = 0
+        for cotacao, _ in arrays:
+            layout.append((offset, len(cotacao)))
+            offset += 2 * len(cotacao)
+        shm = shared_memory.SharedMemory(create=True, size=max(offset, 1) * 8)
+        try:
+            for (cotacao, volume), view in zip(arrays, _views(shm.buf, layout)):
+                view[0][:] = cotacao
+                view[1][:] = volume
+            with concurrent.futures.ProcessPoolExecutor(
+                max_workers=workers, initializer=_attach_shared_memory, initargs=(shm.name, layout)
+            ) as pool:
+                results = list(pool.map(_run_task, *zip(*tasks)))
+        finally:
+            shm.close()
+            shm.unlink()
+
+    frames = []
+    for (position, chunk), result in zip(tasks, results):
+        frames.append(pd.concat([chunk, result], axis=1).assign(snapshot=labels[position]))
+    return pd.concat(frames, ignore_index=True)[RESULT_COLUMNS]
+
+
+def _load_snapshots(dates, history_root, data_file):
+    from history import SnapshotHistory
+    from snapshot import load_dataset
+
+    history = SnapshotHistory(history_root, max_resident=1)
+    snapshots = {}
+    for date in dates:
+        if date == 'latest':
+            snapshots[date] = load_dataset(data_file)
+        elif date == 'all':
+            for history_date in history.dates():
+                snapshots[history_date.isoformat()] = history.load(history_date)
+        else:
+            snapshots[date] = history.load(date)
+    return snapshots
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Varredura paralela de parâmetros de ranking e alocação.")
+    parser.add_argument('--n', type=int, nargs='+', default=[20], help="Números de empresas")
+    parser.add_argument('--min-volume', nargs='+', default=['20.000.000'], help="Volumes mínimos (R$)")
+    parser.add_argument('--lote', nargs='+', choices=['fracionario', 'padrao'], default=['fracionario'])
+    parser.add_argument('--invest', nargs='+', default=['10.000'], help="Valores a investir (R$)")
+    parser.add_argument('--dates', nargs='+', default=['latest'],
+                        help="'latest' (CSV atual), 'all' (todo o histórico) ou datas AAAA-MM-DD")
+    parser.add_argument('--root', default='history', help="Diretório do histórico (history.py)")
+    parser.add_argument('--data-file', default='fundamentus_data.csv')
+    parser.add_argument('--workers', type=int, default=None, help="Processos (padrão: número de CPUs)")
+    parser.add_argument('--output', default='sweep_results.csv')
+    args = parser.parse_args()
+
+    tipos = {'fracionario': TIPO_COMPRA_FRACIONARIO, 'padrao': TIPO_COMPRA_PADRAO}
+    grid = build_grid(
+        args.n,
+        [parse_br_number(v) for v in args.min_volume],
+        [tipos[t] for t in args.lote],
+        [parse_br_number(v) for v in args.invest],
+    )
+    snapshots = _load_snapshots(args.dates, args.root, args.data_file)
+
+    start = time.perf_counter()
+    results = run_sweep(snapshots, grid, workers=args.workers)
+    elapsed = time.perf_counter() - start
+
+    results.to_csv(args.output, index=False)
+    print(f"{len(results)} combinações ({len(grid)} x {len(snapshots)} snapshots) em {elapsed:.2f}s -> {args.output}")
+
+
+if __name__ == '__main__':
+    main()
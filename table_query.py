@@ -0,0 +1,132 @@
+"""
+Filtro, ordenação e paginação da tabela no servidor (DataTable com page_action,
+sort_action e filter_action = 'custom').
+
+O DataTable envia a consulta de filtro como texto (e.g., "{cotacao} > 10 && {setor}
+icontains energia"), a ordenação como lista de {'column_id', 'direction'} e a página
+atual. Tudo é aplicado sobre os valores brutos do DataFrame (números comparados como
+números); só a página visível é formatada depois, em app.py.
+"""
+import math
+import re
+
+import numpy as np
+import pandas as pd
+
+from formatting import parse_number_text
+
+_FILTER_PART = re.compile(r'^\s*\{(?P<column>[^}]*)\}\s*(?P<operator>>=|<=|!=|<|>|=|[a-z]+)\s*(?P<value>.*?)\s*$')
+_SYMBOLS = {'>=': 'ge', '<=': 'le', '<': 'lt', '>': 'gt', '!=': 'ne', '=': 'eq'}
+_OPERATORS = {'ge', 'le', 'lt', 'gt', 'ne', 'eq', 'contains', 'datestartswith'}
+
+
+def parse_filter_query(filter_query):
+    """
+    Converte a consulta do DataTable em uma lista de (coluna, operador, valor, case_sensitive).
+    Partes que não seguem o formato "{coluna} operador valor" são ignoradas.
+    """
+    conditions = []
+    for part in (filter_query or '').split(' && '):
+        match = _FILTER_PART.match(part)
+        if match is None:
+            continue
+        operator = _SYMBOLS.get(match['operator'], match['operator'])
+        case_sensitive = True
+        if operator not in _OPERATORS and operator[:1] in ('i', 's') and operator[1:] in _OPERATORS:
+            case_sensitive = operator[0] == 's'
+            operator = operator[1:]
+        if operator not in _OPERATORS:
+            continue
+
+        value = match['value']
+        if len(value) >= 2 and value[0] == value[-1] and value[0] in ('"', "'", '`'):
+            value = value[1:-1].replace('\\' + value[0], value[0])
+        conditions.append((match['column'], operator, value, case_sensitive))
+    return conditions
+
+
+def _to_number(value):
+    # Como na tabela (e na API): "1.000" é mil, "1.000,50" e "10,5" são BR e "10.5" é decimal
+    try:
+        return parse_number_text(value)
+    except ValueError:
+        return math.nan
+
+
+def _text_values(series, formatter):
+    if formatter is not None:
+        return pd.Series(formatter(series), index=series.index).astype(object)
+    return series.astype(object).where(series.notna(), None).map(lambda v: None if v is None else str(v))
+
+
+def _condition_mask(series, operator, value, case_sensitive, formatter):
+    numeric = pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series)
+
+    if operator in ('contains', 'datestartswith') or not numeric:
+        # Comparações de texto usam o valor como exibido na tabela
+        text = _text_values(series, formatter)
+        needle = str(value)
+        if not case_sensitive:
+            text = text.str.lower()
+            needle = needle.lower()
+        if operator == 'contains':
+            return text.str.contains(needle, regex=False).fillna(False).to_numpy(dtype=bool)
+        if operator == 'datestartswith':
+            return text.str.startswith(needle).fillna(False).to_numpy(dtype=bool)
+        comparisons = {'eq': text.eq, 'ne': text.ne, 'lt': text.lt, 'le': text.le, 'gt': text.gt, 'ge': text.ge}
+        return comparisons[operator](needle).fillna(False).to_numpy(dtype=bool) & text.notna().to_numpy()
+
+    values = series.to_numpy()
+    # float32 (dataset_schema) é comparado em float32: o número digitado passa pelo mesmo
+    # arredondamento que os valores (e '= 48,9' encontra 48,9)
+    if values.dtype != np.float32:
+        values = values.astype(float)
+    number = _to_number(value)
+    if math.isnan(number):
+        return np.zeros(len(series), dtype=bool)
+    with np.errstate(invalid='ignore'):
+        return {
+            'eq': values == number, 'ne': (values != number) & ~np.isnan(values),
+            'lt': values < number, 'le': values <= number,
+            'gt': values > number, 'ge': values >= number,
+        }[operator]
+
+
+def apply_filter(df, filter_query, formatters=None):
+    """Linhas de `df` que atendem a todas as condições da consulta."""
+    conditions = parse_filter_query(filter_query)
+    if not conditions or df.empty:
+        return df
+    formatters = formatters or {}
+    mask = np.ones(len(df), dtype=bool)
+    for column, operator, value, case_sensitive in conditions:
+        if column not in df.columns:
+            continue
+        mask &= _condition_mask(df[column], operator, value, case_sensitive, formatters.get(column))
+    return df[mask]
+
+
+def apply_sort(df, sort_by):
+    """Ordena pelas colunas pedidas (estável: empates mantêm a ordem do ranking); vazios por último."""
+    sort_by = [s for s in (sort_by or []) if s.get('column_id') in df.columns]
+    if not sort_by or df.empty:
+        return df
+    return df.sort_values(
+        by=[s['column_id'] for s in sort_by],
+        ascending=[s.get('direction', 'asc') == 'asc' for s in sort_by],
+        kind='stable',
+        na_position='last',
+    )
+
+
+def page_count(num_rows, page_size):
+    return max(1, math.ceil(num_rows / page_size)) if page_size else 1
+
+
+def page_slice(df, page_current, page_size):
+    """Linhas da página pedida (limitada à última página existente)."""
+    if not page_size:
+        return df, 0
+    page_current = min(max(int(page_current or 0), 0), page_count(len(df), page_size) - 1)
+    start = page_current * page_size
+    return df.iloc[start:start + page_size], page_current
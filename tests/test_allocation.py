@@ -0,0 +1,143 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from allocation import (
+    TIPO_COMPRA_FRACIONARIO, TIPO_COMPRA_PADRAO, allocate_batch, allocate_equal_weight, allocate_optimal_lots,
+    lot_size_for, rebalance_batch,
+)
+
+
+def _iterrows_allocation(df_to_calc, total_invest, tipo_compra):
+    """Implementação original de calculate_allocation_for_df (linha a linha), a referência."""
+    df_to_calc['cotacao'] = pd.to_numeric(df_to_calc['cotacao'], errors='coerce')
+
+    df_to_calc['qtd_acoes'] = 0.0
+    df_to_calc['valor_alocado'] = 0.0
+    df_to_calc['peso_carteira'] = 0.0
+
+    df_selected_for_calc = df_to_calc[df_to_calc['_selected_for_allocation']].copy()
+
+    if total_invest > 0 and not df_selected_for_calc.empty:
+        num_empresas_selecionadas_para_alocacao = len(df_selected_for_calc)
+        if num_empresas_selecionadas_para_alocacao > 0:
+            investimento_por_empresa_ideal = total_invest / num_empresas_selecionadas_para_alocacao
+            lot_size = 1 if tipo_compra == 'Fracionário (1+ ações)' else 100
+
+            for index, row in df_selected_for_calc.iterrows():
+                cotacao = row['cotacao']
+                if pd.notna(cotacao) and cotacao > 0:
+                    ideal_shares = investimento_por_empresa_ideal / cotacao
+                    if tipo_compra == 'Fracionário (1+ ações)':
+                        shares_to_buy = round(ideal_shares)
+                    else:
+                        shares_to_buy = round(ideal_shares / lot_size) * lot_size
+                    if shares_to_buy < 0:
+                        shares_to_buy = 0
+                    df_to_calc.loc[index, 'qtd_acoes'] = shares_to_buy
+                    df_to_calc.loc[index, 'valor_alocado'] = shares_to_buy * cotacao
+
+            total_alocado_real = df_to_calc['valor_alocado'].sum()
+            if total_alocado_real > 0:
+                df_to_calc['peso_carteira'] = (df_to_calc['valor_alocado'] / total_alocado_real) * 100
+    return df_to_calc
+
+
+def _random_case(rng):
+    n = int(rng.integers(1, 40))
+    cotacao = np.round(rng.lognormal(3, 1.2, n), 2)
+    # Cotações vazias, zeradas e negativas não recebem alocação
+    cotacao[rng.random(n) < 0.1] = np.nan
+    cotacao[rng.random(n) < 0.05] = 0.0
+    cotacao[rng.random(n) < 0.05] = -1.0
+    selected = rng.random(n) < 0.7
+    total = float(rng.choice([0.0, -500.0, 1_000.0, 10_000.0, 123_456.78, 1_000_000.0]))
+    tipo = rng.choice([TIPO_COMPRA_FRACIONARIO, TIPO_COMPRA_PADRAO])
+    return cotacao, selected, total, tipo
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_matches_iterrows_implementation(seed):
+    rng = np.random.default_rng(seed)
+    for _ in range(100):
+        cotacao, selected, total, tipo = _random_case(rng)
+        expected = _iterrows_allocation(pd.DataFrame({'cotacao': cotacao, '_selected_for_allocation': selected}), total, tipo)
+        qtd, valor, peso = allocate_equal_weight(cotacao, selected, total, lot_size_for(tipo))
+        np.testing.assert_array_equal(qtd, expected['qtd_acoes'].to_numpy())
+        np.testing.assert_array_equal(valor, expected['valor_alocado'].to_numpy())
+        np.testing.assert_allclose(peso, expected['peso_carteira'].to_numpy(), rtol=1e-12)
+
+
+def test_batch_matches_single_scenarios():
+    rng = np.random.default_rng(7)
+    cotacao = np.round(rng.lognormal(3, 1.2, 30), 2)
+    masks = rng.random((50, 30)) < 0.5
+    totals = rng.choice([1_000.0, 10_000.0, 100_000.0], 50)
+    lots = rng.choice([1, 100], 50)
+    qtd, valor, peso = allocate_batch(cotacao, masks, totals, lots)
+    for row in range(50):
+        single = allocate_equal_weight(cotacao, masks[row], totals[row], lots[row])
+        for batch_values, single_values in zip((qtd, valor, peso), single):
+            np.testing.assert_array_equal(batch_values[row], single_values)
+
+
+def test_round_to_nearest_lot_can_overspend():
+    # Comportamento herdado da implementação original: o lote mais próximo pode passar do valor
+    _, valor, _ = allocate_equal_weight(np.array([60.0, 60.0]), np.array([True, True]), 10_000.0, 100)
+    assert valor.sum() == 12_000.0
+
+
+def _optimal_cases(seed, count=60):
+    rng = np.random.default_rng(seed)
+    for _ in range(count):
+        n = int(rng.integers(1, 40))
+        cotacao = np.round(rng.lognormal(3, 1.2, n), 2)
+        cotacao[rng.random(n) < 0.05] = np.nan
+        selected = rng.random(n) < 0.8
+        total = float(rng.choice([1_000.0, 10_000.0, 123_456.78, 1_000_000.0]))
+        sectors = rng.choice(np.array(['Bancos', 'Energia', 'Varejo', None], dtype=object), n)
+        yield cotacao, selected, total, sectors
+
+
+@pytest.mark.parametrize('lot_size', [1, 100])
+def test_optimal_lots_never_exceed_total(lot_size):
+    for cotacao, selected, total, sectors in _optimal_cases(lot_size):
+        for cap in (None, 0.3):
+            qtd, valor, peso = allocate_optimal_lots(cotacao, selected, total, lot_size, sectors, cap)
+            assert valor.sum() <= total + 1e-6
+            assert (qtd % lot_size == 0).all()
+            assert not valor[~selected].any()
+            np.testing.assert_allclose(valor, qtd * np.nan_to_num(cotacao))
+
+
+@pytest.mark.parametrize('lot_size', [1, 100])
+@pytest.mark.parametrize('cap', [0.2, 0.3, 0.5])
+def test_optimal_lots_respect_sector_cap(lot_size, cap):
+    for cotacao, selected, total, sectors in _optimal_cases(10 + lot_size):
+        _, valor, _ = allocate_optimal_lots(cotacao, selected, total, lot_size, sectors, cap)
+        # O teto é uma fração do valor a investir; setores ausentes formam um grupo
+        por_setor = pd.Series(valor).groupby(pd.Series(sectors).fillna('(sem setor)')).sum()
+        assert (por_setor <= cap * total + 1e-6).all()
+
+
+def test_optimal_lots_cap_a_crowded_sector():
+    cotacao = np.array([10.0, 10.0, 10.0, 10.0, 10.0])
+    sectors = np.array(['Bancos', 'Bancos', 'Bancos', 'Energia', 'Varejo'], dtype=object)
+    _, valor, _ = allocate_optimal_lots(cotacao, np.ones(5, dtype=bool), 10_000.0, 1, sectors, 0.4)
+    assert valor[:3].sum() <= 4_000.0
+    assert valor[3] <= 4_000.0 and valor[4] <= 4_000.0
+    assert valor.sum() == pytest.approx(10_000.0)
+
+
+@pytest.mark.parametrize('lot_size', [1, 100])
+def test_optimal_lots_leave_no_more_cash_than_rounding(lot_size):
+    for cotacao, selected, total, _ in _optimal_cases(20 + lot_size):
+        _, valor_otimo, _ = allocate_optimal_lots(cotacao, selected, total, lot_size)
+        sobra_otimo = total - valor_otimo.sum()
+        _, valor_arred, _ = allocate_equal_weight(cotacao, selected, total, lot_size)
+        sobra_arred = total - valor_arred.sum()
+        # Quando o lote mais próximo passa do valor, compara com o arredondamento para baixo
+        if sobra_arred < 0:
+            _, _, caixa = rebalance_batch(cotacao, selected, np.zeros(len(cotacao)), total, lot_size)
+            sobra_arred = caixa[0]
+        assert sobra_otimo <= sobra_arred + 1e-6
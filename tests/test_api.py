@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+
+import api
+from api import ApiError, evaluate_batch, parse_batch, parse_request
+from rank_index import RankVolumeIndex
+from snapshot import load_dataset
+
+
+@pytest.mark.parametrize('text, expected', [
+    ('10.5', 10.5), ('20.000.000', 20_000_000.0), ('1.234,56', 1234.56), ('10,5', 10.5),
+    ('1.000', 1000.0), ('20000000', 20_000_000.0), (' 7 ', 7.0),
+])
+def test_numbers_accept_br_and_decimal_point(text, expected):
+    assert parse_request({'min_volume': text})['min_volume'] == expected
+
+
+@pytest.mark.parametrize('text', ['abc', '1.2.3', '1,2,3', '1.23,4', '-5', 'nan'])
+def test_invalid_numbers_are_rejected(text):
+    with pytest.raises(ApiError):
+        parse_request({'total_investimento': text})
+
+
+def test_batch_size_limits():
+    with pytest.raises(ApiError):
+        parse_request({'num_empresas': api.MAX_NUM_EMPRESAS + 1})
+    rows = api.MAX_BATCH_ROWS // api.MAX_NUM_EMPRESAS + 1
+    with pytest.raises(ApiError) as error:
+        parse_batch({'requisicoes': [{'num_empresas': api.MAX_NUM_EMPRESAS}] * rows}, max_batch=10_000)
+    assert error.value.status == 413
+
+
+def test_chunked_evaluation_matches_single_chunk(monkeypatch):
+    df = load_dataset('fundamentus_data.csv')
+    rank_index = RankVolumeIndex(df)
+    rng = np.random.default_rng(0)
+    requests = parse_batch({'requisicoes': [
+        {'num_empresas': int(rng.integers(1, 60)), 'min_volume': float(rng.choice([0, 1e6, 2e7])),
+         'total_investimento': float(rng.choice([1e4, 1e5])), 'tipo_compra': str(rng.choice(['padrao', 'fracionario'])),
+         'tickers': df['ticker'].sample(30, random_state=i).tolist() if i % 3 == 0 else None}
+        for i in range(200)
+    ]}, max_batch=10_000)
+
+    expected = evaluate_batch(df, rank_index, requests)
+    monkeypatch.setattr(api, 'MAX_CHUNK_CELLS', 500)
+    assert len(list(api._chunks(api.ranked_positions(rank_index, requests)))) > 10
+    results, empresas = evaluate_batch(df, rank_index, requests)
+    assert empresas == expected[1]
+    # Só muda a ordem das somas (mais ou menos colunas zeradas em cada bloco)
+    for result, reference in zip(results, expected[0]):
+        assert result.keys() == reference.keys()
+        for key, value in result.items():
+            if key == 'alocacao':
+                assert [(row['ticker'], row['selecionada'], row['qtd_acoes'], row['valor_alocado']) for row in value] == \
+                    [(row['ticker'], row['selecionada'], row['qtd_acoes'], row['valor_alocado']) for row in reference[key]]
+                assert [row['peso_carteira'] for row in value] == pytest.approx([row['peso_carteira'] for row in reference[key]])
+            else:
+                assert value == pytest.approx(reference[key]) if isinstance(value, float) else value == reference[key]
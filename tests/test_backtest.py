@@ -0,0 +1,80 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from allocation import TIPO_COMPRA_FRACIONARIO, TIPO_COMPRA_PADRAO, lot_size_for, rebalance_batch
+from backtest import Panel, run_backtest, synthetic_panel
+
+
+def _reference_backtest(panel, num_empresas, min_volume, total_invest, tipo_compra, rebalance_every):
+    """Backtest data a data, com laços do Python: a seleção e a avaliação não usam matrizes."""
+    lot_size = lot_size_for(tipo_compra)
+    num_dates, num_tickers = panel.shape
+    last_price = {}
+    shares = np.zeros(num_tickers)
+    cash = float(total_invest)
+    equity_curve, cash_curve = [], []
+    for t in range(num_dates):
+        for j in range(num_tickers):
+            if not np.isnan(panel.cotacao[t, j]):
+                last_price[j] = panel.cotacao[t, j]
+        prices = np.array([last_price.get(j, 0.0) for j in range(num_tickers)])
+        if t % rebalance_every == 0:
+            eligible = [j for j in range(num_tickers)
+                        if panel.volume[t, j] >= min_volume and panel.cotacao[t, j] > 0 and not np.isnan(panel.rank[t, j])]
+            chosen = sorted(eligible, key=lambda j: (panel.rank[t, j], j))[:num_empresas]
+            mask = np.zeros(num_tickers, dtype=bool)
+            mask[chosen] = True
+            qtd, _, caixa = rebalance_batch(prices, mask, shares, cash, lot_size)
+            shares, cash = qtd[0], caixa[0]
+        equity_curve.append(cash + sum(shares[j] * prices[j] for j in range(num_tickers)))
+        cash_curve.append(cash)
+    return np.array(equity_curve), np.array(cash_curve)
+
+
+@pytest.mark.parametrize('tipo_compra', [TIPO_COMPRA_FRACIONARIO, TIPO_COMPRA_PADRAO])
+def test_equity_curve_matches_per_date_loop(tipo_compra):
+    panel = synthetic_panel(60, 40, seed=3)
+    result = run_backtest(panel, num_empresas=8, min_volume=1e6, total_invest=50_000.0,
+                          tipo_compra=tipo_compra, rebalance_every=7)
+    equity, cash = _reference_backtest(panel, 8, 1e6, 50_000.0, tipo_compra, 7)
+    np.testing.assert_allclose(result.equity.to_numpy(), equity, rtol=1e-9)
+    np.testing.assert_allclose(result.cash.to_numpy(), cash, rtol=1e-9, atol=1e-6)
+
+
+@pytest.mark.parametrize('total_invest', [3_000.0, 100_000.0])
+def test_rebalances_never_overspend(total_invest):
+    # Lotes de 100 com pouco dinheiro por empresa: o arredondamento para o lote mais
+    # próximo passaria do patrimônio em vários rebalanceamentos
+    panel = synthetic_panel(300, 500, seed=0)
+    result = run_backtest(panel, num_empresas=20, total_invest=total_invest,
+                          tipo_compra=TIPO_COMPRA_PADRAO, rebalance_every=21)
+    assert (result.cash >= 0).all()
+    assert (result.cash_weight <= 1 + 1e-12).all()
+
+    prices = pd.DataFrame(panel.cotacao, index=panel.dates).ffill().fillna(0).loc[result.rebalance_dates].to_numpy()
+    invested = (result.holdings.to_numpy() * prices).sum(axis=1)
+    equity = result.equity.loc[result.rebalance_dates].to_numpy()
+    assert (invested <= equity + 1e-6).all()
+
+
+def test_delisted_ticker_is_held_at_last_price_then_sold():
+    dates = pd.bdate_range('2020-01-01', periods=6)
+    nan = np.nan
+    # O ticker B (melhor rank) sai do histórico depois da data 1
+    cotacao = np.array([[10.0, 20.0], [11.0, 25.0], [12.0, nan], [13.0, nan], [14.0, nan], [15.0, nan]])
+    rank = np.array([[2.0, 1.0], [2.0, 1.0], [2.0, nan], [2.0, nan], [2.0, nan], [2.0, nan]])
+    volume = np.full((6, 2), 1e9)
+    volume[2:, 1] = nan
+    panel = Panel(dates, ['A', 'B'], cotacao, rank, volume)
+
+    result = run_backtest(panel, num_empresas=1, total_invest=1_000.0, rebalance_every=3)
+
+    # Data 0: compra 50 de B. Datas 1 e 2: B vale a última cotação (25)
+    assert result.holdings.iloc[0].tolist() == [0.0, 50.0]
+    assert result.equity.iloc[1] == pytest.approx(50 * 25.0)
+    assert result.equity.iloc[2] == pytest.approx(50 * 25.0)
+    # Data 3: B é vendido pela última cotação e o patrimônio vai para A
+    assert result.holdings.iloc[1].tolist() == [96.0, 0.0]
+    assert result.cash.iloc[3] == pytest.approx(1250.0 - 96 * 13.0)
+    assert result.equity.iloc[5] == pytest.approx(96 * 15.0 + 1250.0 - 96 * 13.0)
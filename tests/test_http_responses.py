@@ -0,0 +1,67 @@
+import flask
+import pytest
+
+from http_responses import ResponseOptimizer
+
+
+def _app(enabled=True):
+    app = flask.Flask(__name__)
+    responses = ResponseOptimizer(enabled=enabled, min_size=10)
+    responses.init_app(app)
+    versioned = responses.versioned(lambda: 'v1')
+    calls = []
+
+    @app.route('/dados', methods=['GET', 'POST'])
+    @versioned
+    def dados():
+        calls.append(flask.request.method)
+        return flask.jsonify(valores=list(range(50)))
+
+    return app, responses, calls
+
+
+def test_get_revalidates_with_weak_etag():
+    app, responses, calls = _app()
+    client = app.test_client()
+    first = client.get('/dados', headers={'Accept-Encoding': 'gzip'})
+    assert first.status_code == 200
+    assert first.headers['Content-Encoding'] == 'gzip'
+    etag = first.headers['ETag']
+    assert etag.startswith('W/"')
+
+    # O mesmo ETag vale para o corpo sem compressão
+    again = client.get('/dados', headers={'If-None-Match': etag})
+    assert again.status_code == 304
+    assert again.data == b''
+    assert calls == ['GET']
+    assert responses.stats()['not_modified'] == 1
+
+
+def test_post_with_matching_etag_is_412():
+    app, responses, calls = _app()
+    client = app.test_client()
+    first = client.post('/dados', json={'a': 1})
+    assert first.status_code == 200
+    etag = first.headers['ETag']
+
+    repeated = client.post('/dados', json={'a': 1}, headers={'If-None-Match': etag})
+    assert repeated.status_code == 412
+    assert repeated.headers['ETag'] == etag
+    # Outro corpo é outra requisição: calculada normalmente
+    other = client.post('/dados', json={'a': 2}, headers={'If-None-Match': etag})
+    assert other.status_code == 200
+    assert other.headers['ETag'] != etag
+    assert calls == ['POST', 'POST']
+    assert responses.stats()['precondition_failed'] == 1
+    assert responses.stats()['not_modified'] == 0
+
+
+@pytest.mark.parametrize('method', ['get', 'post'])
+def test_disabled_sends_no_etag(method):
+    app, _, calls = _app(enabled=False)
+    client = app.test_client()
+    response = getattr(client, method)('/dados', headers={'If-None-Match': '*', 'Accept-Encoding': 'gzip'})
+    assert response.status_code == 200
+    assert 'ETag' not in response.headers
+    assert 'Content-Encoding' not in response.headers
+    assert calls == [method.upper()]
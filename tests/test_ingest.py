@@ -0,0 +1,137 @@
+import asyncio
+import datetime
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pandas as pd
+import pytest
+
+from ingest import FundamentusClient, ingest
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'fundamentus')
+
+
+class _FixtureHandler(BaseHTTPRequestHandler):
+    """resultado.php e detalhes.php?papel=X servidos de FIXTURES, como o Fundamentus (ISO-8859-1)."""
+
+    # Tickers que respondem 503 na primeira requisição (erro transitório: nova tentativa)
+    fail_once = {'BBBB4'}
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        server = self.server
+        with server.lock:
+            server.paths.append(self.path)
+            server.in_flight += 1
+            server.peak = max(server.peak, server.in_flight)
+        try:
+            if server.delay:
+                time.sleep(server.delay)
+            if url.path == '/resultado.php':
+                self._send_file(os.path.join(FIXTURES, 'resultado.html'))
+            elif url.path == '/detalhes.php':
+                papel = parse_qs(url.query).get('papel', [''])[0]
+                with server.lock:
+                    first = papel in self.fail_once and papel not in server.failed
+                    server.failed.add(papel)
+                if first:
+                    self.send_error(503)
+                elif server.detalhes_file:
+                    self._send_file(server.detalhes_file)
+                else:
+                    self._send_file(os.path.join(FIXTURES, 'detalhes', f'{os.path.basename(papel)}.html'))
+            else:
+                self.send_error(404)
+        finally:
+            with server.lock:
+                server.in_flight -= 1
+
+    def _send_file(self, path):
+        if not os.path.exists(path):
+            self.send_error(404)
+            return
+        with open(path, 'rb') as f:
+            body = f.read()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=ISO-8859-1')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def fixture_server():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), _FixtureHandler)
+    server.daemon_threads = True
+    server.lock = threading.Lock()
+    server.paths, server.failed = [], set()
+    server.in_flight = server.peak = 0
+    server.delay = 0.0
+    server.detalhes_file = None
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def _base_url(server):
+    return f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def test_ingest_end_to_end(fixture_server, tmp_path):
+    output = tmp_path / 'fundamentus_data.csv'
+    df, client = ingest(output=str(output), base_url=_base_url(fixture_server), concurrency=4, rate=0,
+                        history_root=str(tmp_path / 'history'), data_execucao=datetime.date(2024, 5, 2))
+
+    # DDDD3 (ROIC negativo) e EEEE3 (EV/EBIT negativo) ficam fora do ranking
+    assert df['ticker'].tolist() == ['CCCC3', 'BBBB4', 'AAAA3', 'FFFF3']
+    assert df['rank_roic'].tolist() == [1, 3, 2, 4]
+    assert df['rank_ey'].tolist() == [2, 1, 3, 4]
+    assert df['magic_formula_rank'].tolist() == [3, 4, 5, 8]
+    assert df['earnings_yield_clean'].tolist() == pytest.approx([100 / 4.5, 25.0, 20.0, 5.0])
+
+    aaaa = df.set_index('ticker').loc['AAAA3']
+    assert aaaa['cotacao'] == 10.0
+    assert aaaa['vol_med_2m'] == 1_000_000.0
+    assert aaaa['roic_clean'] == 25.0
+    assert aaaa['empresa'] == 'AAAA ENERGIA S.A.'
+    assert aaaa['setor'] == 'Energia Elétrica'
+    assert aaaa['lpa'] == 1.18
+    assert aaaa['30_dias'] == -1.2
+    assert aaaa['12_meses'] == 15.3
+
+    # BBBB4 respondeu 503 uma vez e veio na nova tentativa; FFFF3 não tem página (404)
+    assert df.set_index('ticker').loc['BBBB4', 'subsetor'] == 'Bancos'
+    assert pd.isna(df.set_index('ticker').loc['FFFF3', 'empresa'])
+    assert client.failures == 1
+    assert sum(path.startswith('/detalhes.php') for path in fixture_server.paths) == 5
+    assert client.requests == len(fixture_server.paths)
+
+    # CSV, snapshot compilado e histórico gravados
+    csv = pd.read_csv(output)
+    assert csv['ticker'].tolist() == df['ticker'].tolist()
+    assert (csv['data_execucao'] == '2024-05-02').all()
+    assert os.path.isdir(tmp_path / 'fundamentus_data.snapshot')
+    assert os.listdir(tmp_path / 'history')
+
+
+def test_concurrency_is_not_capped_by_default_executor(fixture_server):
+    # O executor padrão do asyncio teria no máximo min(32, CPUs + 4) threads
+    concurrency = (os.cpu_count() or 1) + 8
+    fixture_server.delay = 0.2
+    fixture_server.detalhes_file = os.path.join(FIXTURES, 'detalhes', 'AAAA3.html')
+    client = FundamentusClient(_base_url(fixture_server), concurrency=concurrency, rate=0)
+    try:
+        detalhes = asyncio.run(client.fetch_detalhes([f'T{i:03d}3' for i in range(concurrency * 2)]))
+    finally:
+        client.close()
+    assert len(detalhes) == concurrency * 2
+    assert client.requests == concurrency * 2
+    assert fixture_server.peak == concurrency
@@ -0,0 +1,36 @@
+from pipeline import StagedPipeline
+from session_store import DiskBackend, MemoryBackend
+
+
+def _fill(pipeline, version, count):
+    for i in range(count):
+        pipeline.run('calculated', version, (i,), lambda: {'valor': i})
+
+
+def test_key_index_stays_bounded_by_backend_evictions(tmp_path):
+    for backend in (MemoryBackend(max_entries=16), DiskBackend(str(tmp_path), max_entries=16)):
+        pipeline = StagedPipeline(backend)
+        _fill(pipeline, 'v1', 1_000)
+        assert len(backend) == 16
+        assert pipeline.stats()['indexed_keys'] <= 2 * 16
+        assert sum(len(keys) for keys in pipeline._keys_by_version.values()) <= 2 * 16
+
+
+def test_invalidate_still_drops_live_entries_of_a_version():
+    backend = MemoryBackend(max_entries=64)
+    pipeline = StagedPipeline(backend)
+    _fill(pipeline, 'v1', 100)
+    _fill(pipeline, 'v2', 10)
+    pipeline.invalidate(['v1'])
+    assert len(backend) == 10
+    value, _ = pipeline.run('calculated', 'v2', (3,), lambda: None)
+    assert value == {'valor': 3}
+
+
+def test_membership_does_not_refresh_lru():
+    backend = MemoryBackend(max_entries=2)
+    backend.set('a', 1)
+    backend.set('b', 2)
+    assert 'a' in backend
+    backend.set('c', 3)
+    assert 'a' not in backend and 'b' in backend
@@ -0,0 +1,106 @@
+import base64
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from allocation import TIPO_COMPRA_FRACIONARIO, TIPO_COMPRA_PADRAO
+from rebalance import (
+    OPERACAO_COMPRA, OPERACAO_MANTER, OPERACAO_VENDA, decode_upload, orders_frame, parse_holdings, rebalance_universe,
+)
+
+
+@pytest.fixture
+def universe():
+    return pd.DataFrame({'ticker': ['AAAA3', 'BBBB4', 'CCCC3'], 'cotacao': [10.0, 20.0, 50.0]})
+
+
+def test_parse_holdings():
+    text = "\n".join([
+        "ticker;qtd",          # cabeçalho: ignorado
+        "PETR4;1.000",         # milhar BR
+        "vale3, 200",
+        "# comentário",
+        "",
+        "ITUB4\t50",
+        "petr4f 300",          # fracionário e repetido: somado a PETR4
+        "BBAS3 10.5",          # quantidade fracionária
+        "WEGE3;1,2,3",         # número inválido
+        "ABEV3;-5",
+        "SEM QUANTIDADE",
+        "MGLU3;0",             # zerada: fora das posições
+    ])
+    holdings, invalid = parse_holdings(text)
+    assert holdings == {'PETR4': 1300, 'VALE3': 200, 'ITUB4': 50}
+    assert invalid == ['BBAS3 10.5', 'WEGE3;1,2,3', 'ABEV3;-5', 'SEM QUANTIDADE']
+    assert parse_holdings(None) == ({}, [])
+
+
+def test_decode_upload():
+    def upload(data):
+        return 'data:text/csv;base64,' + base64.b64encode(data).decode('ascii')
+
+    assert decode_upload(upload('\ufeffPETR4;100\n'.encode('utf-8'))) == 'PETR4;100\n'
+    assert decode_upload(upload('AÇÃO;100'.encode('latin-1'))) == 'AÇÃO;100'
+    assert parse_holdings(decode_upload(upload(b'PETR4;1.000\r\nVALE3;200\r\n')))[0] == {'PETR4': 1000, 'VALE3': 200}
+
+
+def test_standard_lot_orders(universe):
+    target = np.array([True, True, False])
+    portfolios = [{'AAAA3': 150, 'CCCC3': 30}, {}]
+    extended, qtd_atual, qtd_alvo, ordem, caixa = rebalance_universe(
+        universe, target, portfolios, TIPO_COMPRA_PADRAO, cash=[0.0, 10_000.0])
+    assert extended is universe
+    # Carteira 0: patrimônio 3.000 -> 1.500 por empresa. CCCC3 sai da seleção (venda de 30
+    # ações, fora do lote) e AAAA3 já está no alvo; 75 ações de BBBB4 arredondariam para um
+    # lote de 100 (R$ 2.000) e passariam do patrimônio: arredonda para baixo
+    np.testing.assert_array_equal(ordem[0], [0.0, 0.0, -30.0])
+    np.testing.assert_array_equal(qtd_alvo[0], [150.0, 0.0, 0.0])
+    assert caixa[0] == pytest.approx(1_500.0)
+    # Carteira 1: só o aporte, 5.000 por empresa em lotes de 100
+    np.testing.assert_array_equal(ordem[1], [500.0, 200.0, 0.0])
+    assert caixa[1] == pytest.approx(1_000.0)
+
+
+def test_fractional_lot_never_overspends(universe):
+    # 1.500 por empresa: BBBB4 arredondaria 37,5 para 38 ações e passaria do patrimônio
+    _, _, qtd_alvo, ordem, caixa = rebalance_universe(
+        universe, np.array([True, True, False]), [{'AAAA3': 150}], TIPO_COMPRA_FRACIONARIO)
+    np.testing.assert_array_equal(ordem[0], [-75.0, 37.0, 0.0])
+    assert caixa[0] == pytest.approx(10.0)
+    assert (caixa >= 0).all()
+
+
+def test_unknown_tickers_are_sold(universe):
+    target = np.array([True, False, False])
+    portfolios = [{'AAAA3': 100, 'ZZZZ3': 10}]
+    extended, qtd_atual, _, ordem, caixa = rebalance_universe(universe, target, portfolios, TIPO_COMPRA_FRACIONARIO)
+    assert extended['ticker'].tolist() == ['AAAA3', 'BBBB4', 'CCCC3', 'ZZZZ3']
+    assert np.isnan(extended['cotacao'].iloc[-1])
+    # Sem cotação, a venda não entra no caixa
+    np.testing.assert_array_equal(ordem[0], [0.0, 0.0, 0.0, -10.0])
+    assert caixa[0] == 0.0
+
+    # Com o snapshot de referência, a cotação vem de lá e a venda financia a posição alvo
+    reference = pd.DataFrame({'ticker': ['ZZZZ3'], 'cotacao': [5.0]})
+    extended, _, _, ordem, caixa = rebalance_universe(
+        universe, target, portfolios, TIPO_COMPRA_FRACIONARIO, df_reference=reference)
+    assert extended['cotacao'].iloc[-1] == 5.0
+    np.testing.assert_array_equal(ordem[0], [5.0, 0.0, 0.0, -10.0])
+    assert caixa[0] == pytest.approx(0.0)
+
+
+def test_orders_frame_sells_before_buys(universe):
+    target = np.array([False, True, True])
+    portfolios = [{'AAAA3': 100, 'CCCC3': 20}, {'BBBB4': 10}]
+    extended, qtd_atual, qtd_alvo, ordem, _ = rebalance_universe(
+        universe, target, portfolios, TIPO_COMPRA_FRACIONARIO, cash=[0.0, 800.0])
+    orders = orders_frame(extended, qtd_atual, qtd_alvo, ordem, labels=['a', 'b'])
+    assert orders[['carteira', 'ticker', 'operacao']].values.tolist() == [
+        ['a', 'AAAA3', OPERACAO_VENDA],
+        ['a', 'BBBB4', OPERACAO_COMPRA],
+        ['a', 'CCCC3', OPERACAO_MANTER],
+        ['b', 'BBBB4', OPERACAO_COMPRA],
+        ['b', 'CCCC3', OPERACAO_COMPRA],
+    ]
+    np.testing.assert_allclose(orders['valor_ordem'], orders['ordem_qtd'] * orders['cotacao'])
@@ -0,0 +1,54 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from allocation import TIPO_COMPRA_FRACIONARIO, TIPO_COMPRA_PADRAO
+from snapshot import load_dataset
+from sweep import build_grid, run_sweep
+
+
+@pytest.fixture(scope='module')
+def snapshot():
+    return load_dataset('fundamentus_data.csv')
+
+
+@pytest.fixture(scope='module')
+def grid():
+    return build_grid([1, 5, 20, 40], [0.0, 1_000_000.0, 20_000_000.0],
+                      [TIPO_COMPRA_FRACIONARIO, TIPO_COMPRA_PADRAO], [1_000.0, 10_000.0, 100_000.0])
+
+
+def test_workers_give_identical_results(snapshot, grid):
+    snapshots = {'latest': snapshot, 'metade': snapshot.iloc[::2]}
+    single = run_sweep(snapshots, grid, workers=1, chunk_size=10)
+    parallel = run_sweep(snapshots, grid, workers=2, chunk_size=10)
+    pd.testing.assert_frame_equal(single, parallel)
+    assert len(single) == 2 * len(grid)
+
+
+def test_never_allocates_more_than_the_investment(snapshot, grid):
+    results = run_sweep({'latest': snapshot}, grid, workers=1)
+    assert (results['nao_alocado'] >= -1e-6).all()
+    assert (results['pct_alocado'] <= 100 + 1e-9).all()
+
+
+def test_row_matches_app_allocation(snapshot, grid):
+    import app
+
+    results = run_sweep({'latest': snapshot}, grid, workers=1)
+    compared = 0
+    for _, row in results.iterrows():
+        df = app.filter_magic_formula_df(snapshot, int(row['num_empresas']), row['min_volume'])
+        df['_selected_for_allocation'] = True
+        df = app.calculate_allocation_for_df(df, row['total_investimento'], row['tipo_compra'])
+        total_alocado = df['valor_alocado'].sum()
+        assert row['num_selecionadas'] == len(df)
+        if total_alocado > row['total_investimento']:
+            # O app arredonda para o lote mais próximo e passa do valor; a varredura não
+            assert row['total_alocado'] <= row['total_investimento']
+            continue
+        assert row['total_alocado'] == pytest.approx(total_alocado)
+        assert row['peso_max'] == pytest.approx(df['peso_carteira'].max())
+        assert row['peso_min'] == pytest.approx(df['peso_carteira'].min())
+        compared += 1
+    assert compared > 0
@@ -0,0 +1,99 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from table_query import apply_filter, apply_sort, page_count, page_slice, parse_filter_query
+
+
+@pytest.fixture
+def df():
+    return pd.DataFrame({
+        'ticker': ['AAAA3', 'BBBB4', 'CCCC3', 'DDDD3', 'EEEE3'],
+        'setor': ['Energia Elétrica', 'Bancos', 'energia', None, 'Varejo'],
+        'cotacao': np.array([48.9, 0.5, 1000.0, 12.25, np.nan], dtype=np.float32),
+        'vol_med_2m': [2_500_000.0, 999_999.0, 1_000_000.0, 20_000_000.0, 0.0],
+        'magic_formula_rank': [1, 2, 3, 4, 5],
+    })
+
+
+def _tickers(frame):
+    return frame['ticker'].tolist()
+
+
+def test_parse_filter_query():
+    query = '{cotacao} >= 10 && {setor} icontains "energia" && {ticker} seq AAAA3 && invalido && {x} foo 1'
+    assert parse_filter_query(query) == [
+        ('cotacao', 'ge', '10', True),
+        ('setor', 'contains', 'energia', False),
+        ('ticker', 'eq', 'AAAA3', True),
+    ]
+    assert parse_filter_query(None) == []
+
+
+@pytest.mark.parametrize('query, expected', [
+    ('{vol_med_2m} >= 1000000', ['AAAA3', 'CCCC3', 'DDDD3']),
+    ('{vol_med_2m} > 1000000', ['AAAA3', 'DDDD3']),
+    ('{vol_med_2m} < 1000000', ['BBBB4', 'EEEE3']),
+    ('{vol_med_2m} <= 999999', ['BBBB4', 'EEEE3']),
+    ('{vol_med_2m} = 0', ['EEEE3']),
+    ('{cotacao} != 0,5', ['AAAA3', 'CCCC3', 'DDDD3']),
+    ('{cotacao} > 10 && {vol_med_2m} < 10.000.000', ['AAAA3', 'CCCC3']),
+])
+def test_numeric_operators(df, query, expected):
+    assert _tickers(apply_filter(df, query)) == expected
+
+
+@pytest.mark.parametrize('value, expected', [
+    ('1.000', ['CCCC3']),            # milhar, como a tabela exibe
+    ('1000', ['CCCC3']),
+    ('1.000,00', ['CCCC3']),
+    ('12.25', ['AAAA3', 'CCCC3', 'DDDD3']),  # ponto decimal, como o DataTable envia números
+    ('12,25', ['AAAA3', 'CCCC3', 'DDDD3']),
+    ('abc', []),
+])
+def test_number_formats(df, value, expected):
+    assert _tickers(apply_filter(df, f'{{cotacao}} >= {value}')) == expected
+
+
+def test_br_thousands_on_volume(df):
+    assert _tickers(apply_filter(df, '{vol_med_2m} >= 1.000.000')) == ['AAAA3', 'CCCC3', 'DDDD3']
+    assert _tickers(apply_filter(df, '{vol_med_2m} >= 2.500.000')) == ['AAAA3', 'DDDD3']
+
+
+def test_float32_equality(df):
+    # 48,9 não é exato em float32: o número digitado passa pelo mesmo arredondamento
+    assert _tickers(apply_filter(df, '{cotacao} = 48,9')) == ['AAAA3']
+    assert _tickers(apply_filter(df, '{cotacao} = 48.9')) == ['AAAA3']
+
+
+def test_text_operators(df):
+    assert _tickers(apply_filter(df, '{setor} contains energia')) == ['CCCC3']
+    assert _tickers(apply_filter(df, '{setor} icontains energia')) == ['AAAA3', 'CCCC3']
+    assert _tickers(apply_filter(df, '{setor} = Bancos')) == ['BBBB4']
+    assert _tickers(apply_filter(df, '{ticker} datestartswith DD')) == ['DDDD3']
+    assert _tickers(apply_filter(df, '{setor} contains energia', {'setor': lambda s: s.str.upper()})) == []
+
+
+def test_unknown_columns_are_ignored(df):
+    assert _tickers(apply_filter(df, '{inexistente} > 1')) == _tickers(df)
+
+
+def test_sort_is_stable_with_missing_last(df):
+    assert _tickers(apply_sort(df, [{'column_id': 'cotacao', 'direction': 'desc'}])) == \
+        ['CCCC3', 'AAAA3', 'DDDD3', 'BBBB4', 'EEEE3']
+    ties = df.assign(grupo=[1, 0, 1, 0, 1])
+    assert _tickers(apply_sort(ties, [{'column_id': 'grupo', 'direction': 'asc'}])) == \
+        ['BBBB4', 'DDDD3', 'AAAA3', 'CCCC3', 'EEEE3']
+    assert apply_sort(df, [{'column_id': 'inexistente'}]) is df
+
+
+def test_page_slice(df):
+    assert page_count(5, 2) == 3
+    assert page_count(0, 2) == 1
+    page, current = page_slice(df, 1, 2)
+    assert (_tickers(page), current) == (['CCCC3', 'DDDD3'], 1)
+    page, current = page_slice(df, 10, 2)
+    assert (_tickers(page), current) == (['EEEE3'], 2)
+    page, current = page_slice(df, -1, 2)
+    assert current == 0
+    assert len(page_slice(df, 3, 0)[0]) == 5